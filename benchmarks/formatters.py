@@ -0,0 +1,264 @@
+"""
+Benchmarks for the plan formatters.
+
+Builds synthetic weeks out of the tests/test_data fixtures and measures
+throughput and peak allocated memory per render of
+convert_json_to_human_readable (validation included), convert_fitness_exercises
+and convert_swimming_exercises. Results are compared against a stored
+baseline and the run fails if any of them regressed by more than the
+tolerance.
+
+    python -m benchmarks.formatters                    # compare to baseline
+    python -m benchmarks.formatters --update-baseline  # record a new one
+
+Throughput is compared relative to a calibration workload timed next to
+each benchmark, but the baseline is still best recorded on the machine that
+runs the comparison.
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+
+from utils import TrainingDay, convert_json_to_human_readable, parse_week
+from utils.utils import convert_fitness_exercises, convert_swimming_exercises
+
+TEST_DATA_DIR: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "test_data"
+)
+BASELINE_PATH: str = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+WeekKind = Literal["fitness", "swimming", "mixed"]
+Results = Dict[str, Dict[str, float]]
+
+
+class Scenario(BaseModel):
+    days: int
+    exercises: int
+    kind: WeekKind
+
+    @property
+    def name(self) -> str:
+        return f"{self.days}d-{self.exercises}ex-{self.kind}"
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario(days=1, exercises=5, kind="fitness"),
+    Scenario(days=1, exercises=5, kind="swimming"),
+    Scenario(days=3, exercises=20, kind="mixed"),
+    Scenario(days=7, exercises=50, kind="mixed"),
+    Scenario(days=7, exercises=100, kind="swimming"),
+    Scenario(days=14, exercises=200, kind="mixed"),
+]
+
+
+def _load_day_templates() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    templates: List[Dict[str, Any]] = []
+    for file_name in ("double_fitness_training.json", "double_swimming_training.json"):
+        with open(os.path.join(TEST_DATA_DIR, file_name), encoding="utf-8") as f:
+            templates.append(json.load(f)["Resources"][0])
+    return templates[0], templates[1]
+
+
+FITNESS_DAY, SWIMMING_DAY = _load_day_templates()
+
+
+def build_week(days: int, exercises: int, kind: WeekKind) -> List[Dict[str, Any]]:
+    """Spreads `exercises` as evenly as possible over `days` training days."""
+    week: List[Dict[str, Any]] = []
+    per_day, extra = divmod(exercises, days)
+    for index in range(days):
+        if kind == "mixed":
+            template = FITNESS_DAY if index % 2 == 0 else SWIMMING_DAY
+        else:
+            template = FITNESS_DAY if kind == "fitness" else SWIMMING_DAY
+        day: Dict[str, Any] = copy.deepcopy(template)
+        count: int = per_day + (1 if index < extra else 0)
+        source: List[Dict[str, Any]] = template["Exercises"]
+        day["Exercises"] = [
+            copy.deepcopy(source[i % len(source)]) for i in range(count)
+        ]
+        day.update(Year=2024, Week=10, Day=index + 1, TotalNumberExercises=count)
+        if day["trainingType"] == "swimming":
+            day["TotalVolume"] = sum(e["Volume"] or 0 for e in day["Exercises"])
+        week.append(day)
+    return week
+
+
+def _exercises(days: List[TrainingDay], training_type: str) -> List[Any]:
+    return [
+        exercise
+        for day in days
+        if day.trainingType == training_type
+        for exercise in day.Exercises
+    ]
+
+
+def _calibration_workload() -> str:
+    # Pure-Python string formatting, similar in kind to what the renderers do
+    return "\n".join(
+        f"{i}. упражнение - {i % 7} серии по {i % 13} мин" for i in range(200)
+    )
+
+
+def _best_time_per_call(
+    render: Callable[[], Any], min_time: float, batch_time: float = 0.005
+) -> float:
+    started: float = time.perf_counter()
+    render()  # warm up
+    batch: int = max(1, int(batch_time / (time.perf_counter() - started)))
+    best_per_call: float = float("inf")
+    deadline: float = time.perf_counter() + min_time
+    gc.collect()
+    while time.perf_counter() < deadline:
+        batch_started: float = time.perf_counter()
+        for _ in range(batch):
+            render()
+        per_call: float = (time.perf_counter() - batch_started) / batch
+        best_per_call = min(best_per_call, per_call)
+    return best_per_call
+
+
+def measure(render: Callable[[], Any], min_time: float) -> Dict[str, float]:
+    """
+    Throughput of the fastest batch of renders, the same relative to a
+    calibration workload timed right before and after, and the smallest
+    peak of traced allocations. Taking the best run and calibrating next to
+    it filters out most noise from other processes and CPU throttling.
+    """
+    calibration: float = _best_time_per_call(_calibration_workload, min_time / 4)
+    per_call: float = _best_time_per_call(render, min_time)
+    calibration = min(
+        calibration, _best_time_per_call(_calibration_workload, min_time / 4)
+    )
+
+    peaks: List[int] = []
+    for _ in range(3):
+        gc.collect()
+        tracemalloc.start()
+        render()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "ops_per_sec": 1 / per_call,
+        "relative_speed": calibration / per_call,
+        "alloc_peak_kib": min(peaks) / 1024,
+    }
+
+
+def run_suite(
+    min_time: float = 0.5, scenarios: Optional[List[Scenario]] = None
+) -> Results:
+    results: Results = {}
+    for scenario in scenarios or SCENARIOS:
+        week = build_week(scenario.days, scenario.exercises, scenario.kind)
+        results[f"week/{scenario.name}"] = measure(
+            lambda: convert_json_to_human_readable(week), min_time
+        )
+        days = parse_week(week)
+        fitness = _exercises(days, "fitness")
+        if fitness:
+            results[f"fitness_exercises/{scenario.name}"] = measure(
+                lambda: convert_fitness_exercises(fitness), min_time
+            )
+        swimming = _exercises(days, "swimming")
+        if swimming:
+            results[f"swimming_exercises/{scenario.name}"] = measure(
+                lambda: convert_swimming_exercises(swimming), min_time
+            )
+    return results
+
+
+def compare(
+    results: Results,
+    baseline: Results,
+    tolerance: float,
+    alloc_tolerance: float,
+) -> List[str]:
+    """Returns a description of every measurement that regressed."""
+    regressions: List[str] = []
+    for name, measured in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        speed: float = measured["relative_speed"] / expected["relative_speed"]
+        if speed < 1 - tolerance:
+            regressions.append(
+                f"{name}: {measured['ops_per_sec']:.0f} ops/s is {speed:.2f}x "
+                f"of baseline {expected['ops_per_sec']:.0f} ops/s after calibration"
+            )
+        if measured["alloc_peak_kib"] > expected["alloc_peak_kib"] * (
+            1 + alloc_tolerance
+        ):
+            regressions.append(
+                f"{name}: {measured['alloc_peak_kib']:.1f} KiB peak, "
+                f"baseline {expected['alloc_peak_kib']:.1f} KiB"
+            )
+    return regressions
+
+
+def format_table(results: Results, baseline: Results) -> str:
+    lines: List[str] = [
+        f"{'benchmark':<42} {'ops/s':>10} {'vs base':>8} {'KiB peak':>9} {'vs base':>8}"
+    ]
+    for name, measured in results.items():
+        expected = baseline.get(name)
+        speed = alloc = "-"
+        if expected:
+            speed = f"{measured['relative_speed'] / expected['relative_speed']:.2f}x"
+            alloc = f"{measured['alloc_peak_kib'] / expected['alloc_peak_kib']:.2f}x"
+        lines.append(
+            f"{name:<42} {measured['ops_per_sec']:>10.0f} {speed:>8} "
+            f"{measured['alloc_peak_kib']:>9.1f} {alloc:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="allowed throughput drop"
+    )
+    parser.add_argument(
+        "--alloc-tolerance", type=float, default=0.1, help="allowed allocation growth"
+    )
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    results: Results = run_suite(args.min_time)
+    baseline: Results = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(format_table(results, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions: List[str] = compare(
+        results, baseline, args.tolerance, args.alloc_tolerance
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Cold start benchmark for the bot process.
+
+Reports where `import main` spends its time (from `python -X importtime`,
+grouped by top-level package) and the time from spawning `python main.py`
+to its first getUpdates call against a local FakeTelegram, which is what a
+restarted container in a rolling deploy waits for.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --top 15
+"""
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loadtest import FakeTelegram
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+# Placeholders for the settings main.py refuses to start without; the
+# backend is never called before the first poll
+REQUIRED_ENV: Dict[str, str] = {
+    "LIUBA_TELEGRAM_TOKEN": "123:abc",
+    "ADMIN_NAME": "admin",
+    "ADMIN_CHAT_ID": "1",
+    "BACKEND_API": "http://127.0.0.1:9",
+    "PERSONAL_TRAINING_ENDPOINT": "personal_training",
+    "CURRENT_PERSONAL_TRAINING_ENDPOINT": "current_personal_training",
+    "PERSONAL_TRAINING_REPORT": "personal_training_report",
+    "ALLOWED_PERSONAL_TRAINING": "allowed_personal_training",
+    "ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA": "allowed_update_metadata",
+    "UPDATE_PERSONAL_TRAINING_TG_ID": "update_tg_id",
+    "OPENAI_API_KEY": "sk-benchmark",
+}
+
+
+def bot_env(profile: str, **extra: str) -> Dict[str, str]:
+    env: Dict[str, str] = {**REQUIRED_ENV, **os.environ}
+    env.update(RUNTIME_PROFILE=profile, UPDATES_MODE="polling", **extra)
+    return env
+
+
+def import_breakdown(profile: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Total `import main` time and self time per top-level package, in ms."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        env=bot_env(profile),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    per_package: Dict[str, float] = {}
+    total: float = 0.0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        package: str = module.split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + int(self_us) / 1000
+        if module == "main" and not indent:
+            total = int(cumulative_us) / 1000
+    ranked = sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+    return total, ranked
+
+
+def time_to_first_poll(profile: str, timeout: float = 30.0) -> Optional[float]:
+    """Seconds from spawning main.py to its first getUpdates, None on timeout."""
+    telegram = FakeTelegram().start()
+    try:
+        started: float = time.monotonic()
+        process = subprocess.Popen(
+            [sys.executable, "main.py"],
+            cwd=ROOT,
+            env=bot_env(profile, TELEGRAM_API_URL=telegram.base_url),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            first_poll: Optional[float] = telegram.wait_for_call("getUpdates", timeout)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return None if first_poll is None else first_poll - started
+    finally:
+        telegram.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument(
+        "--profile", choices=["strict", "production"], default="production"
+    )
+    args = parser.parse_args(argv)
+
+    totals: List[float] = []
+    ranked: List[Tuple[str, float]] = []
+    for _ in range(args.runs):
+        total, ranked = import_breakdown(args.profile)
+        totals.append(total)
+    print(f"import main: {statistics.median(totals):.0f} ms (median of {args.runs})")
+    print(f"{'package':<28} {'self ms':>8}")
+    for package, self_ms in ranked[: args.top]:
+        print(f"{package:<28} {self_ms:>8.1f}")
+
+    polls: List[float] = []
+    for _ in range(args.runs):
+        elapsed: Optional[float] = time_to_first_poll(args.profile)
+        if elapsed is None:
+            print("main.py never polled, see logs/")
+            return 1
+        polls.append(elapsed)
+    print(
+        f"time to first poll: median {statistics.median(polls) * 1000:.0f} ms, "
+        f"min {min(polls) * 1000:.0f} ms, max {max(polls) * 1000:.0f} ms"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Formatter throughput with and without runtime type checking.
+
+Runs the formatter suite once per RUNTIME_PROFILE, each in its own
+interpreter since the profile is fixed at import, and prints how much
+faster every benchmark is in the production profile.
+
+    python -m benchmarks.typechecking
+    python -m benchmarks.typechecking --min-time 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+from benchmarks.formatters import Results
+
+PROFILES: List[str] = ["strict", "production"]
+
+
+def run_profile(profile: str, min_time: float) -> Results:
+    with tempfile.TemporaryDirectory() as tmp:
+        output: str = os.path.join(tmp, "results.json")
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.formatters",
+                "--min-time",
+                str(min_time),
+                "--baseline",
+                os.path.join(tmp, "no-baseline.json"),
+                "--output",
+                output,
+            ],
+            env={**os.environ, "RUNTIME_PROFILE": profile},
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def format_table(results: Dict[str, Results]) -> str:
+    strict, production = results["strict"], results["production"]
+    lines: List[str] = [
+        f"{'benchmark':<42} {'strict ops/s':>13} {'prod ops/s':>11} {'speedup':>8}"
+    ]
+    for name, measured in strict.items():
+        fast = production[name]
+        lines.append(
+            f"{name:<42} {measured['ops_per_sec']:>13.0f} "
+            f"{fast['ops_per_sec']:>11.0f} "
+            f"{fast['relative_speed'] / measured['relative_speed']:>7.1f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--min-time", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Results] = {
+        profile: run_profile(profile, args.min_time) for profile in PROFILES
+    }
+    print(format_table(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
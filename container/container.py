@@ -1,20 +1,134 @@
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
 
 from dependency_injector import containers, providers
 from telegram.ext import Updater
 from logger import init_logger
-from utils import Config, load_messages, Commands, Prompts
+from utils import (
+    Config,
+    Commands,
+    Prompts,
+    BackendClient,
+    AccessCache,
+    SessionStore,
+    PlanCache,
+    MetadataCache,
+    ReportPipeline,
+    OutboundQueue,
+    MessageCatalog,
+    Metrics,
+    BatchPlanClient,
+    Broadcaster,
+    Tracer,
+    open_persistence,
+)
 import os
 
 
 class Container(containers.DeclarativeContainer):
-    config = providers.Factory(Config)
-    commands = providers.Factory(Commands)
-    prompts = providers.Factory(Prompts)
-    updater = providers.Singleton(Updater, token=config().TOKEN, use_context=True)
-    logger = providers.Singleton(init_logger, config=config())
-    message_path = os.path.join(config().MESSAGES_DIR, config().MESSAGES_FILE)
+    config = providers.Singleton(Config)
+    commands = providers.Singleton(Commands)
+    prompts = providers.Singleton(Prompts)
+    logger = providers.Singleton(init_logger, config=config)
+    metrics = providers.Singleton(Metrics)
+    tracer = providers.Singleton(
+        Tracer,
+        logger=logger,
+        path=config.provided.TRACE_PATH,
+        sample_rate=config.provided.TRACE_SAMPLE_RATE,
+        slow_threshold=config.provided.TRACE_SLOW_THRESHOLD,
+        max_bytes=config.provided.LOG_MAX_BYTES,
+        backup_count=config.provided.LOG_BACKUP_COUNT,
+    )
+    persistence = providers.Singleton(
+        open_persistence,
+        path=config.provided.PERSISTENCE_DB_PATH,
+        logger=logger,
+        flush_interval=config.provided.PERSISTENCE_FLUSH_INTERVAL,
+    )
+    updater = providers.Singleton(
+        Updater,
+        token=config.provided.TOKEN,
+        base_url=config.provided.TELEGRAM_API_URL,
+        workers=config.provided.DISPATCHER_WORKERS,
+        persistence=persistence,
+        use_context=True,
+    )
+    backend_client = providers.Singleton(
+        BackendClient, cfg=config, logger=logger, metrics=metrics
+    )
+    plan_client = providers.Singleton(
+        BatchPlanClient,
+        cfg=config,
+        logger=logger,
+        backend=backend_client,
+        concurrency=config.provided.PLAN_FETCH_CONCURRENCY,
+        bulk_size=config.provided.PLAN_BULK_SIZE,
+        reprobe_interval=config.provided.PLAN_BULK_REPROBE_INTERVAL,
+    )
+    access_cache = providers.Singleton(
+        AccessCache,
+        maxsize=config.provided.ACCESS_CACHE_SIZE,
+        ttl=config.provided.ACCESS_CACHE_TTL,
+    )
+    sessions = providers.Singleton(
+        SessionStore,
+        maxsize=config.provided.SESSION_CACHE_SIZE,
+        ttl=config.provided.SESSION_CACHE_TTL,
+        path=config.provided.SESSION_DB_PATH,
+    )
+    plan_cache = providers.Singleton(
+        PlanCache,
+        maxsize=config.provided.PLAN_CACHE_SIZE,
+        ttl=config.provided.PLAN_CACHE_TTL,
+        preload_size=config.provided.PLAN_PRELOAD_SIZE,
+    )
+    metadata_cache = providers.Singleton(
+        MetadataCache,
+        maxsize=config.provided.METADATA_CACHE_SIZE,
+        ttl=config.provided.METADATA_CACHE_TTL,
+        upsert=config.provided.METADATA_UPSERT,
+    )
+    background_executor = providers.Singleton(
+        ThreadPoolExecutor,
+        max_workers=config.provided.BACKGROUND_WORKERS,
+        thread_name_prefix="background",
+    )
+    report_pipeline = providers.Singleton(
+        ReportPipeline,
+        max_workers=config.provided.REPORT_WORKERS,
+        max_pending=config.provided.REPORT_QUEUE_SIZE,
+        logger=logger,
+    )
+    outbox = providers.Singleton(
+        OutboundQueue,
+        bot=updater.provided.bot,
+        logger=logger,
+        workers=config.provided.OUTBOX_WORKERS,
+        global_rate=config.provided.OUTBOX_GLOBAL_RATE,
+        global_burst=config.provided.OUTBOX_GLOBAL_BURST,
+        chat_rate=config.provided.OUTBOX_CHAT_RATE,
+        chat_burst=config.provided.OUTBOX_CHAT_BURST,
+        coalesce_limit=config.provided.MAX_MESSAGE_LENGTH,
+        max_retries=config.provided.OUTBOX_MAX_RETRIES,
+        metrics=metrics,
+    )
+    message_path = providers.Callable(
+        os.path.join, config.provided.MESSAGES_DIR, config.provided.MESSAGES_FILE
+    )
 
-    messages: Dict[str, Any] = providers.Factory(
-        load_messages, message_path=message_path, logger=logger()
+    messages = providers.Singleton(MessageCatalog, path=message_path, logger=logger)
+    broadcaster = providers.Singleton(
+        Broadcaster,
+        cfg=config,
+        logger=logger,
+        messages=messages,
+        plans=plan_client,
+        sessions=sessions,
+        plan_cache=plan_cache,
+        outbox=outbox,
+        path=config.provided.BROADCAST_DB_PATH,
+        batch_size=config.provided.BROADCAST_BATCH_SIZE,
+        workers=config.provided.BROADCAST_WORKERS,
+        rate=config.provided.BROADCAST_RATE,
+        drain_timeout=config.provided.BROADCAST_DRAIN_TIMEOUT,
     )
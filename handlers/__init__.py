@@ -5,4 +5,6 @@ from .lib import (
     get_training_plan_conversation_handler,
     get_send_report_handler,
     get_authorize_handler,
+    send_menu_handler_factory,
+    get_broadcast_handler,
 )
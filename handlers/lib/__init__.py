@@ -1,6 +1,7 @@
 from .start import get_start_handler
-from .send_menu import get_send_menu_handler
+from .send_menu import get_send_menu_handler, send_menu_handler_factory
 from .query_handler import get_callback_query_handler
 from .get_personal_training import get_training_plan_conversation_handler
 from .send_report import get_send_report_handler
 from .authorize import get_authorize_handler
+from .broadcast import get_broadcast_handler
@@ -1,6 +1,5 @@
-import os
-from typing import Dict, Any, Union, List
-import requests
+from typing import Callable, Dict, Any, Union, List, Mapping
+import httpx
 from telegram import Update
 from telegram.ext import (
     CallbackContext,
@@ -9,22 +8,36 @@ from telegram.ext import (
     MessageHandler,
     Filters,
 )
-from typeguard import typechecked
-from utils import Config, Prompts
-from requests import Response
+from utils.typecheck import typechecked
+from utils import (
+    Config,
+    Prompts,
+    BackendClient,
+    SessionStore,
+    AccessCache,
+    OutboundQueue,
+)
 from logging import Logger
-from ..send_menu import send_menu_handler_factory
 
 TOKEN = 0
 
 
 @typechecked
-def authorize_handler_factory(cfg: Config, logger: Logger, messages: Dict[str, Any]):
+def authorize_handler_factory(
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
+):
     @typechecked
     def get_token(update: Update, context: CallbackContext) -> int:
         if update.effective_chat is None:
             raise ValueError
-        context.bot.send_message(
+        outbox.send(
             chat_id=update.effective_chat.id,
             text=messages["please_write_token"],
         )
@@ -36,35 +49,35 @@ def authorize_handler_factory(cfg: Config, logger: Logger, messages: Dict[str, A
     ) -> Union[int, None]:
         if update.effective_chat is None:
             raise TypeError
-        context.user_data["api_token"] = update.message.text
+        # Kept in the SessionStore only: user_data is persisted in plain text
+        api_token: str = update.message.text
         user_chat_id = str(update.effective_chat.id)
 
         get_params: Dict[str, str] = {
-            "api_key": context.user_data["api_token"],
+            "api_key": api_token,
         }
 
-        logger.info(
-            f"User: {user_chat_id} insered a token: {context.user_data['api_token']}\n"
-        )
+        # Never the token itself: it grants access to the user's plans
+        logger.info("User: %s inserted a token", user_chat_id)
 
         try:
-            get_response: Response = requests.get(
-                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.ALLOWED_PERSONAL_TRAINING}",
+            get_response: httpx.Response = backend.get(
+                cfg.ALLOWED_PERSONAL_TRAINING,
                 params=get_params,
-                timeout=10,
             )
 
             logger.debug(
-                f"Received HTTP {get_response.status_code} from backend for allowance request."
+                "Received HTTP %s from backend for allowance request.",
+                get_response.status_code,
             )
 
             if get_response.status_code == 403:
-                context.bot.send_message(
+                access_cache.invalidate(api_token)
+                outbox.send(
                     chat_id=update.effective_chat.id,
                     text="ОЙ! Доступа нет! :(",
                 )
-                send_menu_handler = send_menu_handler_factory(cfg)
-                send_menu_handler(update, context)
+                send_menu(update, context)
                 return ConversationHandler.END
             else:
                 get_response.raise_for_status()
@@ -74,8 +87,8 @@ def authorize_handler_factory(cfg: Config, logger: Logger, messages: Dict[str, A
             if isinstance(data, dict):
                 resources: List[Dict[str, Any]] = data["Resources"]
                 if not resources:  # If list is empty
-                    logger.warning(f"No token found for user {user_chat_id}.")
-                    context.bot.send_message(
+                    logger.warning("No token found for user %s.", user_chat_id)
+                    outbox.send(
                         chat_id=update.effective_chat.id, text="Такого токена нет :("
                     )
                 else:
@@ -83,59 +96,60 @@ def authorize_handler_factory(cfg: Config, logger: Logger, messages: Dict[str, A
                         if isinstance(resource, dict):
                             is_allowed: bool = resource["Allowed"]
                             if is_allowed:
-                                os.environ["X-API-Key"] = context.user_data["api_token"]
-                                context.bot.send_message(
+                                sessions.set_api_key(
+                                    update.effective_chat.id,
+                                    api_token,
+                                )
+                                access_cache.invalidate(api_token)
+                                outbox.send(
                                     chat_id=update.effective_chat.id,
                                     text=messages["i_know_you"],
                                 )
 
                                 put_params: Dict[str, Any] = {
-                                    "api_key": context.user_data["api_token"],
+                                    "api_key": api_token,
                                     "tg_id": update.effective_chat.id,
                                 }
 
-                                put_response: Response = requests.put(
-                                    f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA}",
+                                put_response: httpx.Response = backend.put(
+                                    cfg.ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA,
                                     params=put_params,
-                                    timeout=10,
                                 )
                                 put_response.raise_for_status()
                                 logger.info(
-                                    f"Updated metadata for token: {context.user_data['api_token']} \n "
-                                    f"with tg_id: {update.effective_chat.id}"
+                                    "Updated token metadata with tg_id: %s",
+                                    update.effective_chat.id,
                                 )
-                                send_menu_handler = send_menu_handler_factory(cfg)
-                                send_menu_handler(update, context)
+                                send_menu(update, context)
                                 return ConversationHandler.END
                             else:
-                                context.bot.send_message(
+                                outbox.send(
                                     chat_id=update.effective_chat.id,
                                     text=messages["access_expired"],
                                 )
-                                send_menu_handler = send_menu_handler_factory(cfg)
-                                send_menu_handler(update, context)
+                                send_menu(update, context)
                                 return ConversationHandler.END
 
-        except requests.Timeout:
+        except httpx.TimeoutException:
             logger.warning(
-                f"Request to backend for training plan timed out for user {user_chat_id}."
+                "Request to backend for training plan timed out for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["request_timeout"]
             )
-        except (
-            requests.RequestException
-        ) as e:  # Catching other request-related exceptions
-            logger.error(f"Request to backend failed with error: {str(e)}")
-            context.bot.send_message(
+        except httpx.HTTPError as e:  # Catching other request-related exceptions
+            logger.error("Request to backend failed with error: %s", e)
+            outbox.send(
                 chat_id=update.effective_chat.id,
                 text=messages["exception"].format(exception=str(e)),
             )
         except ValueError:  # This will catch non-JSON parsable responses
             logger.error(
-                f"Received non-JSON parsable response from backend for user {user_chat_id}."
+                "Received non-JSON parsable response from backend for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["unexpected_data"]
             )
 
@@ -144,10 +158,18 @@ def authorize_handler_factory(cfg: Config, logger: Logger, messages: Dict[str, A
 
 @typechecked
 def get_authorize_handler(
-    cfg: Config, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
+    persistent: bool = False,
 ) -> ConversationHandler:
     get_token, receive_and_set_api_key_token = authorize_handler_factory(
-        cfg, logger, messages
+        cfg, logger, messages, backend, sessions, access_cache, outbox, send_menu
     )
 
     conv_handler = ConversationHandler(
@@ -160,5 +182,8 @@ def get_authorize_handler(
             ]
         },
         fallbacks=[],
+        # With persistence, a restart does not drop chats halfway through
+        name="authorize",
+        persistent=persistent,
     )
     return conv_handler
@@ -0,0 +1 @@
+from .broadcast import get_broadcast_handler
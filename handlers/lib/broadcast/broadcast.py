@@ -0,0 +1,56 @@
+from typing import Any, Callable, Mapping
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+from utils import (
+    Config,
+    Broadcaster,
+    OutboundQueue,
+    fetch_calender_week,
+    fetch_current_year,
+    is_admin,
+)
+from utils.typecheck import typechecked
+
+
+@typechecked
+def broadcast_handler_factory(
+    cfg: Config,
+    messages: Mapping[str, Any],
+    broadcaster: Broadcaster,
+    outbox: OutboundQueue,
+) -> Callable[[Update, CallbackContext], None]:
+    @typechecked
+    def broadcast(update: Update, context: CallbackContext) -> None:
+        if update.effective_chat is None:
+            raise TypeError
+        user_chat_id: int = update.effective_chat.id
+        if not is_admin(cfg, user_chat_id=str(user_chat_id)):
+            outbox.send(chat_id=user_chat_id, text=messages["not_allowed"])
+            return
+
+        # The broadcast reports its numbers to the admin chat when it is done
+        year: int = fetch_current_year()
+        week: int = fetch_calender_week()
+        text: str
+        if broadcaster.finished(year, week):
+            text = messages["broadcast_already_sent"].format(
+                year=year, week=week, **broadcaster.progress(year, week)
+            )
+        elif broadcaster.start(year, week):
+            text = messages["broadcast_started"].format(year=year, week=week)
+        else:
+            text = messages["broadcast_running"].format(**broadcaster.progress())
+        outbox.send(chat_id=user_chat_id, text=text)
+
+    return broadcast
+
+
+@typechecked
+def get_broadcast_handler(
+    cfg: Config,
+    messages: Mapping[str, Any],
+    broadcaster: Broadcaster,
+    outbox: OutboundQueue,
+) -> CommandHandler:
+    broadcast = broadcast_handler_factory(cfg, messages, broadcaster, outbox)
+    return CommandHandler("broadcast", broadcast, run_async=True)
@@ -1,6 +1,6 @@
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-from typeguard import typechecked
+from utils.typecheck import typechecked
 
 
 @typechecked
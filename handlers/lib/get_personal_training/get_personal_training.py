@@ -1,28 +1,163 @@
-import os
-from typing import Dict, Any, List, Callable
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Callable, Iterable, Iterator, Optional, Mapping
 from telegram import Update
 from telegram.ext import (
     CallbackContext,
     CommandHandler,
 )
-import requests
+import httpx
 from utils import (
+    AccessCache,
     Config,
-    convert_json_to_human_readable,
+    BackendClient,
+    SessionStore,
+    OutboundQueue,
+    PlanCache,
+    MetadataCache,
+    PlanKey,
+    RenderedPlan,
+    TrainingDay,
+    parse_week,
+    iter_week_blocks,
+    pack_messages,
     fetch_calender_week,
     fetch_current_year,
+    has_access,
+    span,
+    submit_traced,
 )
 from logging import Logger
-from typeguard import typechecked
-from ..send_menu import send_menu_handler_factory
-from requests import Response
+from utils.typecheck import typechecked
 from utils import MetaData
 
 
 @typechecked
 def send_personal_training_handler_factory(
-    cfg: Config, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    plan_cache: PlanCache,
+    metadata_cache: MetadataCache,
+    executor: ThreadPoolExecutor,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
 ) -> Callable[[Update, CallbackContext], None]:
+    @typechecked
+    def refresh_current_metadata(
+        context: CallbackContext,
+        metadata: MetaData,
+        headers: Dict[str, str],
+        is_newcomer: Future,
+    ) -> None:
+        if metadata_cache.unchanged(metadata):
+            # Already written by an earlier view of this week
+            is_newcomer.set_result(False)
+            return
+
+        # One upsert: 201 means there was no row yet, i.e. a newcomer --
+        if metadata_cache.upsert_supported:
+            try:
+                put_response: httpx.Response = backend.put(
+                    cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT,
+                    headers=headers,
+                    json=metadata.model_dump(),
+                )
+                logger.debug(
+                    "Received HTTP %s from backend for put metadata request.",
+                    put_response.status_code,
+                )
+                if put_response.status_code != 405:
+                    put_response.raise_for_status()
+            except httpx.HTTPError as e:
+                # The plan is sent all the same, only without the greeting
+                metadata_cache.invalidate(metadata.TgId)
+                report_metadata_error(metadata, e)
+                is_newcomer.set_result(False)
+                return
+            if put_response.status_code != 405:
+                metadata_cache.set(metadata)
+                is_newcomer.set_result(put_response.status_code == 201)
+                return
+            logger.info("Backend takes no metadata upserts, using DELETE+POST")
+            metadata_cache.disable_upsert()
+
+        # Without upserts: Delete current metadata -------
+        try:
+            delete_params: Dict[str, int] = {"tg_id": metadata.TgId}
+            delete_response: httpx.Response = backend.delete(
+                cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT,
+                headers=headers,
+                params=delete_params,
+            )
+            logger.debug(
+                "Received HTTP %s from backend for delete metadata request.",
+                delete_response.status_code,
+            )
+            if delete_response.status_code not in (204, 404):
+                delete_response.raise_for_status()
+        except httpx.HTTPError as e:
+            # The plan is sent all the same, only without the greeting
+            metadata_cache.invalidate(metadata.TgId)
+            report_metadata_error(metadata, e)
+            is_newcomer.set_result(False)
+            return
+        metadata_cache.invalidate(metadata.TgId)  # The row is gone for now
+        is_newcomer.set_result(delete_response.status_code == 404)
+
+        # ... and write it again -----------------
+        try:
+            post_response: httpx.Response = backend.post(
+                cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT,
+                headers=headers,
+                json=metadata.model_dump(),
+            )
+            logger.debug(
+                "Received HTTP %s from backend for post metadata request.",
+                post_response.status_code,
+            )
+            post_response.raise_for_status()
+            metadata_cache.set(metadata)
+        except httpx.HTTPError as e:
+            report_metadata_error(metadata, e)
+
+    def report_metadata_error(metadata: MetaData, e: httpx.HTTPError) -> None:
+        if isinstance(e, httpx.TimeoutException):
+            logger.warning(
+                "Request to backend for metadata timed out for user %s.", metadata.TgId
+            )
+            outbox.send(chat_id=metadata.TgId, text=messages["request_timeout"])
+        else:
+            logger.error("Request to backend failed with error: %s", e)
+            outbox.send(
+                chat_id=metadata.TgId,
+                text=messages["exception"].format(exception=str(e)),
+            )
+
+    def settle(is_newcomer: Future, job: Future) -> None:
+        # The refresh failed before it could tell, e.g. in the type check
+        # of its arguments: nobody is greeted rather than waited for
+        if not is_newcomer.done():
+            is_newcomer.set_result(False)
+
+    def render_and_cache(
+        plan_key: PlanKey,
+        days: List[TrainingDay],
+        resources: List[Dict[str, Any]],
+    ) -> Iterator[str]:
+        # The plan is cached once the last day has been handed to the packer
+        rendered: List[str] = []
+        for block in iter_week_blocks(days):
+            rendered.append(block)
+            yield block
+        plan_cache.set(
+            plan_key, RenderedPlan(text="".join(rendered), resources=resources)
+        )
+
     @typechecked
     def send_personal_training_for_current_week(
         update: Update,
@@ -34,6 +169,11 @@ def send_personal_training_handler_factory(
             user_chat_id = update.effective_chat.id
         else:
             raise TypeError
+        api_key: Optional[str] = sessions.get_api_key(user_chat_id)
+        if api_key is None:
+            outbox.send(chat_id=user_chat_id, text=messages["not_allowed"])
+            send_menu(update, context)
+            return
         current_year: int = fetch_current_year()
         current_calender_week: int = fetch_calender_week()
         get_params: Dict[str, int] = {
@@ -43,146 +183,203 @@ def send_personal_training_handler_factory(
         }
         headers: Dict[str, str] = {
             "accept": "application/json",
-            "X-API-Key": os.environ["X-API-Key"],
+            "X-API-Key": api_key,
         }
 
         logger.info(
-            f"User: {get_params['tg_id']} requested training plan for\n"
-            f"Week: {get_params['week']}"
+            "User: %s requested training plan for\nWeek: %s",
+            get_params["tg_id"],
+            get_params["week"],
         )
 
+        # A cached plan skips the backend, and with it the backend's check of
+        # the key: check it here, so a revoked key stops getting plans
+        plan_key: PlanKey = (user_chat_id, current_year, current_calender_week)
+        plan_cache.roll_over(current_year, current_calender_week)
+        cached_plan: Optional[RenderedPlan] = plan_cache.get(plan_key)
+        if cached_plan is not None:
+            try:
+                allowed: bool = has_access(cfg, backend, api_key, access_cache)
+            except httpx.HTTPError as e:
+                # Fetched instead, with the backend checking the key
+                logger.warning("Could not check access of %s: %s", user_chat_id, e)
+                cached_plan = None
+            else:
+                if not allowed:
+                    plan_cache.invalidate(plan_key)
+                    outbox.send(chat_id=user_chat_id, text=messages["not_allowed"])
+                    send_menu(update, context)
+                    return
+
+        # ---------------------------------------
+        # ------- Update metadata ---------------
+        # ---------------------------------------
+        # Runs concurrently with the plan fetch and formatting below.
+        metadata: MetaData = MetaData(
+            TgId=user_chat_id, Year=current_year, Week=current_calender_week
+        )
+        is_newcomer: Future = Future()
+        try:
+            job: Future = submit_traced(
+                executor,
+                "refresh_metadata",
+                refresh_current_metadata,
+                context,
+                metadata,
+                headers,
+                is_newcomer,
+            )
+        except RuntimeError:  # The executor is shutting down
+            logger.warning("Could not refresh current metadata for %s.", user_chat_id)
+            is_newcomer.set_result(False)
+        else:
+            job.add_done_callback(lambda job: settle(is_newcomer, job))
+
+        blocks: Iterable[str]
         try:
             # ---------------------------------------
             # ------- Get training plan ---------------
             # ---------------------------------------
-            get_response: Response = requests.get(
-                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.PERSONAL_TRAINING_ENDPOINT}",
-                params=get_params,
-                headers=headers,
-                timeout=10,
-            )
-            logger.debug(
-                f"Received HTTP {get_response.status_code} from backend for training plan request."
-            )
+            if cached_plan is not None:
+                logger.debug("Serving cached training plan to user %s.", user_chat_id)
+                blocks = [cached_plan.text]
+            else:
+                get_response: httpx.Response = backend.get(
+                    cfg.PERSONAL_TRAINING_ENDPOINT,
+                    params=get_params,
+                    headers=headers,
+                )
+                logger.debug(
+                    "Received HTTP %s from backend for training plan request.",
+                    get_response.status_code,
+                )
 
-            # Raise exception for HTTP errors
-            get_response.raise_for_status()
+                # Raise exception for HTTP errors
+                get_response.raise_for_status()
 
-            # Try parsing the JSON response
-            data = get_response.json()
+                # Try parsing the JSON response
+                data = get_response.json()
 
-            if isinstance(data, dict):
-                resources: List[Dict[str, Any]] = data["Resources"]
-                if not resources:  # If list is empty
-                    formatted_data = messages["no_personal_training"].format(
-                        calendar_week=current_calender_week
-                    )
-                    logger.warning(
-                        f"No training plans found for user {user_chat_id} for given criteria."
-                    )
-                else:
-                    week_tg_ids: List[int] = [
-                        resource["TgId"] for resource in resources
-                    ]
-                    if any(tg_id == 0 for tg_id in week_tg_ids):
-                        put_params = get_params
-                        put_response: Response = requests.put(
-                            f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.UPDATE_PERSONAL_TRAINING_TG_ID}",
-                            params=put_params,
-                            headers=headers,
-                            timeout=10,
+                if isinstance(data, dict):
+                    resources: List[Dict[str, Any]] = data["Resources"]
+                    if not resources:  # If list is empty
+                        blocks = [
+                            messages["no_personal_training"].format(
+                                calendar_week=current_calender_week
+                            )
+                        ]
+                        logger.warning(
+                            "No training plans found for user %s for given criteria.",
+                            user_chat_id,
                         )
-                        put_response.raise_for_status()
-                        logger.info("Updated tg_id for training plan")
-                    formatted_data = convert_json_to_human_readable(resources)
-            else:
-                formatted_data = str(data)
+                    else:
+                        with span("parse_week", days=len(resources)):
+                            days: List[TrainingDay] = parse_week(resources)
+                        if any(day.TgId == 0 for day in days):
+                            put_params = get_params
+                            put_response: httpx.Response = backend.put(
+                                cfg.UPDATE_PERSONAL_TRAINING_TG_ID,
+                                params=put_params,
+                                headers=headers,
+                            )
+                            put_response.raise_for_status()
+                            logger.info("Updated tg_id for training plan")
+                            plan_cache.invalidate(plan_key)
+                            blocks = iter_week_blocks(days)
+                        else:
+                            blocks = render_and_cache(plan_key, days, resources)
+                else:
+                    blocks = [str(data)]
 
             # ---------------------------------------
-            # ------- Update metadata ---------------
+            # ------- Wait for metadata refresh -----
             # ---------------------------------------
-            # Step 1: Delete current metadata -------
-
-            delete_params: Dict[str, int] = {"tg_id": user_chat_id}
-
-            delete_response: Response = requests.delete(
-                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT}",
-                headers=headers,
-                params=delete_params,
-                timeout=10,
-            )
-
-            logger.debug(
-                f"Received HTTP {delete_response.status_code} from backend for delete metadata request."
-            )
-
-            if delete_response.status_code == 404:
-                newcomer_welcome: str = messages["newcomer_welcome"]
-                formatted_data = newcomer_welcome + formatted_data
-            elif delete_response.status_code != 204:
-                get_response.raise_for_status()
-
-            # Step 2: Write current metadata --------
-            metadata: MetaData = MetaData(
-                TgId=user_chat_id, Year=current_year, Week=current_calender_week
-            )
-            post_response: Response = requests.post(
-                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT}",
-                headers=headers,
-                timeout=10,
-                json=metadata.dict(),
-            )
-            logger.debug(
-                f"Received HTTP {post_response.status_code} from backend for post metadata request."
-            )
-            post_response.raise_for_status()
+            # Only the PUT or DELETE outcome is needed here; the refresh
+            # reports its own errors. Whatever happens to it, or if the backend
+            # takes longer than BACKEND_TIMEOUT to tell, the plan is sent.
+            newcomer: bool
+            with span("wait_metadata"):
+                try:
+                    newcomer = is_newcomer.result(timeout=cfg.BACKEND_TIMEOUT)
+                except FutureTimeoutError:
+                    logger.warning(
+                        "Current metadata for %s not written in time.", user_chat_id
+                    )
+                    newcomer = False
+                except Exception as e:
+                    logger.warning(
+                        "Refreshing current metadata for %s failed: %r",
+                        user_chat_id,
+                        e,
+                    )
+                    newcomer = False
+            if newcomer:
+                blocks = itertools.chain([messages["newcomer_welcome"]], blocks)
 
             # ---------------------------------------
             # ------- Respond to user ---------------
             # ---------------------------------------
-
-            data_chunks = [
-                formatted_data[i : i + cfg.MAX_MESSAGE_LENGTH]
-                for i in range(0, len(formatted_data), cfg.MAX_MESSAGE_LENGTH)
-            ]
-
-            for chunk in data_chunks:
-                context.bot.send_message(chat_id=update.effective_chat.id, text=chunk)
-                logger.debug(f"Sent message chunk to user {user_chat_id}.")
-        except requests.Timeout:
+            # Days are rendered as the packer asks for them, so the first
+            # message is queued before the rest of the week is rendered.
+            with span("render_and_queue"):
+                for text in pack_messages(blocks, cfg.MAX_MESSAGE_LENGTH):
+                    outbox.send(chat_id=update.effective_chat.id, text=text)
+                    logger.debug("Queued message chunk for user %s.", user_chat_id)
+        except httpx.TimeoutException:
             logger.warning(
-                f"Request to backend for training plan timed out for user {user_chat_id}."
+                "Request to backend for training plan timed out for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["request_timeout"]
             )
-        except (
-            requests.RequestException
-        ) as e:  # Catching other request-related exceptions
-            logger.error(f"Request to backend failed with error: {str(e)}")
-            context.bot.send_message(
+        except httpx.HTTPError as e:  # Catching other request-related exceptions
+            logger.error("Request to backend failed with error: %s", e)
+            outbox.send(
                 chat_id=update.effective_chat.id,
                 text=messages["exception"].format(exception=str(e)),
             )
         except ValueError:  # This will catch non-JSON parsable responses
             logger.error(
-                f"Received non-JSON parsable response from backend for user {user_chat_id}."
+                "Received non-JSON parsable response from backend for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["unexpected_data"]
             )
 
-        send_menu_handler = send_menu_handler_factory(cfg)
-        send_menu_handler(update, context)
+        send_menu(update, context)
 
     return send_personal_training_for_current_week
 
 
 @typechecked
 def get_training_plan_conversation_handler(
-    cfg: Config, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    plan_cache: PlanCache,
+    metadata_cache: MetadataCache,
+    executor: ThreadPoolExecutor,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
 ) -> CommandHandler:
     get_personal_training_handler = send_personal_training_handler_factory(
-        cfg, logger, messages
+        cfg,
+        logger,
+        messages,
+        backend,
+        sessions,
+        access_cache,
+        plan_cache,
+        metadata_cache,
+        executor,
+        outbox,
+        send_menu,
+    )
+    return CommandHandler(
+        "get_personal_training", get_personal_training_handler, run_async=True
     )
-    return CommandHandler("get_personal_training", get_personal_training_handler)
@@ -1,5 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Callable, Dict, Any
+from types import MappingProxyType
+from typing import Callable, Dict, Any, Mapping
 
 from telegram import Update
 from telegram.ext import (
@@ -9,16 +11,65 @@ from telegram.ext import (
     ConversationHandler,
 )
 
-from utils import Config, Commands, Prompts
-from typeguard import typechecked
+from utils import (
+    AccessCache,
+    Config,
+    Commands,
+    Prompts,
+    BackendClient,
+    SessionStore,
+    OutboundQueue,
+    PlanCache,
+    MetadataCache,
+)
+from utils.typecheck import typechecked
 from ..get_personal_training import send_personal_training_handler_factory
 from ..get_description import get_description_handler_factory
 from ..send_report import send_report_handler_factory
 
 
+@typechecked
+def build_callback_routes(
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    plan_cache: PlanCache,
+    metadata_cache: MetadataCache,
+    executor: ThreadPoolExecutor,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
+) -> Mapping[str, Callable[[Update, CallbackContext], None]]:
+    """
+    Handlers for the menu buttons by callback_data, built once at startup.
+    Buttons that start a conversation (get_token, send_report) are routed by
+    their ConversationHandler instead.
+    """
+    return MappingProxyType(
+        {
+            "get_description": get_description_handler_factory(cfg, messages, outbox),
+            "get_personal_training": send_personal_training_handler_factory(
+                cfg,
+                logger,
+                messages,
+                backend,
+                sessions,
+                access_cache,
+                plan_cache,
+                metadata_cache,
+                executor,
+                outbox,
+                send_menu,
+            ),
+        }
+    )
+
+
 @typechecked
 def callback_query_handler_factory(
-    cfg: Config, logger: Logger, messages: Dict[str, Any]
+    routes: Mapping[str, Callable[[Update, CallbackContext], None]]
 ) -> Callable[[Update, CallbackContext], None]:
     @typechecked
     def callback_query(update: Update, context: CallbackContext) -> None:
@@ -27,22 +78,38 @@ def callback_query_handler_factory(
         if update.effective_chat is None:
             raise TypeError
 
-        if query.data == "get_description":
-            get_description_handler = get_description_handler_factory(cfg, messages)
-            get_description_handler(update, context)
-
-        elif query.data == "get_personal_training":
-            personal_training_handler = send_personal_training_handler_factory(
-                cfg, logger, messages
-            )
-            personal_training_handler(update, context)
+        handler = routes.get(query.data)
+        if handler is not None:
+            handler(update, context)
 
     return callback_query
 
 
 @typechecked
 def get_callback_query_handler(
-    cfg: Config, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    plan_cache: PlanCache,
+    metadata_cache: MetadataCache,
+    executor: ThreadPoolExecutor,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
 ) -> CallbackQueryHandler:
-    callback_query_handler = callback_query_handler_factory(cfg, logger, messages)
-    return CallbackQueryHandler(callback_query_handler)
+    routes = build_callback_routes(
+        cfg,
+        logger,
+        messages,
+        backend,
+        sessions,
+        access_cache,
+        plan_cache,
+        metadata_cache,
+        executor,
+        outbox,
+        send_menu,
+    )
+    return CallbackQueryHandler(callback_query_handler_factory(routes), run_async=True)
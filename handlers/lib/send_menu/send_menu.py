@@ -1,54 +1,93 @@
-from typing import Callable, Union
+from types import MappingProxyType
+from typing import Callable, Literal, Mapping, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     CallbackContext,
     CommandHandler,
 )
-from utils import Config, has_access, is_admin
-from typeguard import typechecked
-import os
+from utils import (
+    Config,
+    BackendClient,
+    SessionStore,
+    AccessCache,
+    OutboundQueue,
+    has_access,
+    is_admin,
+)
+from utils.typecheck import typechecked
+
+Role = Literal["anonymous", "client", "admin"]
+
+AUTHORIZE_BUTTON: InlineKeyboardButton = InlineKeyboardButton(
+    "🧐️️️️️️ Авторизация", callback_data="get_token"
+)
+DESCRIPTION_BUTTON: InlineKeyboardButton = InlineKeyboardButton(
+    "🔍 Как работает этот бот?", callback_data="get_description"
+)
+PERSONAL_TRAINING_BUTTON: InlineKeyboardButton = InlineKeyboardButton(
+    "🦾 Получить тренировку", callback_data="get_personal_training"
+)
+SEND_REPORT_BUTTON: InlineKeyboardButton = InlineKeyboardButton(
+    "📝  Написать отчет", callback_data="send_report"
+)
+
+# Built once and shared by every menu sent; rows are tuples so that nothing
+# can change a keyboard after startup
+_CLIENT_KEYBOARD: InlineKeyboardMarkup = InlineKeyboardMarkup(
+    ((DESCRIPTION_BUTTON,), (PERSONAL_TRAINING_BUTTON,), (SEND_REPORT_BUTTON,))
+)
+MENU_KEYBOARDS: Mapping[Role, InlineKeyboardMarkup] = MappingProxyType(
+    {
+        "anonymous": InlineKeyboardMarkup(((AUTHORIZE_BUTTON,),)),
+        "client": _CLIENT_KEYBOARD,
+        "admin": _CLIENT_KEYBOARD,
+    }
+)
 
 
 @typechecked
-def send_menu_handler_factory(cfg: Config) -> Callable[[Update, CallbackContext], None]:
+def menu_role(
+    cfg: Config,
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    user_chat_id: int,
+) -> Role:
+    # The admin check is local, so it goes before the backend lookup
+    if is_admin(cfg, user_chat_id=str(user_chat_id)):
+        return "admin"
+    api_key: Optional[str] = sessions.get_api_key(user_chat_id)
+    if api_key is not None and has_access(cfg, backend, api_key, access_cache):
+        return "client"
+    return "anonymous"
+
+
+@typechecked
+def send_menu_handler_factory(
+    cfg: Config,
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    outbox: OutboundQueue,
+) -> Callable[[Update, CallbackContext], None]:
     @typechecked
     def send_menu(update: Update, context: CallbackContext) -> None:
         if update.effective_chat is None:
             raise TypeError
 
         user_chat_id: int = update.effective_chat.id
-
-        keyboard = []
-        authorize_button: InlineKeyboardButton = InlineKeyboardButton(
-            "🧐️️️️️️ Авторизация", callback_data="get_token"
-        )
-        description_button: InlineKeyboardButton = InlineKeyboardButton(
-            "🔍 Как работает этот бот?", callback_data="get_description"
-        )
-        personal_training_button: InlineKeyboardButton = InlineKeyboardButton(
-            "🦾 Получить тренировку", callback_data="get_personal_training"
-        )
-        send_report: InlineKeyboardButton = InlineKeyboardButton(
-            "📝  Написать отчет", callback_data="send_report"
-        )
-        api_key: str = os.getenv("X-API-Key", "")
-        if has_access(cfg, api_key) or is_admin(cfg, user_chat_id=str(user_chat_id)):
-            keyboard.extend(
-                [[description_button], [personal_training_button], [send_report]]
-            )
-        else:
-            keyboard.append([authorize_button])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        context.bot.send_message(
-            chat_id=update.effective_chat.id,
+        role: Role = menu_role(cfg, backend, sessions, access_cache, user_chat_id)
+        outbox.send(
+            chat_id=user_chat_id,
             text="Выберите опцию:",
-            reply_markup=reply_markup,
+            reply_markup=MENU_KEYBOARDS[role],
         )
 
     return send_menu
 
 
 @typechecked
-def get_send_menu_handler(cfg: Config) -> CommandHandler:
-    send_menu_handler = send_menu_handler_factory(cfg)
-    return CommandHandler("menu", send_menu_handler)
+def get_send_menu_handler(
+    send_menu: Callable[[Update, CallbackContext], None]
+) -> CommandHandler:
+    return CommandHandler("menu", send_menu, run_async=True)
@@ -1,7 +1,8 @@
-import os
 import json
-from typing import Dict, Any, Union, List
-import requests
+import logging
+from functools import partial
+from typing import Callable, Dict, Any, Optional, Union, List, Mapping
+import httpx
 from telegram import Update
 from telegram.ext import (
     CallbackContext,
@@ -10,29 +11,120 @@ from telegram.ext import (
     MessageHandler,
     Filters,
 )
-from typeguard import typechecked
-from utils import Config, format_report_with_gpt, ReportWithMetadata, Prompts, MetaData
-from requests import Response
+from utils.typecheck import typechecked
+from utils import (
+    Config,
+    BackendClient,
+    SessionStore,
+    OutboundQueue,
+    Metrics,
+    ReportPipeline,
+    format_report_with_gpt,
+    ReportWithMetadata,
+    Prompts,
+    MetaData,
+)
 from logging import Logger
-from ..send_menu import send_menu_handler_factory
 
 CLIENT_REPORT = 0
 
 
 @typechecked
 def send_report_handler_factory(
-    cfg: Config, prompts: Prompts, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    prompts: Prompts,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    report_pipeline: ReportPipeline,
+    outbox: OutboundQueue,
+    metrics: Metrics,
+    send_menu: Callable[[Update, CallbackContext], None],
 ):
     @typechecked
     def send_report(update: Update, context: CallbackContext) -> int:
         if update.effective_chat is None:
             raise ValueError
-        context.bot.send_message(
+        if sessions.get_api_key(update.effective_chat.id) is None:
+            outbox.send(chat_id=update.effective_chat.id, text=messages["not_allowed"])
+            send_menu(update, context)
+            return ConversationHandler.END
+        outbox.send(
             chat_id=update.effective_chat.id,
             text=messages["please_write_report"],
         )
         return CLIENT_REPORT
 
+    @typechecked
+    def load_report(
+        update: Update,
+        context: CallbackContext,
+        metadata: MetaData,
+        client_report: str,
+        headers: Dict[str, str],
+    ) -> None:
+        if update.effective_chat is None:
+            raise TypeError
+        user_chat_id = str(update.effective_chat.id)
+
+        try:
+            report: ReportWithMetadata = format_report_with_gpt(
+                cfg=cfg,
+                prompts=prompts,
+                metadata=metadata,
+                client_report=client_report,
+                metrics=metrics,
+            )
+
+            post_response: httpx.Response = backend.post(
+                cfg.PERSONAL_TRAINING_REPORT,
+                headers=headers,
+                json=report.dict(),
+            )
+            logger.debug(
+                "Received HTTP %s from backend for post report request.",
+                post_response.status_code,
+            )
+            if post_response.status_code == 409:
+                outbox.send(
+                    chat_id=update.effective_chat.id,
+                    text=messages["report_already_exists"].format(
+                        week=metadata.Week, year=metadata.Year
+                    ),
+                )
+            else:
+                post_response.raise_for_status()
+                if logger.isEnabledFor(logging.DEBUG):  # Serializing is not free
+                    logger.debug("Report: %s", json.dumps(report.dict()))
+                outbox.send(
+                    chat_id=update.effective_chat.id,
+                    text=messages["report_successfully_uploaded"].format(
+                        year=metadata.Year, week=metadata.Week
+                    ),
+                )
+        except httpx.TimeoutException:
+            logger.warning(
+                "Request to format and upload report timed out for user %s.",
+                user_chat_id,
+            )
+            outbox.send(
+                chat_id=update.effective_chat.id, text=messages["request_timeout"]
+            )
+        except httpx.HTTPError as e:  # Catching other request-related exceptions
+            logger.error("Request to upload report failed with error: %s", e)
+            outbox.send(
+                chat_id=update.effective_chat.id,
+                text=messages["exception"].format(exception=str(e)),
+            )
+        except ValueError:  # This will catch unparsable GPT or backend responses
+            logger.error("Received unparsable report data for user %s.", user_chat_id)
+            outbox.send(
+                chat_id=update.effective_chat.id, text=messages["unexpected_data"]
+            )
+
+        send_menu(update, context)
+
     @typechecked
     def receive_and_load_report(
         update: Update, context: CallbackContext
@@ -40,37 +132,41 @@ def send_report_handler_factory(
         if update.effective_chat is None:
             raise TypeError
         user_chat_id = str(update.effective_chat.id)
+        api_key: Optional[str] = sessions.get_api_key(update.effective_chat.id)
+        if api_key is None:
+            outbox.send(chat_id=update.effective_chat.id, text=messages["not_allowed"])
+            send_menu(update, context)
+            return ConversationHandler.END
 
         params = {
             "tg_id": user_chat_id,
         }
         headers: Dict[str, str] = {
             "accept": "application/json",
-            "X-API-Key": os.environ["X-API-Key"],
+            "X-API-Key": api_key,
         }
 
-        logger.info(f"User: {user_chat_id} requested current training plan idx\n")
+        logger.info("User: %s requested current training plan idx\n", user_chat_id)
 
         try:
             # Send request to backend
-            get_response: Response = requests.get(
-                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT}",
+            get_response: httpx.Response = backend.get(
+                cfg.CURRENT_PERSONAL_TRAINING_ENDPOINT,
                 headers=headers,
                 params=params,
-                timeout=10,
             )
 
             logger.debug(
-                f"Received HTTP {get_response.status_code} from backend for metadata request."
+                "Received HTTP %s from backend for metadata request.",
+                get_response.status_code,
             )
 
             if get_response.status_code == 404:
-                context.bot.send_message(
+                outbox.send(
                     chat_id=update.effective_chat.id,
                     text=messages["first_train_then_report"],
                 )
-                send_menu_handler = send_menu_handler_factory(cfg)
-                send_menu_handler(update, context)
+                send_menu(update, context)
                 return ConversationHandler.END
             else:
                 get_response.raise_for_status()
@@ -82,119 +178,65 @@ def send_report_handler_factory(
                 if not resources:  # If list is empty
                     formatted_data = messages["no_current_personal_training"]
                     logger.warning(
-                        f"No current training plans found for user {user_chat_id}."
-                    )
-                    context.bot.send_message(
-                        chat_id=update.effective_chat.id, text=formatted_data
+                        "No current training plans found for user %s.", user_chat_id
                     )
+                    outbox.send(chat_id=update.effective_chat.id, text=formatted_data)
                 else:
                     for resource in resources:
                         if isinstance(resource, dict):
                             metadata: MetaData = MetaData(**resource)
-                            client_response: Union[str, None] = update.message.text
-                            client_report: str = ""
                             if update.message.text is None:
                                 raise ValueError
-                            elif isinstance(client_response, str):
-                                client_report: str = client_response
-
-                            report: ReportWithMetadata = format_report_with_gpt(
-                                cfg=cfg,
-                                prompts=prompts,
-                                metadata=metadata,
-                                client_report=client_report,
-                            )
+                            client_report: str = update.message.text
 
-                            post_response: Response = requests.post(
-                                f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.PERSONAL_TRAINING_REPORT}",
-                                headers=headers,
-                                timeout=10,
-                                json=report.dict(),
-                            )
-                            logger.debug(
-                                f"Received HTTP {post_response.status_code} from backend for post report request."
+                            # Parsing the report with GPT can take a while, so it
+                            # runs on the report pipeline and the result is sent
+                            # in a follow-up message.
+                            is_accepted: bool = report_pipeline.submit(
+                                partial(
+                                    load_report,
+                                    update,
+                                    context,
+                                    metadata,
+                                    client_report,
+                                    headers,
+                                )
                             )
-                            if post_response.status_code == 409:
-                                context.bot.send_message(
+                            if is_accepted:
+                                outbox.send(
                                     chat_id=update.effective_chat.id,
-                                    text=messages["report_already_exists"].format(
-                                        week=metadata.Week, year=metadata.Year
-                                    ),
+                                    text=messages["report_received"],
                                 )
-                                send_menu_handler = send_menu_handler_factory(cfg)
-                                send_menu_handler(update, context)
-                                return ConversationHandler.END
                             else:
-                                post_response.raise_for_status()
-
-                            logger.debug(f"Report: {json.dumps(report.dict())}")
-                            try:
-                                context.bot.send_message(
+                                outbox.send(
                                     chat_id=update.effective_chat.id,
-                                    text=messages[
-                                        "report_successfully_uploaded"
-                                    ].format(year=metadata.Year, week=metadata.Week),
+                                    text=messages["report_queue_full"],
                                 )
-
-                                send_menu_handler = send_menu_handler_factory(cfg)
-                                send_menu_handler(update, context)
-                                return ConversationHandler.END
-
-                            except requests.Timeout:
-                                logger.warning(
-                                    f"Request to backend for training plan timed out for user {user_chat_id}."
-                                )
-                                context.bot.send_message(
-                                    chat_id=update.effective_chat.id,
-                                    text=messages["request_timeout"],
-                                )
-                            except (
-                                requests.RequestException
-                            ) as e:  # Catching other request-related exceptions
-                                logger.error(
-                                    f"Request to backend failed with error: {str(e)}"
-                                )
-                                context.bot.send_message(
-                                    chat_id=update.effective_chat.id,
-                                    text=messages["exception"].format(exception=str(e)),
-                                )
-                            except (
-                                ValueError
-                            ):  # This will catch non-JSON parsable responses
-                                logger.error(
-                                    f"Received non-JSON parsable response from backend for user {user_chat_id}."
-                                )
-                                context.bot.send_message(
-                                    chat_id=update.effective_chat.id,
-                                    text=messages["unexpected_data"],
-                                )
-
-                            send_menu_handler = send_menu_handler_factory(cfg)
-                            send_menu_handler(update, context)
-                            return None
+                                send_menu(update, context)
+                            return ConversationHandler.END
                         else:
                             raise TypeError
 
-        except requests.Timeout:
+        except httpx.TimeoutException:
             logger.warning(
-                f"Request to backend for training plan timed out for user {user_chat_id}."
+                "Request to backend for training plan timed out for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["request_timeout"]
             )
-        except (
-            requests.RequestException
-        ) as e:  # Catching other request-related exceptions
-            logger.error(f"Request to backend failed with error: {str(e)}")
-            context.bot.send_message(
+        except httpx.HTTPError as e:  # Catching other request-related exceptions
+            logger.error("Request to backend failed with error: %s", e)
+            outbox.send(
                 chat_id=update.effective_chat.id,
                 text=messages["exception"].format(exception=str(e)),
             )
         except ValueError:  # This will catch non-JSON parsable responses
             logger.error(
-                f"Received non-JSON parsable response from backend for user {user_chat_id}."
+                "Received non-JSON parsable response from backend for user %s.",
+                user_chat_id,
             )
-            context.bot.send_message(
+            outbox.send(
                 chat_id=update.effective_chat.id, text=messages["unexpected_data"]
             )
 
@@ -203,10 +245,29 @@ def send_report_handler_factory(
 
 @typechecked
 def get_send_report_handler(
-    cfg: Config, prompts: Prompts, logger: Logger, messages: Dict[str, Any]
+    cfg: Config,
+    prompts: Prompts,
+    logger: Logger,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    report_pipeline: ReportPipeline,
+    outbox: OutboundQueue,
+    metrics: Metrics,
+    send_menu: Callable[[Update, CallbackContext], None],
+    persistent: bool = False,
 ) -> ConversationHandler:
     send_report, receive_and_load_report = send_report_handler_factory(
-        cfg, prompts, logger, messages
+        cfg,
+        prompts,
+        logger,
+        messages,
+        backend,
+        sessions,
+        report_pipeline,
+        outbox,
+        metrics,
+        send_menu,
     )
 
     conv_handler = ConversationHandler(
@@ -217,5 +278,8 @@ def get_send_report_handler(
             ]
         },
         fallbacks=[],
+        # With persistence, a restart does not drop chats halfway through
+        name="send_report",
+        persistent=persistent,
     )
     return conv_handler
@@ -1,15 +1,26 @@
-import os
-from typing import Dict, Any, Callable, Union
+from typing import Dict, Any, Callable, Optional, Union, Mapping
 from telegram import Update
-from utils import Config, has_access
-from typeguard import typechecked
+from utils import (
+    Config,
+    BackendClient,
+    SessionStore,
+    AccessCache,
+    OutboundQueue,
+    has_access,
+)
+from utils.typecheck import typechecked
 from telegram.ext import CallbackContext, CommandHandler
-from ..send_menu import send_menu_handler_factory
 
 
 @typechecked
 def start_handler_factory(
-    messages: Dict[str, Any], cfg: Config
+    messages: Mapping[str, Any],
+    cfg: Config,
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
 ) -> Callable[[Update, CallbackContext], None]:
     @typechecked
     def start(update: Update, context: CallbackContext) -> None:
@@ -17,27 +28,34 @@ def start_handler_factory(
             raise TypeError
         user_chat_id: str = str(update.effective_chat.id)
         greeting_message: str
-        api_key: str = os.getenv("X-API-Key", "")
+        api_key: Optional[str] = sessions.get_api_key(update.effective_chat.id)
 
         if user_chat_id == cfg.ADMIN_CHAT_ID:
             greeting_message = messages["start_message_admin"].format(
                 admin_name=cfg.ADMIN_NAME
             )
-        elif has_access(cfg, api_key):
+        elif api_key is not None and has_access(cfg, backend, api_key, access_cache):
             greeting_message = messages["start_message_client"]
         else:
             greeting_message = messages["start_message"]
 
-        context.bot.send_message(
-            chat_id=update.effective_chat.id, text=greeting_message
-        )
-        send_menu_handler = send_menu_handler_factory(cfg)
-        send_menu_handler(update, context)
+        outbox.send(chat_id=update.effective_chat.id, text=greeting_message)
+        send_menu(update, context)
 
     return start
 
 
 @typechecked
-def get_start_handler(cfg: Config, messages: Dict[str, Any]) -> CommandHandler:
-    start_handler = start_handler_factory(messages, cfg)
-    return CommandHandler("start", start_handler)
+def get_start_handler(
+    cfg: Config,
+    messages: Mapping[str, Any],
+    backend: BackendClient,
+    sessions: SessionStore,
+    access_cache: AccessCache,
+    outbox: OutboundQueue,
+    send_menu: Callable[[Update, CallbackContext], None],
+) -> CommandHandler:
+    start_handler = start_handler_factory(
+        messages, cfg, backend, sessions, access_cache, outbox, send_menu
+    )
+    return CommandHandler("start", start_handler, run_async=True)
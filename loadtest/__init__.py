@@ -0,0 +1,5 @@
+from .faults import Faults
+from .fake_server import FakeServer
+from .fake_backend import FakeBackend
+from .fake_openai import FakeOpenAI
+from .fake_telegram import FakeTelegram
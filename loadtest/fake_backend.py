@@ -0,0 +1,138 @@
+import copy
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .fake_server import FakeServer, Reply
+
+PLAN_FIXTURE: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tests",
+    "test_data",
+    "double_swimming_training.json",
+)
+
+# Config setting -> endpoint served for it
+ENDPOINTS: Dict[str, str] = {
+    "PERSONAL_TRAINING_ENDPOINT": "personal_training",
+    "PERSONAL_TRAINING_BULK_ENDPOINT": "personal_training_bulk",
+    "CURRENT_PERSONAL_TRAINING_ENDPOINT": "current_personal_training",
+    "PERSONAL_TRAINING_REPORT": "personal_training_report",
+    "ALLOWED_PERSONAL_TRAINING": "allowed_personal_training",
+    "ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA": "allowed_update_metadata",
+    "UPDATE_PERSONAL_TRAINING_TG_ID": "update_tg_id",
+}
+
+# The bot's own key, for requests not made on behalf of one client
+SERVICE_API_KEY: str = "service"
+
+
+class FakeBackend(FakeServer):
+    """
+    Local stand-in for the backend API, serving the endpoints named in
+    Config. Every API key is allowed except those starting with "denied".
+    A chat's plan comes without its tg_id until the bot assigns it, the
+    current plan metadata is kept per chat, and a second report for the
+    same week is refused with 409. With bulk=False the bulk plan endpoint
+    answers 404, like a backend that does not have it.
+    """
+
+    def __init__(self, *args: Any, bulk: bool = True, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.bulk: bool = bulk
+        with open(PLAN_FIXTURE, encoding="utf-8") as file:
+            self._plan: List[Dict[str, Any]] = json.load(file)["Resources"]
+        self._state_lock: threading.Lock = threading.Lock()
+        self._assigned: Set[int] = set()
+        self.current: Dict[int, Dict[str, Any]] = {}
+        self.reports: Set[Tuple[int, int, int]] = set()
+
+    def env(self) -> Dict[str, str]:
+        """Environment pointing the bot at this backend."""
+        return {
+            "BACKEND_API": self.url,
+            "BACKEND_SERVICE_API_KEY": SERVICE_API_KEY,
+            **ENDPOINTS,
+        }
+
+    def handle(
+        self, method: str, path: str, query: Dict[str, str], body: Optional[Any]
+    ) -> Reply:
+        endpoint: str = path.rsplit("/", 1)[-1]
+        route = (method, endpoint)
+        if route == ("GET", ENDPOINTS["ALLOWED_PERSONAL_TRAINING"]):
+            if query.get("api_key", "").startswith("denied"):
+                return 403, {"detail": "Forbidden"}
+            return 200, {"Resources": [{"Allowed": True}]}
+        if route == ("PUT", ENDPOINTS["ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA"]):
+            return 200, {}
+        if route == ("GET", ENDPOINTS["PERSONAL_TRAINING_ENDPOINT"]):
+            return 200, {
+                "Resources": self._plan_for(
+                    int(query["tg_id"]), int(query["year"]), int(query["week"])
+                )
+            }
+        if (
+            route == ("POST", ENDPOINTS["PERSONAL_TRAINING_BULK_ENDPOINT"])
+            and self.bulk
+        ):
+            return 200, {
+                "Resources": [
+                    {
+                        "TgId": item["TgId"],
+                        "Year": item["Year"],
+                        "Week": item["Week"],
+                        "Status": 200,
+                        "Resources": self._plan_for(
+                            item["TgId"], item["Year"], item["Week"]
+                        ),
+                    }
+                    for item in body["Resources"]
+                ]
+            }
+        if route == ("PUT", ENDPOINTS["UPDATE_PERSONAL_TRAINING_TG_ID"]):
+            with self._state_lock:
+                self._assigned.add(int(query["tg_id"]))
+            return 200, {}
+        if endpoint == ENDPOINTS["CURRENT_PERSONAL_TRAINING_ENDPOINT"]:
+            return self._current(method, query, body)
+        if route == ("POST", ENDPOINTS["PERSONAL_TRAINING_REPORT"]):
+            key = (body["TgId"], body["Year"], body["Week"])
+            with self._state_lock:
+                if key in self.reports:
+                    return 409, {"detail": "Report already exists"}
+                self.reports.add(key)
+            return 201, body
+        return 404, {"detail": "Not Found"}
+
+    def _plan_for(self, tg_id: int, year: int, week: int) -> List[Dict[str, Any]]:
+        with self._state_lock:
+            assigned: bool = tg_id in self._assigned
+        plan: List[Dict[str, Any]] = copy.deepcopy(self._plan)
+        for day in plan:
+            day.update(
+                TgId=tg_id if assigned else 0,
+                Year=year,
+                Week=week,
+            )
+        return plan
+
+    def _current(
+        self, method: str, query: Dict[str, str], body: Optional[Any]
+    ) -> Reply:
+        tg_id: int = int(query["tg_id"]) if "tg_id" in query else body["TgId"]
+        with self._state_lock:
+            if method == "GET":
+                if tg_id not in self.current:
+                    return 404, {"detail": "Not Found"}
+                return 200, {"Resources": [self.current[tg_id]]}
+            if method == "DELETE":
+                if self.current.pop(tg_id, None) is None:
+                    return 404, {"detail": "Not Found"}
+                return 204, None
+            if method in ("POST", "PUT"):
+                is_new: bool = tg_id not in self.current
+                self.current[tg_id] = body
+                return (201 if is_new else 200), body
+        return 405, {"detail": "Method Not Allowed"}
@@ -0,0 +1,40 @@
+import json
+from typing import Any, Dict, Optional
+
+from .fake_server import FakeServer, Reply
+
+# What the system prompt asks the model for
+REPORT: Dict[str, Any] = {
+    "isInjured": False,
+    "allDaysDone": True,
+    "allExercisesDone": False,
+    "ProblematicExercises": ["Кроль 4x50"],
+    "Comments": "Устал к концу недели",
+}
+
+
+class FakeOpenAI(FakeServer):
+    """Local stand-in for the chat completions endpoint; always returns REPORT."""
+
+    @property
+    def completions_url(self) -> str:
+        """Value for OPENAI_API_URL."""
+        return f"{self.url}/v1/chat/completions"
+
+    def handle(
+        self, method: str, path: str, query: Dict[str, str], body: Optional[Any]
+    ) -> Reply:
+        if (method, path) != ("POST", "/v1/chat/completions"):
+            return 404, {"error": {"message": "Not Found"}}
+        return 200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": body.get("model", ""),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(REPORT)},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
@@ -0,0 +1,82 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .faults import Faults
+
+# (status, JSON body or None for an empty one)
+Reply = Tuple[int, Optional[Any]]
+
+
+class FakeServer:
+    """
+    Base of the local JSON stand-ins: serves every method on a threaded
+    HTTP server, applies the fault injection and hands the parsed request
+    to handle().
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, faults: Optional[Faults] = None
+    ) -> None:
+        self.faults: Faults = faults or Faults()
+        self.requests: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(
+        self, method: str, path: str, query: Dict[str, str], body: Optional[Any]
+    ) -> Reply:
+        raise NotImplementedError
+
+    def _dispatch(
+        self, method: str, path: str, query: Dict[str, str], body: Optional[Any]
+    ) -> Reply:
+        with self._lock:
+            self.requests += 1
+        error: Optional[int] = self.faults.apply()
+        if error is not None:
+            return error, {"detail": "Injected error"}
+        return self.handle(method, path, query, body)
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _route(self) -> None:
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, payload = fake._dispatch(self.command, url.path, query, body)
+                data = b"" if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _route
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
@@ -0,0 +1,265 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.request import Request, urlopen
+
+from .faults import Faults
+
+# Methods the fault injection applies to; polling and setup are left alone
+FAULTY_METHODS = frozenset({"sendMessage", "answerCallbackQuery"})
+
+
+class FakeTelegram:
+    """
+    Local stand-in for the Telegram Bot API.
+
+    Serves the bot methods used by the handlers, records every message the
+    bot sends and feeds updates to it, either by POSTing them to the
+    registered webhook or through getUpdates long polling. With `faults`,
+    sends are delayed and a share of them fails, a 429 with retry_after.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, faults: Optional[Faults] = None
+    ) -> None:
+        self.webhook_url: str = ""
+        self.faults: Faults = faults or Faults()
+        self.sent: List[Dict[str, Any]] = []
+        self._sent_by_chat: Dict[int, List[Dict[str, Any]]] = {}
+        # Bot API method -> monotonic times it was called at
+        self.calls: Dict[str, List[float]] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """Value for Updater(base_url=...)."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> "FakeTelegram":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---------------------------------------
+    # ------- Feeding updates ---------------
+    # ---------------------------------------
+
+    def post_update(self, update: Dict[str, Any]) -> None:
+        update = {"update_id": next(self._update_ids), **update}
+        if self.webhook_url:
+            request = Request(
+                self.webhook_url,
+                data=json.dumps(update).encode(),
+                headers={"Content-Type": "application/json"},
+            )
+            with urlopen(request, timeout=10) as response:
+                response.read()
+            return
+        with self._condition:
+            self._updates.append(update)
+            self._condition.notify_all()
+
+    def post_message(self, chat_id: int, text: str) -> None:
+        self.post_update({"message": self._message(chat_id, text)})
+
+    def post_callback_query(self, chat_id: int, data: str) -> None:
+        self.post_update(
+            {
+                "callback_query": {
+                    "id": str(next(self._message_ids)),
+                    "chat_instance": str(chat_id),
+                    "data": data,
+                    "from": self._user(chat_id),
+                    "message": self._message(chat_id, "Выберите опцию:"),
+                }
+            }
+        )
+
+    # ---------------------------------------
+    # ------- Inspecting the bot output -----
+    # ---------------------------------------
+
+    def messages_to(self, chat_id: int) -> List[Dict[str, Any]]:
+        with self._condition:
+            return list(self._sent_by_chat.get(chat_id, []))
+
+    def wait_for_message(
+        self,
+        chat_id: int,
+        after: int,
+        predicate: Callable[[Dict[str, Any]], bool] = lambda message: True,
+        timeout: float = 10.0,
+    ) -> Optional[int]:
+        """
+        Index, among the messages to `chat_id`, of the first one from index
+        `after` on that matches `predicate`; None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                messages = self._sent_by_chat.get(chat_id, [])
+                for index in range(after, len(messages)):
+                    if predicate(messages[index]):
+                        return index
+                after = max(after, len(messages))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def wait_for_call(self, method: str, timeout: float = 10.0) -> Optional[float]:
+        """Time of the first call of a Bot API method, None on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not self.calls.get(method):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self.calls[method][0]
+
+    def wait_for_messages(
+        self, chat_id: int, count: int, timeout: float = 10.0
+    ) -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                messages = self._sent_by_chat.get(chat_id, [])
+                remaining = deadline - time.monotonic()
+                if len(messages) >= count or remaining <= 0:
+                    return list(messages)
+                self._condition.wait(remaining)
+
+    # ---------------------------------------
+    # ------- Bot API methods ---------------
+    # ---------------------------------------
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Any:
+        with self._condition:
+            self.calls.setdefault(method, []).append(time.monotonic())
+            self._condition.notify_all()
+        if method == "getMe":
+            return self._user(1, is_bot=True)
+        if method == "setWebhook":
+            self.webhook_url = params["url"]
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+            return True
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            message: Dict[str, Any] = {
+                "chat_id": chat_id,
+                "text": params["text"],
+                "reply_markup": params.get("reply_markup"),
+                "time": time.monotonic(),
+            }
+            with self._condition:
+                self.sent.append(message)
+                self._sent_by_chat.setdefault(chat_id, []).append(message)
+                self._condition.notify_all()
+            return self._message(chat_id, params["text"])
+        if method == "answerCallbackQuery":
+            return True
+        raise KeyError(method)
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self._condition:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            return list(self._updates)
+
+    def _message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        message: Dict[str, Any] = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command_length = len(text.split(maxsplit=1)[0])
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": command_length}
+            ]
+        return message
+
+    @staticmethod
+    def _error(status: int) -> Dict[str, Any]:
+        if status == 429:
+            return {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }
+        return {"ok": False, "error_code": status, "description": "Injected error"}
+
+    @staticmethod
+    def _user(user_id: int, is_bot: bool = False) -> Dict[str, Any]:
+        return {
+            "id": user_id,
+            "is_bot": is_bot,
+            "first_name": "bot" if is_bot else "user",
+            "username": "bot" if is_bot else f"user{user_id}",
+        }
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b"{}"
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                error = fake.faults.apply() if method in FAULTY_METHODS else None
+                if error is not None:
+                    self._reply(error, fake._error(error))
+                    return
+                try:
+                    result = fake._call(method, json.loads(body or b"{}"))
+                    payload = {"ok": True, "result": result}
+                    status = 200
+                except KeyError:
+                    payload = {
+                        "ok": False,
+                        "error_code": 404,
+                        "description": "Not Found",
+                    }
+                    status = 404
+                self._reply(status, payload)
+
+            do_GET = do_POST
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
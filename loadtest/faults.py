@@ -0,0 +1,39 @@
+import random
+import threading
+import time
+from typing import Optional
+
+
+class Faults:
+    """
+    Latency and error injection for the fake servers: every call waits
+    `latency` plus up to `jitter` seconds, and a share `error_rate` of the
+    calls fails with `error_status`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.error_status: int = error_status
+        self._random: random.Random = random.Random(seed)
+        self._lock: threading.Lock = threading.Lock()
+        self.injected: int = 0
+
+    def apply(self) -> Optional[int]:
+        """Sleeps for the injected latency; returns an error status or None."""
+        with self._lock:
+            delay: float = self.latency + self._random.uniform(0.0, self.jitter)
+            failed: bool = self._random.random() < self.error_rate
+            if failed:
+                self.injected += 1
+        if delay > 0:
+            time.sleep(delay)
+        return self.error_status if failed else None
@@ -0,0 +1,242 @@
+"""
+Load test of the whole bot against local stand-ins.
+
+Starts FakeTelegram, FakeBackend and FakeOpenAI, spawns `python main.py`
+pointed at them, and has N simulated users click through
+start -> authorize -> get plan -> send report concurrently. Reports the
+throughput and the p50/p95/p99 latency of every step, measured from
+posting the update to the bot's last reply for it.
+
+    python -m loadtest.run --users 50 --rounds 3
+    python -m loadtest.run --users 20 --backend-latency 0.2 --backend-errors 0.05
+    python -m loadtest.run --telegram-errors 0.1 --telegram-error-status 429
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .fake_backend import FakeBackend
+from .fake_openai import FakeOpenAI
+from .fake_telegram import FakeTelegram
+from .faults import Faults
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_CHAT_ID: int = 100_000
+
+Message = Dict[str, Any]
+
+
+def _any(message: Message) -> bool:
+    return True
+
+
+def _menu(message: Message) -> bool:
+    # Every step that ends a flow ends with the menu keyboard
+    return bool(message.get("reply_markup"))
+
+
+# (step, post the update, reply that completes the step)
+Step = Tuple[str, Callable[[FakeTelegram, int], None], Callable[[Message], bool]]
+STEPS: List[Step] = [
+    ("start", lambda tg, chat: tg.post_message(chat, "/start"), _menu),
+    ("authorize", lambda tg, chat: tg.post_callback_query(chat, "get_token"), _any),
+    ("api_key", lambda tg, chat: tg.post_message(chat, f"key-{chat}"), _menu),
+    (
+        "get_plan",
+        lambda tg, chat: tg.post_callback_query(chat, "get_personal_training"),
+        _menu,
+    ),
+    ("report", lambda tg, chat: tg.post_callback_query(chat, "send_report"), _any),
+    (
+        "report_text",
+        lambda tg, chat: tg.post_message(chat, "Всё сделал, устал на кроле"),
+        _menu,
+    ),
+]
+
+
+class Results:
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {name: [] for name, _, _ in STEPS}
+        self.timeouts: Dict[str, int] = {name: 0 for name, _, _ in STEPS}
+        self.flows: int = 0
+
+    def record(self, step: str, latency: Optional[float]) -> None:
+        with self._lock:
+            if latency is None:
+                self.timeouts[step] += 1
+            else:
+                self.latencies[step].append(latency)
+
+    def flow_done(self) -> None:
+        with self._lock:
+            self.flows += 1
+
+
+def simulate_user(
+    telegram: FakeTelegram, chat_id: int, rounds: int, timeout: float, results: Results
+) -> None:
+    for _ in range(rounds):
+        for name, post, is_reply in STEPS:
+            seen: int = len(telegram.messages_to(chat_id))
+            started: float = time.monotonic()
+            post(telegram, chat_id)
+            index: Optional[int] = telegram.wait_for_message(
+                chat_id, seen, is_reply, timeout
+            )
+            if index is None:
+                results.record(name, None)
+                return  # The conversation is in an unknown state
+            reply_time: float = telegram.messages_to(chat_id)[index]["time"]
+            results.record(name, reply_time - started)
+        results.flow_done()
+
+
+def percentiles(values: List[float]) -> Tuple[float, float, float]:
+    if len(values) < 2:
+        value: float = values[0] if values else float("nan")
+        return value, value, value
+    cuts: List[float] = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def report(results: Results, elapsed: float, servers: Dict[str, Any]) -> None:
+    updates: int = sum(len(values) for values in results.latencies.values())
+    print(
+        f"{results.flows} flows, {updates} updates in {elapsed:.1f} s: "
+        f"{results.flows / elapsed:.2f} flows/s, {updates / elapsed:.1f} updates/s"
+    )
+    print(
+        f"{'step':<12} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'lost':>5}"
+    )
+    every: List[float] = []
+    for name, _, _ in STEPS:
+        values: List[float] = results.latencies[name]
+        every.extend(values)
+        p50, p95, p99 = percentiles(values)
+        print(
+            f"{name:<12} {len(values):>6} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} "
+            f"{p99 * 1000:>9.1f} {results.timeouts[name]:>5}"
+        )
+    p50, p95, p99 = percentiles(every)
+    print(
+        f"{'all':<12} {len(every):>6} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} "
+        f"{p99 * 1000:>9.1f} {sum(results.timeouts.values()):>5}"
+    )
+    for name, server in servers.items():
+        calls: str = (
+            f"{len(server.sent)} messages sent"
+            if isinstance(server, FakeTelegram)
+            else f"{server.requests} requests"
+        )
+        print(f"{name}: {calls}, {server.faults.injected} injected errors")
+
+
+def bot_env(
+    telegram: FakeTelegram, backend: FakeBackend, openai: FakeOpenAI, run_dir: str
+) -> Dict[str, str]:
+    """Environment of the bot under test; its logs and traces go to `run_dir`."""
+    env: Dict[str, str] = {
+        "LIUBA_TELEGRAM_TOKEN": "123:abc",
+        "ADMIN_NAME": "admin",
+        "ADMIN_CHAT_ID": "1",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "RUNTIME_PROFILE": "production",
+        "METRICS_PORT": "0",
+        **os.environ,
+    }
+    env.update(
+        UPDATES_MODE="polling",
+        TELEGRAM_API_URL=telegram.base_url,
+        OPENAI_API_URL=openai.completions_url,
+        LOG_DIR=run_dir,
+        TRACE_PATH=os.path.join(run_dir, "traces.jsonl"),
+        **backend.env(),
+    )
+    return env
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=1, help="flows per user")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per step")
+    for server in ("backend", "telegram", "openai"):
+        parser.add_argument(f"--{server}-latency", type=float, default=0.0)
+        parser.add_argument(f"--{server}-jitter", type=float, default=0.0)
+        parser.add_argument(f"--{server}-errors", type=float, default=0.0)
+        parser.add_argument(
+            f"--{server}-error-status",
+            type=int,
+            default=429 if server == "telegram" else 500,
+        )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    def faults(server: str) -> Faults:
+        options = vars(args)
+        return Faults(
+            latency=options[f"{server}_latency"],
+            jitter=options[f"{server}_jitter"],
+            error_rate=options[f"{server}_errors"],
+            error_status=options[f"{server}_error_status"],
+            seed=args.seed,
+        )
+
+    telegram = FakeTelegram(faults=faults("telegram")).start()
+    backend = FakeBackend(faults=faults("backend")).start()
+    openai = FakeOpenAI(faults=faults("openai")).start()
+    # Kept after the run, so that the bot's logs can be looked at
+    run_dir: str = tempfile.mkdtemp(prefix="loadtest-")
+    print(f"Bot logs and traces: {run_dir}")
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=ROOT,
+        env=bot_env(telegram, backend, openai, run_dir),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        if telegram.wait_for_call("getUpdates", timeout=30) is None:
+            print(f"main.py never polled, see {run_dir}")
+            return 1
+        results: Results = Results()
+        users: List[threading.Thread] = [
+            threading.Thread(
+                target=simulate_user,
+                args=(telegram, FIRST_CHAT_ID + i, args.rounds, args.timeout, results),
+                daemon=True,
+            )
+            for i in range(args.users)
+        ]
+        started: float = time.monotonic()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        report(
+            results,
+            time.monotonic() - started,
+            {"telegram": telegram, "backend": backend, "openai": openai},
+        )
+        return 0 if not any(results.timeouts.values()) else 2
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        for server in (telegram, backend, openai):
+            server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
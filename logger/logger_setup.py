@@ -1,17 +1,66 @@
+import atexit
+import gzip
 import os
-import logging.config
+import queue
+import shutil
+import logging
+import logging.handlers
 from utils import Config
 
+LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _file_handler(
+    config: Config, log_path: str
+) -> logging.handlers.BaseRotatingHandler:
+    handler: logging.handlers.BaseRotatingHandler
+    if config.LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_path,
+            when=config.LOG_ROTATE_WHEN,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_path,
+            maxBytes=config.LOG_MAX_BYTES,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    # Rotated files are compressed; this runs on the listener thread
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
 
 def init_logger(config: Config):
+    """
+    Routes all logging through a queue: records are only put on the queue
+    by the calling thread, and a single listener thread formats them and
+    writes, rotates and compresses the log file. The listener is stopped,
+    and the queue drained, at exit.
+    """
     if not os.path.exists(config.LOG_DIR):
         os.makedirs(config.LOG_DIR)
 
     log_path: str = os.path.join(config.LOG_DIR, config.LOG_FILE_NAME)
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[logging.FileHandler(log_path, "a", "utf-8")],
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, _file_handler(config, log_path), respect_handler_level=True
     )
+    root = logging.getLogger()
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+
     logger = logging.getLogger(__name__)
     return logger
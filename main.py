@@ -1,14 +1,43 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Dict, Any
+from typing import Callable, Optional
 
+import pytz
+import tzlocal
+
+from telegram import Update
 from telegram.ext import (
+    CallbackContext,
     Updater,
     CallbackQueryHandler,
     ConversationHandler,
     CommandHandler,
 )
-from utils import Config, Commands, Prompts
-from dotenv import load_dotenv
+from utils import (
+    Config,
+    Commands,
+    Prompts,
+    BackendClient,
+    AccessCache,
+    SessionStore,
+    PlanCache,
+    MetadataCache,
+    BatchPlanClient,
+    ReportPipeline,
+    OutboundQueue,
+    Broadcaster,
+    MessageCatalog,
+    Metrics,
+    MetricsServer,
+    SQLitePersistence,
+    Tracer,
+    instrument_handler,
+    next_week,
+    prefetch_plans,
+    fetch_calender_week,
+    fetch_current_year,
+)
 from container import Container
 from handlers import (
     get_start_handler,
@@ -17,52 +46,239 @@ from handlers import (
     get_training_plan_conversation_handler,
     get_send_report_handler,
     get_authorize_handler,
+    send_menu_handler_factory,
+    get_broadcast_handler,
 )
 
 
+def start_receiving_updates(updater: Updater, cfg: Config, logger: Logger) -> None:
+    if cfg.UPDATES_MODE == "webhook":
+        # Telegram pushes updates to WEBHOOK_URL/WEBHOOK_PATH, which should be
+        # proxied to the embedded tornado server on WEBHOOK_LISTEN:WEBHOOK_PORT
+        webhook_url: str = f"{cfg.WEBHOOK_URL}/{cfg.WEBHOOK_PATH}"
+        logger.info(
+            "Starting the bot's webhook on %s:%s...",
+            cfg.WEBHOOK_LISTEN,
+            cfg.WEBHOOK_PORT,
+        )
+        updater.start_webhook(
+            listen=cfg.WEBHOOK_LISTEN,
+            port=cfg.WEBHOOK_PORT,
+            url_path=cfg.WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        logger.info("Starting the bot's polling...")
+        updater.start_polling(poll_interval=cfg.POLL_INTERVAL, timeout=cfg.POLL_TIMEOUT)
+
+
+def start_metrics_server(
+    metrics: Metrics,
+    cfg: Config,
+    logger: Logger,
+    outbox: OutboundQueue,
+    report_pipeline: ReportPipeline,
+) -> Optional[MetricsServer]:
+    if cfg.METRICS_PORT == 0:
+        return None
+    metrics.gauge_callback("bot_outbox_depth", outbox.depth)
+    metrics.gauge_callback("bot_report_pipeline_in_flight", report_pipeline.in_flight)
+    try:
+        server: MetricsServer = MetricsServer(
+            metrics, cfg.METRICS_LISTEN, cfg.METRICS_PORT
+        )
+    except OSError as e:  # Metrics are not worth failing startup for
+        logger.error(
+            "Cannot serve metrics on %s:%s: %s", cfg.METRICS_LISTEN, cfg.METRICS_PORT, e
+        )
+        return None
+    logger.info("Serving metrics on %s:%s/metrics", cfg.METRICS_LISTEN, server.port)
+    return server
+
+
+def schedule_prefetch(
+    updater: Updater,
+    cfg: Config,
+    logger: Logger,
+    plans: BatchPlanClient,
+    sessions: SessionStore,
+    plan_cache: PlanCache,
+) -> None:
+    """Prefetches next week's plans before the week rolls over."""
+
+    def prefetch_next_week(context: CallbackContext) -> None:
+        year, week = next_week()
+        prefetch_plans(
+            logger,
+            plans,
+            sessions,
+            plan_cache,
+            year,
+            week,
+            cfg.PREFETCH_CONCURRENCY,
+        )
+
+    # APScheduler only takes pytz zones; the default is the server's, which
+    # is also what fetch_calender_week() goes by
+    zone = pytz.timezone(cfg.PREFETCH_TIMEZONE or tzlocal.get_localzone_name())
+    updater.job_queue.run_daily(
+        prefetch_next_week,
+        time=datetime.time.fromisoformat(cfg.PREFETCH_TIME).replace(tzinfo=zone),
+        days=(cfg.PREFETCH_DAY,),
+        name="prefetch_next_week",
+    )
+
+
+def schedule_broadcast(updater: Updater, cfg: Config, broadcaster: Broadcaster) -> None:
+    """Pushes the week's plan to every chat once the week has started."""
+
+    def broadcast_week(context: CallbackContext) -> None:
+        broadcaster.start(fetch_current_year(), fetch_calender_week())
+
+    zone = pytz.timezone(cfg.BROADCAST_TIMEZONE or tzlocal.get_localzone_name())
+    updater.job_queue.run_daily(
+        broadcast_week,
+        time=datetime.time.fromisoformat(cfg.BROADCAST_TIME).replace(tzinfo=zone),
+        days=(cfg.BROADCAST_DAY,),
+        name="broadcast_week",
+    )
+
+
 def main() -> None:
-    load_dotenv()
     container: Container = Container()
     cfg: Config = container.config()
     commands: Commands = container.commands()
     prompts: Prompts = container.prompts()
-    messages: Dict[str, Any] = container.messages()
+    messages: MessageCatalog = container.messages()
     logger: Logger = container.logger()
+    backend: BackendClient = container.backend_client()
+    access_cache: AccessCache = container.access_cache()
+    sessions: SessionStore = container.sessions()
+    plan_cache: PlanCache = container.plan_cache()
+    plans: BatchPlanClient = container.plan_client()
+    metadata_cache: MetadataCache = container.metadata_cache()
+    executor: ThreadPoolExecutor = container.background_executor()
+    report_pipeline: ReportPipeline = container.report_pipeline()
+    outbox: OutboundQueue = container.outbox()
+    metrics: Metrics = container.metrics()
+    tracer: Tracer = container.tracer()
+    broadcaster: Broadcaster = container.broadcaster()
 
     updater: Updater = container.updater()
     dispatcher = updater.dispatcher
+    persistence: Optional[SQLitePersistence] = container.persistence()
 
-    start_handler: CommandHandler = get_start_handler(cfg, messages)
-    send_menu_command_handler: CommandHandler = get_send_menu_handler(cfg)
+    # One menu handler is shared by every handler that shows the menu
+    send_menu: Callable[[Update, CallbackContext], None] = send_menu_handler_factory(
+        cfg, backend, sessions, access_cache, outbox
+    )
+    start_handler: CommandHandler = get_start_handler(
+        cfg, messages, backend, sessions, access_cache, outbox, send_menu
+    )
+    send_menu_command_handler: CommandHandler = get_send_menu_handler(send_menu)
     personal_training_handler: CommandHandler = get_training_plan_conversation_handler(
         cfg,
         logger,
         messages,
+        backend,
+        sessions,
+        access_cache,
+        plan_cache,
+        metadata_cache,
+        executor,
+        outbox,
+        send_menu,
     )
     query_handler: CallbackQueryHandler = get_callback_query_handler(
-        cfg, logger, messages
+        cfg,
+        logger,
+        messages,
+        backend,
+        sessions,
+        access_cache,
+        plan_cache,
+        metadata_cache,
+        executor,
+        outbox,
+        send_menu,
     )
 
     send_report_handler: ConversationHandler = get_send_report_handler(
-        cfg, prompts, logger, messages
+        cfg,
+        prompts,
+        logger,
+        messages,
+        backend,
+        sessions,
+        report_pipeline,
+        outbox,
+        metrics,
+        send_menu,
+        persistent=persistence is not None,
     )
     authorize_handler: ConversationHandler = get_authorize_handler(
-        cfg, logger, messages
+        cfg,
+        logger,
+        messages,
+        backend,
+        sessions,
+        access_cache,
+        outbox,
+        send_menu,
+        persistent=persistence is not None,
+    )
+    broadcast_handler: CommandHandler = get_broadcast_handler(
+        cfg, messages, broadcaster, outbox
     )
 
-    dispatcher.add_handler(start_handler)
-    dispatcher.add_handler(personal_training_handler)
-    dispatcher.add_handler(send_report_handler)
-    dispatcher.add_handler(authorize_handler)
-    dispatcher.add_handler(send_menu_command_handler)
-    dispatcher.add_handler(query_handler)
+    for handler in (
+        start_handler,
+        personal_training_handler,
+        send_report_handler,
+        authorize_handler,
+        send_menu_command_handler,
+        broadcast_handler,
+        query_handler,
+    ):
+        dispatcher.add_handler(instrument_handler(handler, metrics, tracer))
 
     logger: Logger = container.logger()
-    logger.info("Starting the bot's polling...")
-    updater.start_polling()
+    if cfg.MESSAGES_RELOAD_INTERVAL > 0:
+        updater.job_queue.run_repeating(
+            lambda context: messages.reload_if_changed(),
+            interval=cfg.MESSAGES_RELOAD_INTERVAL,
+            name="reload_messages",
+        )
+    if cfg.PREFETCH_ENABLED:
+        schedule_prefetch(updater, cfg, logger, plans, sessions, plan_cache)
+    if cfg.BROADCAST_ENABLED:
+        schedule_broadcast(updater, cfg, broadcaster)
+    # A broadcast of this week cut short by a crash or restart goes on
+    broadcaster.resume(fetch_current_year(), fetch_calender_week())
+    metrics_server: Optional[MetricsServer] = start_metrics_server(
+        metrics, cfg, logger, outbox, report_pipeline
+    )
+    start_receiving_updates(updater, cfg, logger)
 
     logger.info("Bot is now in idle state.")
     updater.idle()
+    logger.info("Access cache stats: %s", access_cache.stats())
+    logger.info("Session store stats: %s", sessions.stats())
+    logger.info("Plan cache stats: %s", plan_cache.stats())
+    logger.info("Metadata cache stats: %s", metadata_cache.stats())
+    broadcaster.close()
+    report_pipeline.shutdown(wait=True)
+    executor.shutdown(wait=True)
+    if persistence is not None:
+        persistence.close()
+    outbox.close()
+    logger.info("Outbound queue stats: %s", outbox.stats())
+    if metrics_server is not None:
+        metrics_server.close()
+    tracer.close()
+    sessions.close()
+    backend.close()
 
 
 if __name__ == "__main__":
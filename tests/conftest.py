@@ -0,0 +1,74 @@
+import os
+
+# Tests always run with runtime type checking, whatever the environment says;
+# set before anything below imports utils
+os.environ["RUNTIME_PROFILE"] = "strict"
+
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import pytest
+from telegram import Bot
+from telegram.error import TimedOut, Unauthorized
+
+from loadtest import FakeBackend
+
+
+class RecordingBot(Bot):
+    """
+    Records sends instead of calling Telegram. Sends wait for `release`;
+    `errors` are raised by the next sends in turn, chats in `blocked` have
+    blocked the bot, and a send to a chat in `flaky` times out once.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(token="123:abc")
+        self.sent: List[Dict[str, Any]] = []
+        self.errors: List[Exception] = []
+        self.blocked: Set[int] = set()
+        self.flaky: Set[int] = set()
+        self.release: threading.Event = threading.Event()
+        self.release.set()
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.release.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        if chat_id in self.blocked:
+            raise Unauthorized("Forbidden: bot was blocked by the user")
+        if chat_id in self.flaky:
+            self.flaky.discard(chat_id)
+            raise TimedOut()
+        self.sent.append(
+            {
+                "chat_id": chat_id,
+                "text": text,
+                "reply_markup": reply_markup,
+                "time": time.monotonic(),
+            }
+        )
+
+    def texts(self, chat_id: Optional[int] = None) -> List[str]:
+        """Texts sent, to `chat_id` only if given."""
+        return [
+            message["text"]
+            for message in self.sent
+            if chat_id is None or message["chat_id"] == chat_id
+        ]
+
+
+@pytest.fixture
+def bot() -> RecordingBot:
+    return RecordingBot()
+
+
+@pytest.fixture
+def fake_backend(request) -> Iterator[FakeBackend]:
+    """
+    A running FakeBackend. Parametrize it indirectly with another factory,
+    e.g. a subclass, to change how it answers.
+    """
+    backend: FakeBackend = getattr(request, "param", FakeBackend)().start()
+    yield backend
+    backend.stop()
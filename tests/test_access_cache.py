@@ -0,0 +1,68 @@
+import logging
+import time
+from typing import Any, List
+
+import httpx
+import pytest
+
+from utils import AccessCache, BackendClient, Config, has_access
+
+
+class _StubBackend(BackendClient):
+    def __init__(self, cfg: Config, status_code: int) -> None:
+        super().__init__(cfg, logging.getLogger(__name__))
+        self.status_code = status_code
+        self.calls: List[str] = []
+
+    def request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        self.calls.append(endpoint)
+        return httpx.Response(
+            self.status_code,
+            json={"Resources": [{"Allowed": True}]},
+            request=httpx.Request(method, self.url(endpoint)),
+        )
+
+
+@pytest.fixture
+def config() -> Config:
+    return Config()
+
+
+def test_counts_hits_and_misses():
+    cache = AccessCache(maxsize=8, ttl=60)
+    assert cache.get("token") is None
+    cache.set("token", True)
+    assert cache.get("token") is True
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_entries_expire_after_ttl():
+    cache = AccessCache(maxsize=8, ttl=0.05)
+    cache.set("token", True)
+    time.sleep(0.1)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AccessCache(maxsize=2, ttl=60)
+    cache.set("a", True)
+    cache.set("b", True)
+    cache.get("a")
+    cache.set("c", False)
+    assert cache.get("b") is None
+    assert cache.get("a") is True
+
+
+def test_has_access_serves_repeat_lookups_from_cache(config):
+    backend = _StubBackend(config, status_code=200)
+    cache = AccessCache(maxsize=8, ttl=60)
+    assert has_access(config, backend, "token", cache)
+    assert has_access(config, backend, "token", cache)
+    assert len(backend.calls) == 1
+
+
+def test_has_access_does_not_cache_forbidden_token(config):
+    backend = _StubBackend(config, status_code=403)
+    cache = AccessCache(maxsize=8, ttl=60)
+    assert not has_access(config, backend, "token", cache)
+    assert cache.get("token") is None
@@ -0,0 +1,56 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from utils import BackendClient, Config
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers: List[Tuple[str, int]] = []
+
+    def do_GET(self) -> None:
+        self.peers.append(self.client_address)
+        body = b'{"Resources": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def backend_url() -> Iterator[str]:
+    _RecordingHandler.peers = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RecordingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def backend(backend_url) -> Iterator[BackendClient]:
+    cfg: Config = Config(BACKEND_API=backend_url)
+    client = BackendClient(cfg, logging.getLogger(__name__))
+    yield client
+    client.close()
+
+
+def test_url_joins_version_and_endpoint(backend, backend_url):
+    assert backend.url("plans") == f"{backend_url}/v1/plans"
+
+
+def test_consecutive_requests_reuse_connection(backend):
+    for _ in range(3):
+        response = backend.get("plans", params={"tg_id": 1})
+        assert response.status_code == 200
+    assert len(_RecordingHandler.peers) == 3
+    assert len(set(_RecordingHandler.peers)) == 1
@@ -0,0 +1,31 @@
+from benchmarks.formatters import SCENARIOS, build_week, compare
+from utils import convert_json_to_human_readable
+
+
+def test_build_week_spreads_exercises_over_days():
+    week = build_week(days=3, exercises=20, kind="mixed")
+    assert [day["Day"] for day in week] == [1, 2, 3]
+    assert [len(day["Exercises"]) for day in week] == [7, 7, 6]
+    assert [day["trainingType"] for day in week] == ["fitness", "swimming", "fitness"]
+    assert all(day["TotalNumberExercises"] == len(day["Exercises"]) for day in week)
+
+
+def test_all_scenarios_render():
+    for scenario in SCENARIOS:
+        week = build_week(scenario.days, scenario.exercises, scenario.kind)
+        rendered: str = convert_json_to_human_readable(week)
+        assert f"День {scenario.days}" in rendered
+
+
+def test_compare_flags_slower_and_bigger_renders():
+    baseline = {
+        "week/x": {"ops_per_sec": 1, "relative_speed": 1.0, "alloc_peak_kib": 100}
+    }
+    faster = {"week/x": {"ops_per_sec": 1, "relative_speed": 1.5, "alloc_peak_kib": 90}}
+    slower = {"week/x": {"ops_per_sec": 1, "relative_speed": 0.5, "alloc_peak_kib": 90}}
+    bigger = {
+        "week/x": {"ops_per_sec": 1, "relative_speed": 1.0, "alloc_peak_kib": 150}
+    }
+    assert compare(faster, baseline, tolerance=0.3, alloc_tolerance=0.1) == []
+    assert len(compare(slower, baseline, tolerance=0.3, alloc_tolerance=0.1)) == 1
+    assert len(compare(bigger, baseline, tolerance=0.3, alloc_tolerance=0.1)) == 1
@@ -0,0 +1,143 @@
+import logging
+import time
+from typing import Any
+
+from telegram import Bot
+
+from loadtest import FakeBackend
+from loadtest.fake_backend import ENDPOINTS
+from utils import (
+    BackendClient,
+    BatchPlanClient,
+    Broadcaster,
+    Config,
+    MessageCatalog,
+    OutboundQueue,
+    PlanCache,
+    SessionStore,
+)
+
+from .conftest import RecordingBot
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def _broadcaster(
+    fake: FakeBackend, outbox: OutboundQueue, **kwargs: Any
+) -> Broadcaster:
+    cfg = Config(BACKEND_API=fake.url, **ENDPOINTS)
+    sessions = SessionStore(maxsize=8, ttl=60)
+    sessions.set_api_key(1001, "key-1")
+    sessions.set_api_key(1002, "key-2")
+    return Broadcaster(
+        cfg,
+        LOGGER,
+        MessageCatalog("messages/messages.json", LOGGER),
+        BatchPlanClient(cfg, LOGGER, BackendClient(cfg, LOGGER)),
+        sessions,
+        PlanCache(maxsize=8, ttl=60),
+        outbox,
+        workers=2,
+        batch_size=1,
+        rate=100.0,
+        **kwargs,
+    )
+
+
+def _outbox(bot: Bot) -> OutboundQueue:
+    return OutboundQueue(bot, LOGGER, chat_rate=100.0, chat_burst=10)
+
+
+def test_broadcast_reports_delivered_and_skipped_chats(bot, fake_backend):
+    bot.blocked.add(1002)
+    outbox = _outbox(bot)
+    broadcaster = _broadcaster(fake_backend, outbox)
+    stats = broadcaster.run(2024, 11)
+    assert broadcaster.finished(2024, 11)
+    broadcaster.close()
+    outbox.close()
+
+    assert (stats["chats"], stats["delivered"], stats["skipped"]) == (2, 1, 1)
+    assert stats["pending"] == stats["failed"] == 0 and stats["per_second"] > 0
+    plan = bot.texts(1001)
+    assert "неделю 11" in plan[0] and "День 1" in "".join(plan)
+    admin_chat_id = int(Config().ADMIN_CHAT_ID)
+    [report] = bot.texts(admin_chat_id)
+    assert "доставлено 1 из 2" in report
+
+
+def test_failed_chats_are_retried_by_the_next_run(bot, fake_backend, tmp_path):
+    path = str(tmp_path / "broadcasts.db")
+    bot.flaky.add(1002)
+    outbox = _outbox(bot)
+    broadcaster = _broadcaster(fake_backend, outbox, path=path)
+    stats = broadcaster.run(2024, 11)
+    assert (stats["delivered"], stats["failed"]) == (1, 1)
+    assert not broadcaster.finished(2024, 11)
+    broadcaster.close()
+
+    again = _broadcaster(fake_backend, outbox, path=path)
+    assert again.resume(2024, 11)
+    deadline = time.monotonic() + 5
+    while again.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert again.progress(2024, 11)["delivered"] == 2
+    assert again.finished(2024, 11)
+    again.close()
+    outbox.close()
+    chats = [m["chat_id"] for m in bot.sent if m["chat_id"] != 1]
+    assert chats.count(1001) == chats.count(1002)  # 1001 got its plan once
+
+
+def test_interrupted_broadcast_resumes_with_pending_chats(bot, fake_backend, tmp_path):
+    path = str(tmp_path / "broadcasts.db")
+    stuck = RecordingBot()
+    stuck.release.clear()  # Telegram never answers, as if the bot had crashed
+    stuck_outbox = _outbox(stuck)
+    first = _broadcaster(fake_backend, stuck_outbox, path=path, drain_timeout=0.1)
+    assert first.run(2024, 11)["pending"] == 2
+    first.close()
+
+    outbox = _outbox(bot)
+    second = _broadcaster(fake_backend, outbox, path=path)
+    assert not second.resume(2024, 12)
+    assert second.resume(2024, 11)
+    deadline = time.monotonic() + 5
+    while second.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert second.progress()["delivered"] == 2
+    assert not second.resume(2024, 11)  # Finished now
+    second.close()
+    outbox.close()
+    stuck.release.set()
+    stuck_outbox.close()
+
+
+def test_chats_that_cannot_be_loaded_fail_without_stopping_the_run(
+    bot, fake_backend, tmp_path
+):
+    path = str(tmp_path / "broadcasts.db")
+    outbox = _outbox(bot)
+    broadcaster = _broadcaster(fake_backend, outbox, path=path)
+    fetch, render = broadcaster._plans.fetch, broadcaster._render
+
+    def broken_fetch(keys, *args):
+        if keys and keys[0][0] == 1001:
+            raise RuntimeError("batch")
+        return fetch(keys, *args)
+
+    def broken_render(result, *args):
+        raise RuntimeError("render")
+
+    broadcaster._plans.fetch = broken_fetch
+    broadcaster._render = broken_render
+    stats = broadcaster.run(2024, 11)
+    assert (stats["failed"], stats["pending"]) == (2, 0)
+
+    broadcaster._plans.fetch, broadcaster._render = fetch, render
+    assert broadcaster.run(2024, 11)["delivered"] == 2
+    assert broadcaster.finished(2024, 11)
+    broadcaster.close()
+    outbox.close()
+    admin_chat_id = int(Config().ADMIN_CHAT_ID)
+    assert len(bot.texts(admin_chat_id)) == 2  # The failed run was reported too
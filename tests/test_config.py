@@ -0,0 +1,31 @@
+import pytest
+from pydantic import ValidationError
+
+from utils import Config
+
+
+def test_config_reads_environment_when_built(monkeypatch):
+    monkeypatch.setenv("POLL_TIMEOUT", "3.5")
+    monkeypatch.setenv("BACKEND_HTTP2", "true")
+    cfg: Config = Config()
+    assert cfg.POLL_TIMEOUT == 3.5
+    assert cfg.BACKEND_HTTP2 is True
+    assert Config(POLL_TIMEOUT=1.0).POLL_TIMEOUT == 1.0
+
+
+def test_constants_are_not_read_from_environment(monkeypatch):
+    monkeypatch.setenv("MAX_MESSAGE_LENGTH", "10")
+    assert Config().MAX_MESSAGE_LENGTH == 4090
+
+
+def test_config_is_frozen():
+    cfg: Config = Config()
+    with pytest.raises(ValidationError):
+        cfg.POLL_TIMEOUT = 1.0
+
+
+def test_webhook_mode_requires_a_url():
+    with pytest.raises(ValidationError, match="WEBHOOK_URL"):
+        Config(UPDATES_MODE="webhook")
+    cfg: Config = Config(UPDATES_MODE="webhook", WEBHOOK_URL="https://bot.example")
+    assert cfg.WEBHOOK_URL == "https://bot.example"
@@ -0,0 +1,58 @@
+import httpx
+import pytest
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from loadtest import FakeOpenAI, FakeTelegram, Faults
+from loadtest.fake_backend import ENDPOINTS
+from loadtest.run import percentiles
+from utils import Config, MetaData, Prompts, format_report_with_gpt
+
+
+def test_fake_backend_assigns_tg_id_and_refuses_duplicate_reports(fake_backend):
+    url = f"{fake_backend.url}/v1"
+    params = {"tg_id": 7, "year": 2024, "week": 3}
+    plan = httpx.get(f"{url}/{ENDPOINTS['PERSONAL_TRAINING_ENDPOINT']}", params=params)
+    assert {day["TgId"] for day in plan.json()["Resources"]} == {0}
+    httpx.put(f"{url}/{ENDPOINTS['UPDATE_PERSONAL_TRAINING_TG_ID']}", params=params)
+    plan = httpx.get(f"{url}/{ENDPOINTS['PERSONAL_TRAINING_ENDPOINT']}", params=params)
+    assert {day["TgId"] for day in plan.json()["Resources"]} == {7}
+
+    report = {"TgId": 7, "Year": 2024, "Week": 3}
+    report_url = f"{url}/{ENDPOINTS['PERSONAL_TRAINING_REPORT']}"
+    assert httpx.post(report_url, json=report).status_code == 201
+    assert httpx.post(report_url, json=report).status_code == 409
+
+
+def test_faults_fail_the_configured_share_of_calls():
+    faults = Faults(error_rate=0.5, error_status=503, seed=1)
+    statuses = [faults.apply() for _ in range(1000)]
+    assert set(statuses) == {None, 503}
+    assert 400 < faults.injected < 600
+
+
+def test_reports_are_formatted_against_the_fake_openai():
+    openai = FakeOpenAI().start()
+    try:
+        cfg = Config(OPENAI_API_URL=openai.completions_url)
+        metadata = MetaData(TgId=7, Year=2024, Week=3)
+        report = format_report_with_gpt(cfg, Prompts(), metadata, "Всё сделал")
+    finally:
+        openai.stop()
+    assert report.TgId == 7
+    assert report.allExercisesDone is False
+
+
+def test_fake_telegram_injects_retry_after():
+    telegram = FakeTelegram(faults=Faults(error_rate=1.0, error_status=429)).start()
+    try:
+        bot = Bot(token="123:abc", base_url=telegram.base_url)
+        with pytest.raises(RetryAfter):
+            bot.send_message(chat_id=1, text="hi")
+    finally:
+        telegram.stop()
+
+
+def test_percentiles():
+    p50, p95, p99 = percentiles([float(i) for i in range(1, 101)])
+    assert (round(p50), round(p95), round(p99)) == (50, 95, 99)
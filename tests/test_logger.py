@@ -0,0 +1,55 @@
+import gzip
+import logging
+import logging.handlers
+import os
+import time
+from typing import Iterator, List
+
+import pytest
+
+from logger import init_logger
+from utils import Config
+
+
+@pytest.fixture
+def root_handlers() -> Iterator[None]:
+    root = logging.getLogger()
+    handlers: List[logging.Handler] = list(root.handlers)
+    level: int = root.level
+    yield
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline: float = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_records_are_written_by_the_listener(tmp_path, root_handlers):
+    logger = init_logger(Config(LOG_DIR=str(tmp_path), LOG_LEVEL="INFO"))
+    assert any(
+        isinstance(handler, logging.handlers.QueueHandler)
+        for handler in logging.getLogger().handlers
+    )
+    logger.debug("hidden %s", "debug")
+    logger.info("shown %s", "info")
+    log_path: str = os.path.join(str(tmp_path), "logs.log")
+    _wait_for(lambda: "shown info" in open(log_path, encoding="utf-8").read())
+    assert "hidden" not in open(log_path, encoding="utf-8").read()
+
+
+def test_rotated_files_are_compressed(tmp_path, root_handlers):
+    logger = init_logger(
+        Config(LOG_DIR=str(tmp_path), LOG_MAX_BYTES=200, LOG_BACKUP_COUNT=2)
+    )
+    for i in range(20):
+        logger.warning("line %s", i)
+    rotated: str = os.path.join(str(tmp_path), "logs.log.1.gz")
+    _wait_for(lambda: os.path.exists(rotated))
+    _wait_for(lambda: "line 19" in open(tmp_path / "logs.log").read())
+    with gzip.open(rotated, "rt", encoding="utf-8") as f:
+        assert "line" in f.read()
+    assert not os.path.exists(os.path.join(str(tmp_path), "logs.log.3.gz"))
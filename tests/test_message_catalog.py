@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+from typing import Any, Dict
+
+import pytest
+
+from utils import MessageCatalog
+
+MESSAGES_PATH: str = os.path.join("messages", "messages.json")
+
+
+@pytest.fixture
+def messages() -> Dict[str, Any]:
+    with open(MESSAGES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def messages_path(tmp_path, messages) -> str:
+    path = tmp_path / "messages.json"
+    path.write_text(json.dumps(messages, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def _rewrite(path: str, messages: Dict[str, Any]) -> None:
+    mtime_ns: int = os.stat(path).st_mtime_ns
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(messages, f, ensure_ascii=False)
+    # Make sure the change is visible even on coarse mtime resolution
+    os.utime(path, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+
+
+def test_shipped_messages_pass_the_checks():
+    catalog = MessageCatalog(MESSAGES_PATH, logging.getLogger(__name__))
+    assert catalog["exception"].format(exception="boom")
+
+
+def test_catalog_is_read_only(messages_path):
+    catalog = MessageCatalog(messages_path, logging.getLogger(__name__))
+    with pytest.raises(TypeError):
+        catalog["exception"] = "changed"
+
+
+def test_unknown_placeholder_fails_at_startup(messages_path, messages):
+    messages["exception"] = "Ошибка: {error}"
+    _rewrite(messages_path, messages)
+    with pytest.raises(ValueError, match="exception"):
+        MessageCatalog(messages_path, logging.getLogger(__name__))
+
+
+def test_reloads_only_when_file_changes(messages_path, messages):
+    catalog = MessageCatalog(messages_path, logging.getLogger(__name__))
+    assert not catalog.reload_if_changed()
+
+    messages["request_timeout"] = "Сервер думает слишком долго"
+    _rewrite(messages_path, messages)
+    assert catalog.reload_if_changed()
+    assert catalog["request_timeout"] == "Сервер думает слишком долго"
+
+
+def test_invalid_edit_keeps_previous_copy(messages_path, messages, caplog):
+    catalog = MessageCatalog(messages_path, logging.getLogger(__name__))
+    previous: str = catalog["report_already_exists"]
+
+    messages["report_already_exists"] = "Отчет за {week} неделю {month}"
+    _rewrite(messages_path, messages)
+    assert not catalog.reload_if_changed()
+    assert catalog["report_already_exists"] == previous
+    assert "unknown placeholders ['month']" in caplog.text
@@ -0,0 +1,237 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher
+
+from handlers.lib.get_personal_training import send_personal_training_handler_factory
+from loadtest import FakeBackend
+from loadtest.fake_backend import ENDPOINTS
+from utils import (
+    AccessCache,
+    BackendClient,
+    Config,
+    MessageCatalog,
+    MetaData,
+    MetadataCache,
+    OutboundQueue,
+    PlanCache,
+    SessionStore,
+)
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+CHAT_ID: int = 1007
+
+
+class _NoUpsertBackend(FakeBackend):
+    """A backend that only takes DELETE and POST on the current plan."""
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any):
+        if method == "PUT" and path.endswith(
+            ENDPOINTS["CURRENT_PERSONAL_TRAINING_ENDPOINT"]
+        ):
+            return 405, {"detail": "Method Not Allowed"}
+        return super().handle(method, path, query, body)
+
+
+class _BrokenBackend(FakeBackend):
+    """A backend whose current-plan writes fail with 500."""
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any):
+        if method in ("PUT", "DELETE") and path.endswith(
+            ENDPOINTS["CURRENT_PERSONAL_TRAINING_ENDPOINT"]
+        ):
+            return 500, {"detail": "Internal Server Error"}
+        return super().handle(method, path, query, body)
+
+
+class _RevocableBackend(FakeBackend):
+    """A backend that stops allowing every key once `revoked` is set."""
+
+    revoked: bool = False
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any):
+        if self.revoked and path.endswith(ENDPOINTS["ALLOWED_PERSONAL_TRAINING"]):
+            return 403, {"detail": "Forbidden"}
+        return super().handle(method, path, query, body)
+
+
+class _RecordingClient(BackendClient):
+    def __init__(self, cfg: Config) -> None:
+        super().__init__(cfg, LOGGER)
+        self.calls: List[Tuple[str, str]] = []
+
+    def request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        self.calls.append((method, endpoint))
+        return super().request(method, endpoint, **kwargs)
+
+    def metadata_writes(self) -> List[str]:
+        current = ENDPOINTS["CURRENT_PERSONAL_TRAINING_ENDPOINT"]
+        return [method for method, endpoint in self.calls if endpoint == current]
+
+    def plan_reads(self) -> int:
+        plans = ENDPOINTS["PERSONAL_TRAINING_ENDPOINT"]
+        return self.calls.count(("GET", plans))
+
+
+def _handler(
+    cfg: Config,
+    backend: BackendClient,
+    bot: Bot,
+    metadata_cache: MetadataCache,
+    executor: ThreadPoolExecutor,
+) -> Tuple[Any, OutboundQueue, MessageCatalog]:
+    outbox = OutboundQueue(bot, LOGGER)
+    messages = MessageCatalog("messages/messages.json", LOGGER)
+    sessions = SessionStore(maxsize=8, ttl=60)
+    sessions.set_api_key(CHAT_ID, "key")
+    handler = send_personal_training_handler_factory(
+        cfg,
+        LOGGER,
+        messages,
+        backend,
+        sessions,
+        AccessCache(maxsize=8, ttl=60),
+        PlanCache(maxsize=8, ttl=60),
+        metadata_cache,
+        executor,
+        outbox,
+        lambda update, context: None,
+    )
+    return handler, outbox, messages
+
+
+def _view_plan(handler, bot: Bot, context: CallbackContext) -> None:
+    update = Update.de_json(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": CHAT_ID, "type": "private"},
+                "text": "/get_personal_training",
+            },
+        },
+        bot,
+    )
+    handler(update, context)
+
+
+@pytest.mark.parametrize("fake_backend", [FakeBackend, _NoUpsertBackend], indirect=True)
+@pytest.mark.parametrize("upsert", [True, False])
+def test_unchanged_metadata_is_not_written_again(bot, fake_backend, upsert):
+    cfg = Config(BACKEND_API=fake_backend.url, **ENDPOINTS)
+    backend = _RecordingClient(cfg)
+    metadata_cache = MetadataCache(maxsize=8, ttl=60, upsert=upsert)
+    executor = ThreadPoolExecutor(max_workers=1)
+    handler, outbox, messages = _handler(cfg, backend, bot, metadata_cache, executor)
+    context = CallbackContext(Dispatcher(bot, Queue(), workers=1))
+
+    _view_plan(handler, bot, context)
+    executor.submit(lambda: None).result()  # Until the first write is done
+    _view_plan(handler, bot, context)
+    executor.shutdown(wait=True)
+    outbox.close()
+
+    if not upsert:
+        assert backend.metadata_writes() == ["DELETE", "POST"]
+    elif isinstance(fake_backend, _NoUpsertBackend):
+        assert backend.metadata_writes() == ["PUT", "DELETE", "POST"]
+        assert not metadata_cache.upsert_supported
+    else:
+        assert backend.metadata_writes() == ["PUT"]
+    assert fake_backend.current[CHAT_ID]["TgId"] == CHAT_ID
+    assert metadata_cache.stats()["skipped"] == 1
+    # The first view still greets the newcomer, the second one does not
+    greetings = [text.startswith(messages["newcomer_welcome"]) for text in bot.texts()]
+    assert sum(greetings) == 1
+
+
+@pytest.mark.parametrize("fake_backend", [_BrokenBackend], indirect=True)
+@pytest.mark.parametrize("upsert", [True, False])
+def test_failed_metadata_write_does_not_lose_the_plan(bot, fake_backend, upsert):
+    cfg = Config(BACKEND_API=fake_backend.url, **ENDPOINTS)
+    backend = _RecordingClient(cfg)
+    executor = ThreadPoolExecutor(max_workers=1)
+    metadata_cache = MetadataCache(maxsize=8, ttl=60, upsert=upsert)
+    handler, outbox, messages = _handler(cfg, backend, bot, metadata_cache, executor)
+    _view_plan(handler, bot, CallbackContext(Dispatcher(bot, Queue(), workers=1)))
+    executor.shutdown(wait=True)
+    outbox.close()
+
+    assert backend.metadata_writes() == ["PUT" if upsert else "DELETE"]
+    text = "".join(bot.texts())
+    assert "День 1" in text and "500" in text
+    assert messages["newcomer_welcome"] not in text
+
+
+def test_plan_is_sent_when_metadata_cannot_be_refreshed(bot, fake_backend):
+    cfg = Config(BACKEND_API=fake_backend.url, BACKEND_TIMEOUT=0.5, **ENDPOINTS)
+    backend = _RecordingClient(cfg)
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()  # submit() raises
+    handler, outbox, messages = _handler(
+        cfg, backend, bot, MetadataCache(maxsize=8, ttl=60), executor
+    )
+    _view_plan(handler, bot, CallbackContext(Dispatcher(bot, Queue(), workers=1)))
+    outbox.close()
+
+    assert backend.metadata_writes() == []
+    texts = bot.texts()
+    assert texts and not texts[0].startswith(messages["newcomer_welcome"])
+
+
+def test_cache_tracks_the_last_write():
+    cache = MetadataCache(maxsize=8, ttl=60)
+    metadata = MetaData(TgId=1, Year=2024, Week=11)
+    assert not cache.unchanged(metadata)
+    cache.set(metadata)
+    assert cache.unchanged(MetaData(TgId=1, Year=2024, Week=11))
+    assert not cache.unchanged(MetaData(TgId=1, Year=2024, Week=12))
+    cache.invalidate(1)
+    assert not cache.unchanged(metadata)
+
+
+def test_plan_does_not_wait_for_a_stuck_metadata_refresh(bot, fake_backend):
+    cfg = Config(BACKEND_API=fake_backend.url, BACKEND_TIMEOUT=0.2, **ENDPOINTS)
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    executor.submit(release.wait)  # The refresh queues up behind this
+    handler, outbox, messages = _handler(
+        cfg, _RecordingClient(cfg), bot, MetadataCache(maxsize=8, ttl=60), executor
+    )
+    _view_plan(handler, bot, CallbackContext(Dispatcher(bot, Queue(), workers=1)))
+    release.set()
+    executor.shutdown(wait=True)
+    outbox.close()
+
+    texts = bot.texts()
+    assert texts and not texts[0].startswith(messages["newcomer_welcome"])
+
+
+@pytest.mark.parametrize("fake_backend", [_RevocableBackend], indirect=True)
+def test_cached_plan_is_not_served_once_access_is_revoked(bot, fake_backend):
+    cfg = Config(BACKEND_API=fake_backend.url, **ENDPOINTS)
+    backend = _RecordingClient(cfg)
+    executor = ThreadPoolExecutor(max_workers=1)
+    handler, outbox, messages = _handler(
+        cfg, backend, bot, MetadataCache(maxsize=8, ttl=60), executor
+    )
+    context = CallbackContext(Dispatcher(bot, Queue(), workers=1))
+    for _ in range(2):  # The first view assigns the plan, the second caches it
+        _view_plan(handler, bot, context)
+    executor.submit(lambda: None).result()
+    fake_backend.revoked = True
+    _view_plan(handler, bot, context)
+    executor.shutdown(wait=True)
+    outbox.close()
+
+    assert backend.plan_reads() == 2
+    texts = bot.texts()
+    assert texts[-1] == messages["not_allowed"]
+    assert sum("День 1" in text for text in texts) == 2
@@ -0,0 +1,59 @@
+import httpx
+import pytest
+from telegram.ext import CommandHandler, ConversationHandler
+
+from utils import Metrics, MetricsServer, instrument_handler
+
+
+def test_track_records_latency_status_and_in_flight() -> None:
+    metrics = Metrics(buckets=(0.1, 1.0))
+    with metrics.track("bot_backend", method="GET", endpoint="plans") as outcome:
+        outcome.status = "200"
+    with pytest.raises(httpx.ConnectError):
+        with metrics.track("bot_backend", method="GET", endpoint="plans"):
+            raise httpx.ConnectError("refused")
+
+    text = metrics.render()
+    labels = 'endpoint="plans",method="GET"'
+    assert "# TYPE bot_backend_seconds histogram" in text
+    assert f'bot_backend_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"bot_backend_seconds_count{{{labels}}} 2" in text
+    assert f'bot_backend_total{{{labels},status="200"}} 1.0' in text
+    assert f'bot_backend_total{{{labels},status="ConnectError"}} 1.0' in text
+    assert f"bot_backend_in_flight{{{labels}}} 0.0" in text
+
+
+def test_instrument_handler_wraps_conversation_callbacks() -> None:
+    def entry(update, context):
+        return 1
+
+    def step(update, context):
+        return ConversationHandler.END
+
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("entry", entry)],
+        states={1: [CommandHandler("step", step)]},
+        fallbacks=[],
+    )
+    metrics = Metrics()
+    instrument_handler(conversation, metrics)
+
+    # The wrapped callbacks still return the conversation state
+    assert conversation.entry_points[0].callback(None, None) == 1
+    assert conversation.states[1][0].callback(None, None) == ConversationHandler.END
+    text = metrics.render()
+    assert 'bot_handler_total{handler="entry",status="ok"} 1.0' in text
+    assert 'bot_handler_total{handler="step",status="ok"} 1.0' in text
+
+
+def test_server_serves_metrics() -> None:
+    metrics = Metrics()
+    metrics.gauge_callback("bot_outbox_depth", lambda: 3)
+    server = MetricsServer(metrics, "127.0.0.1", 0)
+    try:
+        response = httpx.get(f"http://127.0.0.1:{server.port}/metrics")
+        assert response.status_code == 200
+        assert "bot_outbox_depth 3.0" in response.text
+        assert httpx.get(f"http://127.0.0.1:{server.port}/").status_code == 404
+    finally:
+        server.close()
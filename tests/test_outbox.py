@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Any, Optional
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from utils import OutboundQueue
+
+
+def _outbox(bot: Bot, **kwargs: Any) -> OutboundQueue:
+    return OutboundQueue(bot=bot, logger=logging.getLogger(__name__), **kwargs)
+
+
+def test_coalesces_adjacent_messages_up_to_keyboard(bot):
+    bot.release.clear()
+    outbox = _outbox(bot, workers=1)
+    outbox.send(chat_id=1, text="first")  # picked up alone while Telegram is slow
+    time.sleep(0.05)
+    menu = InlineKeyboardMarkup([[InlineKeyboardButton("menu", callback_data="m")]])
+    outbox.send(chat_id=1, text="second")
+    outbox.send(chat_id=1, text="third", reply_markup=menu)
+    outbox.send(chat_id=1, text="fourth")
+    bot.release.set()
+    outbox.close()
+    assert [m["text"] for m in bot.sent] == ["first", "second\nthird", "fourth"]
+    assert bot.sent[1]["reply_markup"] is menu
+    assert outbox.stats()["coalesced"] == 1
+
+
+def test_long_messages_are_not_coalesced(bot):
+    bot.release.clear()
+    outbox = _outbox(bot, workers=1, coalesce_limit=10)
+    for text in ("a" * 6, "b" * 6, "c" * 3):
+        outbox.send(chat_id=1, text=text)
+    bot.release.set()
+    outbox.close()
+    assert [m["text"] for m in bot.sent] == ["a" * 6, "b" * 6 + "\n" + "c" * 3]
+
+
+def test_per_chat_rate_is_enforced(bot):
+    outbox = _outbox(bot, chat_rate=20.0, chat_burst=1, coalesce_limit=1)
+    for i in range(5):
+        outbox.send(chat_id=1, text=f"message {i}")
+    outbox.close()
+    times = [m["time"] for m in bot.sent]
+    assert [m["text"] for m in bot.sent] == [f"message {i}" for i in range(5)]
+    assert times[-1] - times[0] >= 4 / 20 * 0.9
+
+
+def test_retry_after_pauses_only_that_chat(bot):
+    bot.errors.append(RetryAfter(1))
+    outbox = _outbox(bot, workers=2)
+    outbox.send(chat_id=1, text="throttled")
+    time.sleep(0.05)
+    outbox.send(chat_id=2, text="other chat")
+    outbox.close()
+    assert [m["text"] for m in bot.sent] == ["other chat", "throttled"]
+    assert bot.sent[1]["time"] - bot.sent[0]["time"] > 0.8
+    assert outbox.stats()["retries"] == 1
+
+
+def test_bad_request_is_dropped_and_queue_keeps_going(bot):
+    bot.errors.append(BadRequest("chat not found"))
+    outbox = _outbox(bot)
+    outbox.send(chat_id=1, text="lost")
+    outbox.close()
+    outbox_stats = outbox.stats()
+    assert outbox_stats["dropped"] == 1
+    assert outbox_stats["depth"] == 0
+
+
+def test_timed_out_send_is_not_repeated(bot):
+    bot.errors.extend([TimedOut(), NetworkError("Connection refused")])
+    outbox = _outbox(bot, workers=1, max_retries=1)
+    outbox.send(chat_id=1, text="maybe delivered")
+    outbox.send(chat_id=2, text="never connected")
+    outbox.close(timeout=5)
+    assert [m["text"] for m in bot.sent] == ["never connected"]
+    assert outbox.stats()["dropped"] == 1
+
+
+def test_unexpected_errors_do_not_stop_the_senders(bot):
+    bot.errors.append(ConnectionResetError("leaked past the bot"))
+
+    def broken_callback(error: Optional[Exception]) -> None:
+        raise ValueError("callback failed")
+
+    outbox = _outbox(bot, workers=1, coalesce_limit=1)
+    outbox.send(chat_id=1, text="lost", on_done=broken_callback)
+    outbox.send(chat_id=1, text="delivered", on_done=broken_callback)
+    outbox.send(chat_id=2, text="other chat")
+    started = time.monotonic()
+    outbox.close(timeout=5)
+    assert time.monotonic() - started < 2.5
+    assert sorted(m["text"] for m in bot.sent) == ["delivered", "other chat"]
+    assert outbox.stats()["depth"] == 0
+
+
+def test_stats_report_depth_and_latency(bot):
+    bot.release.clear()
+    outbox = _outbox(bot, workers=1, coalesce_limit=1)
+    for chat_id in range(3):
+        outbox.send(chat_id=chat_id, text="hello")
+    assert outbox.depth() == 3
+    bot.release.set()
+    outbox.close()
+    outbox_stats = outbox.stats()
+    assert outbox_stats["sent"] == 3
+    assert outbox_stats["depth"] == 0
+    assert outbox_stats["latency_max"] >= outbox_stats["latency_p50"] > 0
@@ -0,0 +1,46 @@
+from typing import Iterator, List
+
+from benchmarks.formatters import build_week
+from utils import iter_week_blocks, pack_messages, parse_week, utf16_length
+
+
+def test_short_text_is_sent_as_one_message():
+    assert list(pack_messages(["Привет", ", мир\n", "!"], 4090)) == ["Привет, мир\n!"]
+
+
+def test_week_is_split_on_line_boundaries_only():
+    days = parse_week(build_week(days=14, exercises=200, kind="mixed"))
+    text: str = "".join(iter_week_blocks(days))
+    packed: List[str] = list(pack_messages(iter_week_blocks(days), 4090))
+    assert len(packed) > 1
+    assert all(utf16_length(message) <= 4090 for message in packed)
+    # Every break swallowed exactly one newline and nothing else
+    assert "\n".join(packed) == text
+    # Greedy: the next line would not have fitted into the previous message
+    for message, following in zip(packed, packed[1:]):
+        next_line: str = following.split("\n", 1)[0]
+        assert utf16_length(message + "\n" + next_line) > 4090
+
+
+def test_limit_counts_utf16_units():
+    packed: List[str] = list(pack_messages(["🌊" * 8], 10))
+    assert packed == ["🌊" * 5, "🌊" * 3]
+
+
+def test_long_line_is_broken_on_spaces_then_hard():
+    assert list(pack_messages(["aaa bbb ccc"], 7)) == ["aaa bbb", "ccc"]
+    assert list(pack_messages(["abcdefghij"], 4)) == ["abcd", "efgh", "ij"]
+
+
+def test_first_message_is_ready_before_later_fragments_are_rendered():
+    rendered: List[int] = []
+
+    def fragments() -> Iterator[str]:
+        for day in range(5):
+            rendered.append(day)
+            yield f"день {day}\n" + "x" * 30 + "\n"
+
+    packed = pack_messages(fragments(), 50)
+    first: str = next(packed)
+    assert first.startswith("день 0")
+    assert rendered == [0, 1]
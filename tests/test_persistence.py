@@ -0,0 +1,54 @@
+import logging
+import sqlite3
+
+from utils import SQLitePersistence
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def _rows(path: str, table: str) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_changes_are_written_behind_in_batches(tmp_path):
+    path: str = str(tmp_path / "bot.db")
+    persistence = SQLitePersistence(path, LOGGER, flush_interval=60)
+    persistence.update_user_data(1, {"reminders": True})
+    persistence.update_chat_data(1, {"seen": True})
+    persistence.update_conversation("authorize", (1, 1), 0)
+    assert _rows(path, "user_data") == 0  # Nothing written before the flush
+
+    persistence.flush()
+    assert _rows(path, "user_data") == 1
+    assert _rows(path, "chat_data") == 1
+    assert _rows(path, "conversations") == 1
+    persistence.close()
+
+
+def test_unchanged_data_is_not_written_again(tmp_path, caplog):
+    persistence = SQLitePersistence(str(tmp_path / "bot.db"), LOGGER, 60)
+    persistence.update_user_data(1, {"reminders": True})
+    persistence.update_user_data(2, {})  # Never stored, nothing to delete
+    persistence.flush()
+    with caplog.at_level(logging.DEBUG, logger=__name__):
+        persistence.update_user_data(1, {"reminders": True})
+        persistence.flush()
+    assert "Persisted" not in caplog.text
+    persistence.close()
+
+
+def test_state_survives_a_restart(tmp_path):
+    path: str = str(tmp_path / "state" / "bot.db")
+    persistence = SQLitePersistence(path, LOGGER, flush_interval=60)
+    persistence.update_user_data(1, {"reminders": True})
+    persistence.update_conversation("authorize", (1, 1), 0)
+    persistence.update_conversation("send_report", (2, 2), 0)
+    persistence.update_conversation("send_report", (2, 2), None)  # Ended
+    persistence.close()
+
+    restarted = SQLitePersistence(path, LOGGER, flush_interval=60)
+    assert restarted.get_user_data() == {1: {"reminders": True}}
+    assert restarted.get_conversations("authorize") == {(1, 1): 0}
+    assert restarted.get_conversations("send_report") == {}
+    restarted.close()
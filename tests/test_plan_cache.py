@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from utils import PlanCache, RenderedPlan
+
+
+@pytest.fixture
+def plan() -> RenderedPlan:
+    return RenderedPlan(text="День 1", resources=[{"Day": 1}])
+
+
+def test_get_returns_cached_plan(plan):
+    cache = PlanCache(maxsize=8, ttl=60)
+    assert cache.get((1, 2024, 10)) is None
+    cache.set((1, 2024, 10), plan)
+    assert cache.get((1, 2024, 10)) == plan
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_invalidate_drops_plan(plan):
+    cache = PlanCache(maxsize=8, ttl=60)
+    cache.set((1, 2024, 10), plan)
+    cache.invalidate((1, 2024, 10))
+    assert cache.get((1, 2024, 10)) is None
+
+
+def test_plans_expire_after_ttl(plan):
+    cache = PlanCache(maxsize=8, ttl=0.05)
+    cache.set((1, 2024, 10), plan)
+    time.sleep(0.1)
+    assert cache.get((1, 2024, 10)) is None
+
+
+def test_cache_is_bounded(plan):
+    cache = PlanCache(maxsize=2, ttl=60)
+    for tg_id in range(5):
+        cache.set((tg_id, 2024, 10), plan)
+    assert cache.stats()["size"] == 2
+
+
+def test_roll_over_drops_past_weeks_only(plan):
+    cache = PlanCache(maxsize=8, ttl=60)
+    cache.set((1, 2023, 52), plan)
+    cache.set((1, 2024, 1), plan)
+    cache.set((1, 2024, 2), plan)
+    cache.roll_over(2024, 1)
+    assert cache.get((1, 2023, 52)) is None
+    assert cache.get((1, 2024, 1)) == plan
+    assert cache.get((1, 2024, 2)) == plan
+
+
+def test_preloaded_plans_outlive_ttl_until_first_hit(plan):
+    cache = PlanCache(maxsize=8, ttl=0.05, preload_size=1)
+    assert cache.preload((1, 2024, 11), plan)
+    assert not cache.preload((2, 2024, 11), plan)
+    time.sleep(0.1)
+    assert cache.get((1, 2024, 11)) == plan
+    time.sleep(0.1)  # Now in the TTL cache, so it expires like any entry
+    assert cache.get((1, 2024, 11)) is None
+
+
+def test_roll_over_drops_preloaded_past_weeks(plan):
+    cache = PlanCache(maxsize=8, ttl=60)
+    cache.preload((1, 2024, 10), plan)
+    cache.preload((1, 2024, 11), plan)
+    cache.roll_over(2024, 11)
+    assert cache.get((1, 2024, 10)) is None
+    assert cache.get((1, 2024, 11)) == plan
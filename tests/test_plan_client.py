@@ -0,0 +1,58 @@
+import logging
+from functools import partial
+
+import pytest
+
+from loadtest import FakeBackend
+from loadtest.fake_backend import ENDPOINTS, SERVICE_API_KEY
+from utils import BackendClient, BatchPlanClient, Config
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def _client(fake: FakeBackend) -> BatchPlanClient:
+    cfg = Config(
+        BACKEND_API=fake.url,
+        BACKEND_HEDGE_QUANTILE=0.0,
+        BACKEND_SERVICE_API_KEY=SERVICE_API_KEY,
+        **ENDPOINTS,
+    )
+    return BatchPlanClient(cfg, LOGGER, BackendClient(cfg, LOGGER), bulk_size=2)
+
+
+def test_bulk_endpoint_fetches_chunks(fake_backend):
+    keys = [(tg_id, 2024, 11) for tg_id in range(1, 6)]
+    results = list(
+        _client(fake_backend).fetch(keys, {tg_id: "key" for tg_id in range(1, 6)})
+    )
+    assert sorted(result.key for result in results) == keys
+    assert {result.status for result in results} == {200}
+    assert all(result.resources[0]["Week"] == 11 for result in results)
+    assert fake_backend.requests == 3
+
+
+@pytest.mark.parametrize(
+    "fake_backend", [partial(FakeBackend, bulk=False)], indirect=True
+)
+def test_falls_back_to_single_requests_without_bulk_endpoint(fake_backend):
+    client = _client(fake_backend)
+    keys = [(tg_id, 2024, 11) for tg_id in range(1, 7)]
+    api_keys = {tg_id: "key" for tg_id in range(1, 6)}
+    results = list(client.fetch(keys, api_keys))
+    by_key = {result.key: result for result in results}
+    assert {by_key[key].status for key in keys[:5]} == {200}
+    assert by_key[(6, 2024, 11)].status == 401  # No API key: not asked for
+    # Only the first chunk probes; then one request per plan
+    assert fake_backend.requests == 1 + 5
+    assert not client.bulk_available()
+
+    list(client.fetch(keys[:2], api_keys))
+    assert fake_backend.requests == 6 + 2  # Not probed again
+
+
+def test_bulk_endpoint_needs_a_service_key(fake_backend):
+    cfg = Config(BACKEND_API=fake_backend.url, **ENDPOINTS)
+    client = BatchPlanClient(cfg, LOGGER, BackendClient(cfg, LOGGER))
+    assert not client.bulk_available()
+    list(client.fetch([(1, 2024, 11), (2, 2024, 11)], {1: "key", 2: "key"}))
+    assert fake_backend.requests == 2
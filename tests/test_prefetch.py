@@ -0,0 +1,44 @@
+import logging
+from datetime import date
+
+import httpx
+
+from loadtest.fake_backend import ENDPOINTS
+from utils import (
+    BackendClient,
+    BatchPlanClient,
+    Config,
+    PlanCache,
+    SessionStore,
+    next_week,
+    prefetch_plans,
+)
+
+
+def test_next_week_is_the_week_of_next_monday():
+    assert next_week(date(2024, 3, 10)) == (2024, 11)  # Sunday
+    assert next_week(date(2024, 3, 11)) == (2024, 12)  # Monday
+    assert next_week(date(2025, 12, 28)) == (2025, 1)  # Like the handler
+
+
+def test_prefetch_preloads_assigned_plans(fake_backend):
+    cfg = Config(BACKEND_API=fake_backend.url, **ENDPOINTS)
+    backend = BackendClient(cfg, logging.getLogger(__name__))
+    httpx.put(
+        f"{fake_backend.url}/v1/{ENDPOINTS['UPDATE_PERSONAL_TRAINING_TG_ID']}",
+        params={"tg_id": 1},
+    )
+    sessions = SessionStore(maxsize=8, ttl=60)
+    sessions.set_api_key(1, "key-1")
+    sessions.set_api_key(2, "key-2")  # Plan not assigned to the chat yet
+    cache = PlanCache(maxsize=8, ttl=60)
+
+    logger = logging.getLogger(__name__)
+    plans = BatchPlanClient(cfg, logger, backend)
+    stats = prefetch_plans(logger, plans, sessions, cache, 2024, 11, 2)
+    backend.close()
+
+    assert stats == {"clients": 2, "cached": 1, "unassigned": 1}
+    plan = cache.get((1, 2024, 11))
+    assert plan is not None and "День 1" in plan.text
+    assert cache.get((2, 2024, 11)) is None
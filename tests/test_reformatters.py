@@ -1,5 +1,6 @@
 from utils import convert_json_to_human_readable, separator
 from utils.utils import handle_coordination, CoordinationType
+from utils.training import SwimmingExercise
 import pytest
 from typing import Dict, Any, Literal
 import os
@@ -7,63 +8,63 @@ import json
 
 
 @pytest.fixture
-def legs() -> Dict[str, Any]:
-    return {
-        "Volume": 200,
-        "VolumeUnits": "m",
-        "Time": None,
-        "TimeUnits": "min",
-        "Stroke": "кроль",
-        "Speed": 1,
-        "Legs": True,
-        "Arms": False,
-        "Comments": "разминка, свободные упражнения",
-    }
+def legs() -> SwimmingExercise:
+    return SwimmingExercise(
+        Volume=200,
+        VolumeUnits="m",
+        Time=None,
+        TimeUnits="min",
+        Stroke="кроль",
+        Speed=1,
+        Legs=True,
+        Arms=False,
+        Comments="разминка, свободные упражнения",
+    )
 
 
 @pytest.fixture
-def arms() -> Dict[str, Any]:
-    return {
-        "Volume": 200,
-        "VolumeUnits": "m",
-        "Time": None,
-        "TimeUnits": "min",
-        "Stroke": "кроль",
-        "Speed": 1,
-        "Legs": False,
-        "Arms": True,
-        "Comments": "разминка, свободные упражнения",
-    }
+def arms() -> SwimmingExercise:
+    return SwimmingExercise(
+        Volume=200,
+        VolumeUnits="m",
+        Time=None,
+        TimeUnits="min",
+        Stroke="кроль",
+        Speed=1,
+        Legs=False,
+        Arms=True,
+        Comments="разминка, свободные упражнения",
+    )
 
 
 @pytest.fixture
-def neither_arms_nor_legs() -> Dict[str, Any]:
-    return {
-        "Volume": 200,
-        "VolumeUnits": "m",
-        "Time": None,
-        "TimeUnits": "min",
-        "Stroke": "кроль",
-        "Speed": 1,
-        "Legs": False,
-        "Arms": False,
-        "Comments": "разминка, свободные упражнения",
-    }
+def neither_arms_nor_legs() -> SwimmingExercise:
+    return SwimmingExercise(
+        Volume=200,
+        VolumeUnits="m",
+        Time=None,
+        TimeUnits="min",
+        Stroke="кроль",
+        Speed=1,
+        Legs=False,
+        Arms=False,
+        Comments="разминка, свободные упражнения",
+    )
 
 
 @pytest.fixture
-def both_arms_and_legs() -> Dict[str, Any]:
-    return {
-        "Volume": 200,
-        "VolumeUnits": "m",
-        "Time": None,
-        "TimeUnits": "min",
-        "Stroke": "кроль",
-        "Speed": 1,
-        "Legs": True,
-        "Arms": True,
-        "Comments": "разминка, свободные упражнения",
-    }
+def both_arms_and_legs() -> SwimmingExercise:
+    return SwimmingExercise(
+        Volume=200,
+        VolumeUnits="m",
+        Time=None,
+        TimeUnits="min",
+        Stroke="кроль",
+        Speed=1,
+        Legs=True,
+        Arms=True,
+        Comments="разминка, свободные упражнения",
+    )
 
 
 @pytest.fixture
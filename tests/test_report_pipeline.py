@@ -0,0 +1,44 @@
+import logging
+import threading
+from typing import List
+
+from utils import ReportPipeline
+
+
+def test_runs_submitted_reports():
+    pipeline = ReportPipeline(
+        max_workers=2, max_pending=2, logger=logging.getLogger(__name__)
+    )
+    processed: List[int] = []
+    for report_id in range(3):
+        assert pipeline.submit(lambda report_id=report_id: processed.append(report_id))
+    pipeline.shutdown(wait=True)
+    assert sorted(processed) == [0, 1, 2]
+
+
+def test_rejects_reports_beyond_capacity():
+    pipeline = ReportPipeline(
+        max_workers=1, max_pending=1, logger=logging.getLogger(__name__)
+    )
+    release = threading.Event()
+    assert pipeline.submit(release.wait)
+    assert pipeline.submit(release.wait)
+    assert not pipeline.submit(release.wait)
+    assert pipeline.in_flight() == 2
+    release.set()
+    pipeline.shutdown(wait=True)
+    assert pipeline.in_flight() == 0
+
+
+def test_failed_report_frees_its_slot(caplog):
+    pipeline = ReportPipeline(
+        max_workers=1, max_pending=0, logger=logging.getLogger(__name__)
+    )
+
+    def failing_job() -> None:
+        raise ValueError("bad report")
+
+    assert pipeline.submit(failing_job)
+    pipeline.shutdown(wait=True)
+    assert pipeline.in_flight() == 0
+    assert "bad report" in caplog.text
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import pytest
+
+from utils import (
+    BackendClient,
+    BackendUnavailable,
+    CircuitBreaker,
+    Config,
+    Metrics,
+    Tracer,
+    current_span,
+)
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers with the next (status, delay) of `script`, then with 200."""
+
+    protocol_version = "HTTP/1.1"
+    script: List = []
+    calls: List[str] = []
+    lock = threading.Lock()
+
+    def _reply(self) -> None:
+        with self.lock:
+            self.calls.append(self.command)
+            status, delay = self.script.pop(0) if self.script else (200, 0.0)
+        time.sleep(delay)
+        body = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    _ScriptedHandler.script = []
+    _ScriptedHandler.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedHandler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, address: None  # Resets on client close
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(url: str, **settings) -> BackendClient:
+    cfg = Config(BACKEND_API=url, BACKEND_RETRY_BACKOFF=0.001, **settings)
+    return BackendClient(cfg, logging.getLogger(__name__), Metrics())
+
+
+def test_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # The trial
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_get_is_retried_but_post_is_not(server_url):
+    client = _client(server_url, BACKEND_HEDGE_QUANTILE=0.0)
+    _ScriptedHandler.script = [(503, 0.0), (502, 0.0)]
+    assert client.get("plans").status_code == 200
+    assert _ScriptedHandler.calls == ["GET"] * 3
+
+    _ScriptedHandler.script = [(503, 0.0)]
+    assert client.post("reports").status_code == 503
+    assert _ScriptedHandler.calls[3:] == ["POST"]
+    client.close()
+
+
+def test_open_circuit_fails_fast(server_url):
+    client = _client(
+        server_url,
+        BACKEND_RETRIES=0,
+        BACKEND_BREAKER_THRESHOLD=2,
+        BACKEND_HEDGE_QUANTILE=0.0,
+    )
+    _ScriptedHandler.script = [(500, 0.0), (500, 0.0)]
+    client.get("plans")
+    client.get("plans")
+    with pytest.raises(BackendUnavailable):
+        client.get("plans")
+    assert len(_ScriptedHandler.calls) == 2
+    # Other endpoints have their own breaker
+    assert client.get("reports").status_code == 200
+    client.close()
+
+
+def test_slow_get_is_hedged(server_url):
+    client = _client(server_url, BACKEND_HEDGE_MIN_DELAY=0.01)
+    for _ in range(20):  # History for the endpoint's latency quantile
+        client.get("plans")
+    _ScriptedHandler.script = [(200, 0.6)]
+    started = time.monotonic()
+    assert client.get("plans").status_code == 200
+    assert time.monotonic() - started < 0.4
+    assert len(_ScriptedHandler.calls) == 22
+    time.sleep(0.3)  # Let the slow original finish before the server stops
+    client.close()
+
+
+def test_hedged_get_stays_in_the_callers_trace(server_url, monkeypatch):
+    client = _client(server_url, BACKEND_HEDGE_MIN_DELAY=0.01)
+    for _ in range(20):
+        client.get("plans")
+    parents = []
+    send = client._send
+
+    def recording_send(*args):
+        current = current_span()
+        parents.append(None if current is None else current.name)
+        return send(*args)
+
+    monkeypatch.setattr(client, "_send", recording_send)
+    _ScriptedHandler.script = [(200, 0.3)]
+    tracer = Tracer(logging.getLogger(__name__))
+    with tracer.trace("update"):
+        assert client.get("plans").status_code == 200
+    assert parents == ["backend", "backend"]  # The original and its hedge
+    time.sleep(0.4)
+    tracer.close()
+    client.close()
+
+
+def test_half_open_trial_is_a_single_request(server_url):
+    client = _client(
+        server_url,
+        BACKEND_RETRIES=0,
+        BACKEND_BREAKER_THRESHOLD=1,
+        BACKEND_BREAKER_RESET=0.05,
+        BACKEND_HEDGE_MIN_DELAY=0.01,
+    )
+    for _ in range(20):
+        client.get("plans")
+    _ScriptedHandler.script = [(500, 0.0), (200, 0.3)]
+    client.get("plans")
+    time.sleep(0.06)
+    assert client.get("plans").status_code == 200  # Slow, but not hedged
+    assert len(_ScriptedHandler.calls) == 22
+    assert client.breaker("plans").state == "closed"
+    client.close()
+
+
+def test_trial_that_raises_reopens_the_circuit(server_url, monkeypatch):
+    client = _client(
+        server_url,
+        BACKEND_RETRIES=0,
+        BACKEND_BREAKER_THRESHOLD=1,
+        BACKEND_BREAKER_RESET=0.05,
+    )
+    _ScriptedHandler.script = [(500, 0.0)]
+    client.get("plans")
+    time.sleep(0.06)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("not a transport error")
+
+    monkeypatch.setattr(client, "_send", broken)
+    with pytest.raises(RuntimeError):
+        client.get("plans")
+    assert client.breaker("plans").state == "open"
+    monkeypatch.undo()
+    time.sleep(0.06)
+    assert client.get("plans").status_code == 200
+    client.close()
+
+
+def test_not_implemented_does_not_open_the_circuit(server_url):
+    client = _client(server_url, BACKEND_BREAKER_THRESHOLD=1)
+    _ScriptedHandler.script = [(501, 0.0), (404, 0.0), (501, 0.0)]
+    assert client.post("bulk").status_code == 501
+    assert client.post("bulk").status_code == 404
+    assert client.get("bulk").status_code == 501  # Not retried either
+    assert client.breaker("bulk").state == "closed"
+    assert len(_ScriptedHandler.calls) == 3
+    client.close()
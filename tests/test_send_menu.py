@@ -0,0 +1,67 @@
+import logging
+from typing import Any, List
+
+import httpx
+import pytest
+
+from handlers.lib.send_menu.send_menu import MENU_KEYBOARDS, menu_role
+from utils import AccessCache, BackendClient, Config, SessionStore
+
+
+class _StubBackend(BackendClient):
+    def __init__(self, cfg: Config, status_code: int) -> None:
+        super().__init__(cfg, logging.getLogger(__name__))
+        self.status_code = status_code
+        self.calls: List[str] = []
+
+    def request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        self.calls.append(endpoint)
+        return httpx.Response(
+            self.status_code,
+            json={"Resources": [{"Allowed": True}]},
+            request=httpx.Request(method, self.url(endpoint)),
+        )
+
+
+@pytest.fixture
+def config() -> Config:
+    return Config()
+
+
+def test_keyboards_are_built_once_per_role():
+    assert MENU_KEYBOARDS["client"] is MENU_KEYBOARDS["admin"]
+    buttons = [row[0].callback_data for row in MENU_KEYBOARDS["client"].inline_keyboard]
+    assert buttons == ["get_description", "get_personal_training", "send_report"]
+    assert MENU_KEYBOARDS["anonymous"].to_dict() == {
+        "inline_keyboard": [
+            [{"text": "🧐️️️️️️ Авторизация", "callback_data": "get_token"}]
+        ]
+    }
+
+
+def test_admin_role_needs_no_backend_call(config):
+    backend = _StubBackend(config, 200)
+    sessions = SessionStore(maxsize=8, ttl=60)
+    cache = AccessCache(maxsize=8, ttl=60)
+    admin: int = int(config.ADMIN_CHAT_ID)
+    assert menu_role(config, backend, sessions, cache, admin) == "admin"
+    assert backend.calls == []
+
+
+def test_role_follows_the_chat_session(config):
+    backend = _StubBackend(config, 200)
+    sessions = SessionStore(maxsize=8, ttl=60)
+    cache = AccessCache(maxsize=8, ttl=60)
+    sessions.set_api_key(7, "token")
+    assert menu_role(config, backend, sessions, cache, 7) == "client"
+    # Another chat does not inherit chat 7's token
+    assert menu_role(config, backend, sessions, cache, 8) == "anonymous"
+    assert len(backend.calls) == 1
+
+
+def test_rejected_token_gets_authorize_keyboard(config):
+    sessions = SessionStore(maxsize=8, ttl=60)
+    sessions.set_api_key(7, "expired")
+    cache = AccessCache(maxsize=8, ttl=60)
+    role = menu_role(config, _StubBackend(config, 403), sessions, cache, 7)
+    assert role == "anonymous"
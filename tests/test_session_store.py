@@ -0,0 +1,39 @@
+import time
+
+from utils import SessionStore
+
+
+def test_sessions_are_per_chat():
+    sessions = SessionStore(maxsize=8, ttl=60)
+    sessions.set_api_key(1, "first")
+    sessions.set_api_key(2, "second")
+    assert sessions.get_api_key(1) == "first"
+    assert sessions.get_api_key(2) == "second"
+    assert sessions.get_api_key(3) is None
+    assert sessions.stats() == {"hits": 2, "misses": 1, "loads": 0, "size": 2}
+
+
+def test_lookups_keep_active_chats_in_memory():
+    sessions = SessionStore(maxsize=8, ttl=0.2)
+    sessions.set_api_key(1, "token")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert sessions.get_api_key(1) == "token"
+    time.sleep(0.25)
+    assert sessions.get_api_key(1) is None
+
+
+def test_sqlite_tier_survives_eviction_and_restart(tmp_path):
+    path: str = str(tmp_path / "sessions" / "sessions.db")
+    sessions = SessionStore(maxsize=1, ttl=60, path=path)
+    sessions.set_api_key(1, "old")
+    sessions.set_api_key(1, "new")
+    sessions.set_api_key(2, "other")  # Evicts chat 1 from memory
+    assert sessions.get_api_key(1) == "new"
+    assert sessions.stats()["loads"] == 1
+    sessions.close()
+
+    restarted = SessionStore(maxsize=8, ttl=60, path=path)
+    assert restarted.get_api_key(2) == "other"
+    assert restarted.get_api_key(3) is None
+    restarted.close()
@@ -0,0 +1,129 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import Tracer, current_span, span, submit_traced, traced
+
+
+def _read_traces(path) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def _background_job() -> None:
+    with span("nested"):
+        pass
+
+
+def test_spans_form_a_tree_across_threads(tmp_path) -> None:
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(logging.getLogger("test"), path=str(path), sample_rate=1.0)
+    with tracer.trace("update", chat_id=1):
+        with span("backend", endpoint="plans") as current:
+            current.set(status=200)
+        job = traced("background", _background_job)
+        with pytest.raises(ValueError):
+            with span("render"):
+                raise ValueError
+    # The trace is only exported once the background job has run
+    assert not path.exists() or path.read_text() == ""
+    thread = threading.Thread(target=job)
+    thread.start()
+    thread.join()
+    tracer.close()
+
+    [trace] = _read_traces(path)
+    root = trace["root"]
+    assert root["name"] == "update"
+    assert root["attrs"] == {"chat_id": 1}
+    backend, background, render = root["children"]
+    assert backend["attrs"] == {"endpoint": "plans", "status": 200}
+    assert background["name"] == "background"
+    assert background["children"][0]["name"] == "nested"
+    assert render["error"] == "ValueError"
+    assert current_span() is None
+
+
+def test_unsampled_fast_traces_are_dropped_and_slow_ones_logged(
+    tmp_path, caplog
+) -> None:
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(
+        logging.getLogger("test"), path=str(path), sample_rate=0.0, slow_threshold=0.0
+    )
+    with caplog.at_level(logging.WARNING, logger="test"):
+        with tracer.trace("slow_update"):
+            with span("backend"):
+                pass
+    tracer.close()
+
+    [trace] = _read_traces(path)
+    assert trace["slow"] is True
+    assert "Slow update slow_update" in caplog.text
+    assert "backend" in caplog.text
+
+
+def test_span_outside_a_trace_does_nothing() -> None:
+    with span("backend") as current:
+        assert current is None
+    job = lambda: 1
+    assert traced("background", job) is job
+
+
+def test_slowness_is_decided_by_the_root_span(tmp_path, caplog) -> None:
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(
+        logging.getLogger("test"), path=str(path), sample_rate=1.0, slow_threshold=0.1
+    )
+    with caplog.at_level(logging.WARNING, logger="test"):
+        with tracer.trace("update"):
+            job = traced("send_message", time.sleep)
+        job(0.15)  # Queued work finishing late does not make the update slow
+    tracer.close()
+
+    [trace] = _read_traces(path)
+    assert trace["slow"] is False
+    assert trace["total_ms"] >= 150 > trace["duration_ms"]
+    assert "Slow update" not in caplog.text
+
+
+def test_span_of_a_refused_job_is_finished(tmp_path) -> None:
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(logging.getLogger("test"), path=str(path), sample_rate=1.0)
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    with tracer.trace("update"):
+        with pytest.raises(RuntimeError):
+            submit_traced(executor, "background", _background_job)
+    tracer.close()
+
+    [trace] = _read_traces(path)
+    [background] = trace["root"]["children"]
+    assert background["error"] == "RuntimeError"
+
+
+def test_span_finished_by_racing_threads_counts_once(tmp_path) -> None:
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(logging.getLogger("test"), path=str(path), sample_rate=1.0)
+    with tracer.trace("update"):
+        child = current_span().child("send")
+        barrier = threading.Barrier(8)
+
+        def finish() -> None:
+            barrier.wait()
+            child.finish()
+
+        threads = [threading.Thread(target=finish) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert child.trace.open == 1  # Only the root is left
+    tracer.close()
+
+    [trace] = _read_traces(path)
+    assert [span["name"] for span in trace["root"]["children"]] == ["send"]
@@ -0,0 +1,67 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import pytest
+from pydantic import ValidationError
+
+from utils import FitnessDay, SwimmingDay, parse_week, render_week
+
+
+def _resources(file_name: str) -> List[Dict[str, Any]]:
+    with open(os.path.join("tests", "test_data", file_name)) as f:
+        return json.load(f)["Resources"]
+
+
+@pytest.fixture
+def fitness_week() -> List[Dict[str, Any]]:
+    return _resources("double_fitness_training.json")
+
+
+@pytest.fixture
+def swimming_week() -> List[Dict[str, Any]]:
+    return _resources("double_swimming_training.json")
+
+
+def test_parses_days_by_training_type(fitness_week, swimming_week):
+    days = parse_week(fitness_week + swimming_week)
+    assert [type(day) for day in days] == [
+        FitnessDay,
+        FitnessDay,
+        SwimmingDay,
+        SwimmingDay,
+    ]
+    assert days[2].Exercises[0].Equipment.PullBuoy is False
+    assert not hasattr(days[0], "__dict__")
+
+
+def test_rejects_pool_flag_on_fitness_day(fitness_week):
+    fitness_week[0]["inSwimmingPool"] = True
+    with pytest.raises(ValidationError):
+        parse_week(fitness_week)
+
+
+def test_rejects_gym_flag_on_swimming_day(swimming_week):
+    swimming_week[1]["inGym"] = True
+    with pytest.raises(ValidationError):
+        parse_week(swimming_week)
+
+
+def test_rejects_unknown_training_type(fitness_week):
+    fitness_week[0]["trainingType"] = "yoga"
+    with pytest.raises(ValidationError):
+        parse_week(fitness_week)
+
+
+def test_render_week_reads_parsed_days(swimming_week):
+    rendered: str = render_week(parse_week(swimming_week))
+    assert "(в бассейне)" in rendered
+    assert "с колобашкой" in rendered
+
+
+def test_fractional_speed_is_kept(swimming_week):
+    swimming_week[0]["Exercises"][0]["Speed"] = 1.5
+    days = parse_week(swimming_week)
+    assert days[0].Exercises[0].Speed == 1.5
+    assert isinstance(days[1].Exercises[0].Speed, int)
+    assert "скорость 1.5/" in render_week(days)
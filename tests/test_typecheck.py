@@ -0,0 +1,39 @@
+import pytest
+from typeguard import TypeCheckError
+
+from utils import typecheck
+from utils.utils import separator
+
+
+def _double(value: int) -> int:
+    return value * 2
+
+
+def test_tests_run_in_strict_profile():
+    assert typecheck.runtime_profile() == "strict"
+    with pytest.raises(TypeCheckError):
+        separator("10")
+
+
+def test_strict_profile_checks_calls(monkeypatch):
+    monkeypatch.setattr(typecheck, "runtime_profile", lambda: "strict")
+    checked = typecheck.typechecked(_double)
+    with pytest.raises(TypeCheckError):
+        checked("2")
+
+
+def test_production_profile_leaves_function_untouched(monkeypatch):
+    monkeypatch.setattr(typecheck, "runtime_profile", lambda: "production")
+    assert typecheck.typechecked(_double) is _double
+
+
+def test_unknown_profile_is_rejected(monkeypatch):
+    monkeypatch.setenv("RUNTIME_PROFILE", "prod")
+    typecheck.runtime_profile.cache_clear()
+    try:
+        with pytest.raises(ValueError, match="prod"):
+            typecheck.runtime_profile()
+    finally:
+        monkeypatch.undo()
+        typecheck.runtime_profile.cache_clear()
+    assert typecheck.runtime_profile() == "strict"
@@ -0,0 +1,74 @@
+import logging
+import socket
+from typing import Iterator
+
+import pytest
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler, Updater
+
+from loadtest import FakeTelegram
+from main import start_receiving_updates
+from utils import Config
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _reply(update: Update, context: CallbackContext) -> None:
+    context.bot.send_message(chat_id=update.effective_chat.id, text="pong")
+
+
+@pytest.fixture
+def telegram() -> Iterator[FakeTelegram]:
+    fake = FakeTelegram().start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def config() -> Config:
+    port: int = _free_port()
+    return Config(
+        UPDATES_MODE="webhook",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=port,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        DISPATCHER_WORKERS=2,
+    )
+
+
+@pytest.fixture
+def updater(telegram, config) -> Iterator[Updater]:
+    updater = Updater(
+        token=config.TOKEN,
+        base_url=telegram.base_url,
+        workers=config.DISPATCHER_WORKERS,
+        use_context=True,
+    )
+    updater.dispatcher.add_handler(CommandHandler("start", _reply))
+    yield updater
+    updater.stop()
+
+
+def test_webhook_registers_and_dispatches_updates(telegram, config, updater):
+    start_receiving_updates(updater, config, logging.getLogger(__name__))
+    assert telegram.webhook_url == f"{config.WEBHOOK_URL}/{config.WEBHOOK_PATH}"
+
+    for chat_id in (10, 11, 12):
+        telegram.post_message(chat_id, "/start")
+
+    for chat_id in (10, 11, 12):
+        replies = telegram.wait_for_messages(chat_id, 1)
+        assert [reply["text"] for reply in replies] == ["pong"]
+
+
+def test_polling_mode_deletes_webhook(telegram, updater):
+    telegram.webhook_url = "http://example.invalid/telegram"
+    config: Config = Config(POLL_TIMEOUT=0.5)
+    start_receiving_updates(updater, config, logging.getLogger(__name__))
+    telegram.post_message(20, "/start")
+    assert telegram.wait_for_messages(20, 1)[0]["text"] == "pong"
+    assert telegram.webhook_url == ""
@@ -2,6 +2,8 @@ from .consts import Config
 from .utils import (
     load_messages,
     convert_json_to_human_readable,
+    render_week,
+    iter_week_blocks,
     is_admin,
     fetch_calender_week,
     format_report_with_gpt,
@@ -11,5 +13,30 @@ from .utils import (
     has_access,
     separator,
 )
+from .training import (
+    FitnessDay,
+    FitnessExercise,
+    SwimmingDay,
+    SwimmingEquipment,
+    SwimmingExercise,
+    TrainingDay,
+    parse_week,
+)
+from .packing import pack_messages, utf16_length
+from .tracing import Tracer, Span, current_span, span, submit_traced, traced
+from .metrics import Metrics, MetricsServer, instrument_handler
+from .resilience import BackendUnavailable, CircuitBreaker
+from .backend_client import BackendClient
+from .access_cache import AccessCache
+from .session_store import SessionStore
+from .persistence import SQLitePersistence, open_persistence
+from .plan_cache import PlanCache, PlanKey, RenderedPlan
+from .plan_client import BatchPlanClient, PlanResult
+from .metadata_cache import MetadataCache
+from .report_pipeline import ReportPipeline
+from .prefetch import next_week, prefetch_plans
+from .outbox import OutboundQueue
+from .broadcast import Broadcaster
+from .message_catalog import MessageCatalog
 from .commands import Commands
 from .prompts import Prompts
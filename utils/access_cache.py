@@ -0,0 +1,50 @@
+from threading import Lock
+from typing import Dict, Optional
+
+from cachetools import TTLCache
+from .typecheck import typechecked
+
+
+class AccessCache:
+    """
+    Bounded TTL + LRU cache of access decisions keyed by API token.
+
+    Lets the menu and greeting reuse a recent answer from the backend
+    instead of asking ALLOWED_PERSONAL_TRAINING on every render.
+    """
+
+    @typechecked
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock: Lock = Lock()
+        self._hits: int = 0
+        self._misses: int = 0
+
+    def get(self, api_token: str) -> Optional[bool]:
+        with self._lock:
+            allowed: Optional[bool] = self._cache.get(api_token)
+            if allowed is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return allowed
+
+    def set(self, api_token: str, allowed: bool) -> None:
+        with self._lock:
+            self._cache[api_token] = allowed
+
+    def invalidate(self, api_token: str) -> None:
+        with self._lock:
+            self._cache.pop(api_token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._cache),
+            }
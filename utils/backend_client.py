@@ -0,0 +1,255 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from logging import Logger
+from threading import Event, Lock
+from typing import Any, Dict, Optional, Set, Tuple
+
+import httpx
+from .typecheck import typechecked
+
+from .consts import Config
+from .metrics import Metrics
+from .resilience import BackendUnavailable, CircuitBreaker, LatencyWindow, backoff_delay
+from .tracing import current_span, span
+
+# Failures worth another attempt: the request never reached the backend, or
+# the backend said so. A read timeout is not retried, the hedge covers it
+RETRYABLE_ERRORS: Tuple[type, ...] = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.RemoteProtocolError,
+)
+
+
+def is_outage(response: httpx.Response) -> bool:
+    """
+    5xx answers count against the circuit and are retried. A 4xx is an
+    answer, and so is 501: the backend does not have the endpoint at all,
+    e.g. the optional bulk plan endpoint.
+    """
+    return response.status_code >= 500 and response.status_code != 501
+
+
+class BackendClient:
+    """
+    Shared HTTP client for the backend API.
+
+    Keeps a pool of keep-alive connections, so consecutive calls made while
+    handling one update reuse warm TCP/TLS connections instead of opening
+    a new one per request. With `metrics`, every call is tracked as
+    `bot_backend_*{method, endpoint}`, counted by HTTP status code, and
+    every call made while handling a traced update is a span of its trace.
+
+    Every endpoint has a circuit breaker: after BACKEND_BREAKER_THRESHOLD
+    failures (errors or 5xx other than 501) in a row, calls raise
+    BackendUnavailable right away for BACKEND_BREAKER_RESET seconds. GETs
+    are idempotent, so they are also retried with jittered backoff and,
+    once an endpoint has enough history, hedged: if no answer came within
+    the endpoint's BACKEND_HEDGE_QUANTILE latency, a duplicate is sent and
+    the first good answer wins. Other methods are sent exactly once.
+    """
+
+    @typechecked
+    def __init__(
+        self, cfg: Config, logger: Logger, metrics: Optional[Metrics] = None
+    ) -> None:
+        self._base_url: str = f"{cfg.BACKEND_API}/{cfg.VERSION}"
+        self._logger: Logger = logger
+        self._metrics: Optional[Metrics] = metrics
+        self._client: httpx.Client = self._build_client(cfg)
+
+        self._retries: int = cfg.BACKEND_RETRIES
+        self._backoff: float = cfg.BACKEND_RETRY_BACKOFF
+        self._backoff_max: float = cfg.BACKEND_RETRY_BACKOFF_MAX
+        self._hedge_quantile: float = cfg.BACKEND_HEDGE_QUANTILE
+        self._hedge_min_delay: float = cfg.BACKEND_HEDGE_MIN_DELAY
+        self._breaker_threshold: int = cfg.BACKEND_BREAKER_THRESHOLD
+        self._breaker_reset: float = cfg.BACKEND_BREAKER_RESET
+        self._state_lock: Lock = Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyWindow] = {}
+        # Hedged GETs run here, so the caller can take whichever answers first
+        self._hedge_pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=cfg.BACKEND_MAX_CONNECTIONS, thread_name_prefix="backend"
+        )
+
+    def _build_client(self, cfg: Config) -> httpx.Client:
+        limits = httpx.Limits(
+            max_connections=cfg.BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=cfg.BACKEND_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=cfg.BACKEND_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            cfg.BACKEND_TIMEOUT, connect=cfg.BACKEND_CONNECT_TIMEOUT
+        )
+        try:
+            return httpx.Client(limits=limits, timeout=timeout, http2=cfg.BACKEND_HTTP2)
+        except ImportError:
+            # http2=True needs the optional "h2" package
+            self._logger.warning(
+                "HTTP/2 requested for backend but 'h2' is not installed, "
+                "falling back to HTTP/1.1"
+            )
+            return httpx.Client(limits=limits, timeout=timeout)
+
+    def url(self, endpoint: str) -> str:
+        return f"{self._base_url}/{endpoint}"
+
+    def request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        with span("backend", method=method, endpoint=endpoint) as current:
+            response: httpx.Response = self._request(method, endpoint, **kwargs)
+            if current is not None:
+                current.set(status=response.status_code)
+        return response
+
+    def _request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        if self._metrics is None:
+            return self._call(method, endpoint, kwargs)
+        with self._metrics.track(
+            "bot_backend", method=method, endpoint=endpoint
+        ) as outcome:
+            response: httpx.Response = self._call(method, endpoint, kwargs)
+            outcome.status = str(response.status_code)
+        return response
+
+    # ---------------------------------------
+    # ------- Retries, hedging, breaker -----
+    # ---------------------------------------
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._state_lock:
+            breaker: Optional[CircuitBreaker] = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    self._breaker_threshold, self._breaker_reset
+                )
+            return breaker
+
+    def _window(self, endpoint: str) -> LatencyWindow:
+        with self._state_lock:
+            window: Optional[LatencyWindow] = self._latencies.get(endpoint)
+            if window is None:
+                window = self._latencies[endpoint] = LatencyWindow()
+            return window
+
+    def _count(self, event: str, endpoint: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc(f"bot_backend_{event}_total", (("endpoint", endpoint),))
+
+    def _call(
+        self, method: str, endpoint: str, kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        breaker: CircuitBreaker = self.breaker(endpoint)
+        retries: int = self._retries if method == "GET" else 0
+        attempt: int = 0
+        while True:
+            if not breaker.allow():
+                self._count("circuit_open", endpoint)
+                raise BackendUnavailable(f"Backend endpoint {endpoint} is unavailable")
+            last: bool = attempt == retries
+            # The trial call of a half-open circuit is a single request
+            hedge: bool = method == "GET" and breaker.state == "closed"
+            response: Optional[httpx.Response] = None
+            failed: bool = True  # Also if anything unexpected is raised
+            try:
+                response = (
+                    self._hedged(endpoint, kwargs)
+                    if hedge
+                    else self._send(method, endpoint, kwargs)
+                )
+                failed = is_outage(response)
+            except httpx.TransportError as e:
+                if last or not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+            finally:
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if response is not None and (not failed or last):
+                return response
+            self._count("retries", endpoint)
+            current = current_span()
+            if current is not None:
+                current.set(attempts=attempt + 2)
+            time.sleep(backoff_delay(attempt, self._backoff, self._backoff_max))
+            attempt += 1
+
+    def _send(
+        self, method: str, endpoint: str, kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        started: float = time.perf_counter()
+        response: httpx.Response = self._client.request(
+            method, self.url(endpoint), **kwargs
+        )
+        if not is_outage(response):
+            self._window(endpoint).add(time.perf_counter() - started)
+        return response
+
+    def _hedge_delay(self, endpoint: str) -> Optional[float]:
+        if self._hedge_quantile <= 0:
+            return None
+        latency: Optional[float] = self._window(endpoint).quantile(self._hedge_quantile)
+        return None if latency is None else max(self._hedge_min_delay, latency)
+
+    def _hedged(self, endpoint: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        delay: Optional[float] = self._hedge_delay(endpoint)
+        if delay is None:
+            return self._send("GET", endpoint, kwargs)
+        started: Event = Event()
+        primary: Future = self._submit(endpoint, kwargs, started)
+        # Time queued behind other callers' requests is not the backend's
+        started.wait()
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        self._count("hedges", endpoint)
+        current = current_span()
+        if current is not None:
+            current.set(hedged=True)
+        hedge: Future = self._submit(endpoint, kwargs)
+        pending: Set[Future] = {primary, hedge}
+        finished: Future = primary
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None and not is_outage(finished.result()):
+                    return finished.result()
+        # Both failed; report the last one
+        return finished.result()
+
+    def _submit(
+        self, endpoint: str, kwargs: Dict[str, Any], started: Optional[Event] = None
+    ) -> Future:
+        """
+        Sends the GET on the hedge pool, in a copy of the caller's context so
+        it stays part of the caller's trace. `started` is set once it runs.
+        """
+
+        def send() -> httpx.Response:
+            if started is not None:
+                started.set()
+            return self._send("GET", endpoint, kwargs)
+
+        return self._hedge_pool.submit(contextvars.copy_context().run, send)
+
+    def get(self, endpoint: str, **kwargs: Any) -> httpx.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs: Any) -> httpx.Response:
+        return self.request("PUT", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs: Any) -> httpx.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def delete(self, endpoint: str, **kwargs: Any) -> httpx.Response:
+        return self.request("DELETE", endpoint, **kwargs)
+
+    def close(self) -> None:
+        self._hedge_pool.shutdown(wait=False)
+        self._client.close()
@@ -0,0 +1,508 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from logging import Logger
+from typing import Any, Dict, List, Literal, Mapping, Optional, Tuple
+
+from telegram.error import Unauthorized
+
+from .consts import Config
+from .outbox import OutboundQueue, TokenBucket
+from .packing import pack_messages
+from .plan_cache import PlanCache, PlanKey, RenderedPlan
+from .plan_client import BatchPlanClient, PlanResult
+from .session_store import SessionStore
+from .training import TrainingDay, parse_week
+from .typecheck import typechecked
+from .utils import iter_week_blocks
+
+Status = Literal["pending", "delivered", "failed", "skipped"]
+STATUSES: Tuple[Status, ...] = ("pending", "delivered", "failed", "skipped")
+# (chat_id, "pending" and its messages, or why there are none)
+Rendered = Tuple[int, Status, List[str]]
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id TEXT PRIMARY KEY,
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS broadcast_chats (
+    broadcast_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (broadcast_id, chat_id)
+);
+"""
+
+
+class Broadcaster:
+    """
+    Pushes a week's plan to every authorized chat.
+
+    Pending chats are taken in batches of `batch_size`; while one batch is
+    queued, the plans of the next are fetched through the batch plan
+    client, or taken from the plan cache where they were prefetched, and
+    rendered by `workers` threads as they arrive.
+    Messages go through the outbox no faster than `rate` per second, which
+    leaves the rest of its global budget to interactive traffic.
+
+    Each chat's status is kept in SQLite and set once the outbox has
+    delivered or dropped all of its messages, so a broadcast cut short by a
+    crash or a shutdown goes on with the chats still pending when it is run
+    again for the same week. Chats that failed are tried again by that run
+    as well; chats that blocked the bot, or whose API key is no longer
+    valid, are skipped for good. A broadcast is finished once no chat is
+    pending or failed. With path="" progress is kept in memory only.
+    """
+
+    @typechecked
+    def __init__(
+        self,
+        cfg: Config,
+        logger: Logger,
+        messages: Mapping[str, Any],
+        plans: BatchPlanClient,
+        sessions: SessionStore,
+        plan_cache: PlanCache,
+        outbox: OutboundQueue,
+        path: str = "",
+        batch_size: int = 100,
+        workers: int = 4,
+        rate: float = 20.0,
+        drain_timeout: float = 600.0,
+    ) -> None:
+        self._cfg: Config = cfg
+        self._logger: Logger = logger
+        self._messages: Mapping[str, Any] = messages
+        self._plans: BatchPlanClient = plans
+        self._sessions: SessionStore = sessions
+        self._plan_cache: PlanCache = plan_cache
+        self._outbox: OutboundQueue = outbox
+        self._batch_size: int = max(1, batch_size)
+        self._workers: int = max(1, workers)
+        self._rate: float = rate
+        self._drain_timeout: float = drain_timeout
+
+        if path:
+            directory: str = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        # Autocommit; batches of rows are wrapped in explicit transactions
+        self._db: Optional[sqlite3.Connection] = sqlite3.connect(
+            path or ":memory:", check_same_thread=False, isolation_level=None
+        )
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db_lock: threading.Lock = threading.Lock()
+
+        # Held for the whole of a broadcast; there is at most one at a time
+        self._running: threading.Lock = threading.Lock()
+        self._active: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping: threading.Event = threading.Event()
+        # Messages of each chat the outbox has not delivered or dropped yet
+        self._condition: threading.Condition = threading.Condition()
+        self._remaining: Dict[int, int] = {}
+        # The error a chat's messages were dropped for, if any
+        self._errors: Dict[int, Optional[Exception]] = {}
+        self._delivered_messages: int = 0
+
+    # ---------------------------------------
+    # ------- Control -----------------------
+    # ---------------------------------------
+
+    def start(self, year: int, week: int) -> bool:
+        """Runs the broadcast on a background thread; False if one is running."""
+        if not self._running.acquire(blocking=False):
+            return False
+
+        def run() -> None:
+            try:
+                self._broadcast(year, week)
+            except Exception:
+                self._logger.exception("Broadcast of %s-W%s failed", year, week)
+            finally:
+                self._running.release()
+
+        self._thread = threading.Thread(target=run, name="broadcast", daemon=True)
+        self._thread.start()
+        return True
+
+    def run(self, year: int, week: int) -> Dict[str, float]:
+        """Runs the broadcast on the calling thread and returns its stats."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A broadcast is already running")
+        try:
+            return self._broadcast(year, week)
+        finally:
+            self._running.release()
+
+    def resume(self, year: int, week: int) -> bool:
+        """Starts the broadcast of (year, week) if one was left unfinished."""
+        with self._db_lock:
+            if self._db is None:
+                return False
+            row = self._db.execute(
+                "SELECT 1 FROM broadcasts WHERE id = ? AND finished IS NULL",
+                (_broadcast_id(year, week),),
+            ).fetchone()
+        if row is None:
+            return False
+        self._logger.info("Resuming the unfinished broadcast of %s-W%s", year, week)
+        return self.start(year, week)
+
+    def running(self) -> bool:
+        return self._running.locked()
+
+    def finished(self, year: int, week: int) -> bool:
+        """True if the plans of (year, week) went out to every chat."""
+        with self._db_lock:
+            if self._db is None:
+                return False
+            row = self._db.execute(
+                "SELECT 1 FROM broadcasts WHERE id = ? AND finished IS NOT NULL",
+                (_broadcast_id(year, week),),
+            ).fetchone()
+        return row is not None
+
+    def progress(
+        self, year: Optional[int] = None, week: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Chats by status in the broadcast of (year, week), or else in the
+        running broadcast, or the last one.
+        """
+        with self._db_lock:
+            if self._db is None:
+                return dict.fromkeys(STATUSES, 0)
+            broadcast_id: Optional[str] = self._active
+            if year is not None and week is not None:
+                broadcast_id = _broadcast_id(year, week)
+            elif broadcast_id is None:
+                row = self._db.execute(
+                    "SELECT id FROM broadcasts ORDER BY started DESC LIMIT 1"
+                ).fetchone()
+                broadcast_id = None if row is None else row[0]
+            return self._count(broadcast_id)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stops queueing plans and waits up to `timeout` for the broadcast;
+        chats not reached yet stay pending for the next run.
+        """
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()  # Ends the wait for confirmations
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Still inside a request; its progress is written up to here
+                self._logger.warning(
+                    "Broadcast did not stop within %ss, leaving its database open",
+                    timeout,
+                )
+                return
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ---------------------------------------
+    # ------- Broadcast ---------------------
+    # ---------------------------------------
+
+    def _broadcast(self, year: int, week: int) -> Dict[str, float]:
+        broadcast_id: str = _broadcast_id(year, week)
+        started: float = time.monotonic()
+        clients: Dict[int, str] = dict(self._sessions.items())
+        pending: List[int] = self._prepare(broadcast_id, year, week, clients)
+        self._logger.info(
+            "Broadcasting %s to %d of %d chats",
+            broadcast_id,
+            len(pending),
+            len(clients),
+        )
+        with self._condition:
+            self._delivered_messages = 0
+
+        bucket: TokenBucket = TokenBucket(self._rate, max(1.0, self._rate))
+        batches: List[List[int]] = [
+            pending[i : i + self._batch_size]
+            for i in range(0, len(pending), self._batch_size)
+        ]
+        with ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="broadcast"
+        ) as pool, ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="broadcast_load"
+        ) as loader:
+
+            def load(index: int) -> Optional[Future]:
+                if index >= len(batches):
+                    return None
+                return loader.submit(
+                    self._load, batches[index], clients, year, week, pool
+                )
+
+            # The next batch is fetched while the current one is queued.
+            # A batch or chat that cannot be loaded is failed, so the next
+            # run tries it again, and the broadcast goes on with the rest
+            ahead: Optional[Future] = load(0)
+            for index in range(len(batches)):
+                current: Dict[Future, int]
+                try:
+                    current = ahead.result()
+                except Exception:
+                    self._logger.exception(
+                        "Loading %d chats to broadcast failed", len(batches[index])
+                    )
+                    for chat_id in batches[index]:
+                        self._set_status(broadcast_id, chat_id, "failed")
+                    current = {}
+                ahead = load(index + 1)
+                for future in as_completed(current):
+                    if self._stopping.is_set():
+                        break
+                    chat_id: int = current[future]
+                    status: Status
+                    texts: List[str]
+                    try:
+                        chat_id, status, texts = future.result()
+                    except Exception:
+                        self._logger.exception(
+                            "Rendering the plan of %s to broadcast failed", chat_id
+                        )
+                        status, texts = "failed", []
+                    if status == "pending":
+                        self._queue(broadcast_id, chat_id, texts, bucket)
+                    else:
+                        self._set_status(broadcast_id, chat_id, status)
+                if self._stopping.is_set():
+                    if ahead is not None:
+                        ahead.cancel()
+                    break
+
+        self._drain()
+        return self._finish(broadcast_id, year, week, time.monotonic() - started)
+
+    def _prepare(
+        self, broadcast_id: str, year: int, week: int, clients: Dict[int, str]
+    ) -> List[int]:
+        """Records the broadcast and returns its chats still to be sent to."""
+        with self._db_lock:
+            if self._db is None:
+                raise RuntimeError("Broadcaster is closed")
+            self._active = broadcast_id
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR IGNORE INTO broadcasts (id, year, week, started) "
+                "VALUES (?, ?, ?, ?)",
+                (broadcast_id, year, week, time.time()),
+            )
+            # Chats authorized since an interrupted run are added to it
+            self._db.executemany(
+                "INSERT OR IGNORE INTO broadcast_chats (broadcast_id, chat_id, status) "
+                "VALUES (?, ?, 'pending')",
+                ((broadcast_id, chat_id) for chat_id in clients),
+            )
+            # Chats that failed last time are tried again
+            self._db.execute(
+                "UPDATE broadcast_chats SET status = 'pending' "
+                "WHERE broadcast_id = ? AND status = 'failed'",
+                (broadcast_id,),
+            )
+            self._db.execute("COMMIT")
+            rows = self._db.execute(
+                "SELECT chat_id FROM broadcast_chats "
+                "WHERE broadcast_id = ? AND status = 'pending' ORDER BY chat_id",
+                (broadcast_id,),
+            )
+            return [chat_id for (chat_id,) in rows]
+
+    def _load(
+        self,
+        batch: List[int],
+        clients: Dict[int, str],
+        year: int,
+        week: int,
+        pool: ThreadPoolExecutor,
+    ) -> Dict[Future, int]:
+        """
+        Fetches the plans of a batch that are not cached and hands them to
+        the worker pool to render as they arrive; returns the chat of each.
+        """
+        rendered: Dict[Future, int] = {}
+        keys: List[PlanKey] = []
+        for chat_id in batch:
+            plan: Optional[RenderedPlan] = self._plan_cache.get((chat_id, year, week))
+            if plan is None:
+                keys.append((chat_id, year, week))
+            else:
+                future: Future = pool.submit(self._pack, chat_id, plan, year, week)
+                rendered[future] = chat_id
+        # Chats whose session is gone since an interrupted run come back as 401
+        for result in self._plans.fetch(keys, clients, self._workers):
+            rendered[pool.submit(self._render, result, year, week)] = result.key[0]
+        return rendered
+
+    def _render(self, result: PlanResult, year: int, week: int) -> Rendered:
+        chat_id: int = result.key[0]
+        if result.status in (401, 403):
+            return chat_id, "skipped", []
+        if result.status != 200 or result.resources is None:
+            self._logger.warning(
+                "Fetching plan %s to broadcast failed: HTTP %s %s",
+                result.key,
+                result.status,
+                result.error or "",
+            )
+            return chat_id, "failed", []
+        if not result.resources:
+            return chat_id, "skipped", []
+        try:
+            days: List[TrainingDay] = parse_week(result.resources)
+        except (ValueError, KeyError, TypeError) as e:
+            self._logger.warning("Parsing plan %s failed: %r", result.key, e)
+            return chat_id, "failed", []
+        plan: RenderedPlan = RenderedPlan(
+            text="".join(iter_week_blocks(days)), resources=result.resources
+        )
+        # A plan still waiting for its tg_id is left to the plan handler
+        if all(day.TgId != 0 for day in days):
+            self._plan_cache.set(result.key, plan)
+        return self._pack(chat_id, plan, year, week)
+
+    def _pack(self, chat_id: int, plan: RenderedPlan, year: int, week: int) -> Rendered:
+        header: str = self._messages["weekly_plan"].format(year=year, week=week)
+        return (
+            chat_id,
+            "pending",
+            list(pack_messages([header, plan.text], self._cfg.MAX_MESSAGE_LENGTH)),
+        )
+
+    def _queue(
+        self, broadcast_id: str, chat_id: int, texts: List[str], bucket: TokenBucket
+    ) -> None:
+        with self._condition:
+            self._remaining[chat_id] = len(texts)
+            self._errors[chat_id] = None
+
+        def on_done(error: Optional[Exception]) -> None:
+            self._confirm(broadcast_id, chat_id, error)
+
+        for text in texts:
+            now: float = time.monotonic()
+            delay: float = bucket.delay(now)
+            if delay > 0:
+                # Cut short by close(); the rest of the chat's plan still goes
+                self._stopping.wait(delay)
+                now = time.monotonic()
+            bucket.take(now)
+            self._outbox.send(chat_id=chat_id, text=text, on_done=on_done)
+
+    def _confirm(
+        self, broadcast_id: str, chat_id: int, error: Optional[Exception]
+    ) -> None:
+        """Called by the outbox for every message; settles the chat after its last."""
+        with self._condition:
+            if chat_id not in self._remaining:
+                return
+            self._remaining[chat_id] -= 1
+            if error is None:
+                self._delivered_messages += 1
+            else:
+                self._errors[chat_id] = error
+            if self._remaining[chat_id] > 0:
+                return
+            del self._remaining[chat_id]
+            error = self._errors.pop(chat_id)
+            self._condition.notify_all()
+        status: Status
+        if error is None:
+            status = "delivered"
+        elif isinstance(error, Unauthorized):  # Blocked the bot, or left
+            status = "skipped"
+        else:
+            status = "failed"
+        self._set_status(broadcast_id, chat_id, status)
+
+    def _drain(self) -> None:
+        """Waits for the outbox to settle every chat queued by this run."""
+        deadline: float = time.monotonic() + self._drain_timeout
+        with self._condition:
+            while (
+                self._remaining
+                and not self._stopping.is_set()
+                and time.monotonic() < deadline
+            ):
+                self._condition.wait(deadline - time.monotonic())
+            if self._remaining:
+                self._logger.warning(
+                    "%d chats of the broadcast are still unconfirmed",
+                    len(self._remaining),
+                )
+            # Late confirmations are ignored; those chats stay pending
+            self._remaining.clear()
+            self._errors.clear()
+
+    def _set_status(self, broadcast_id: str, chat_id: int, status: Status) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "UPDATE broadcast_chats SET status = ? "
+                "WHERE broadcast_id = ? AND chat_id = ?",
+                (status, broadcast_id, chat_id),
+            )
+
+    def _count(self, broadcast_id: Optional[str]) -> Dict[str, int]:
+        """Called with the database lock held."""
+        counts: Dict[str, int] = dict.fromkeys(STATUSES, 0)
+        if broadcast_id is None or self._db is None:
+            return counts
+        rows = self._db.execute(
+            "SELECT status, COUNT(*) FROM broadcast_chats "
+            "WHERE broadcast_id = ? GROUP BY status",
+            (broadcast_id,),
+        )
+        counts.update(rows)
+        return counts
+
+    def _finish(
+        self, broadcast_id: str, year: int, week: int, seconds: float
+    ) -> Dict[str, float]:
+        with self._condition:
+            messages: int = self._delivered_messages
+        with self._db_lock:
+            counts: Dict[str, int] = self._count(broadcast_id)
+            if self._db is not None and counts["pending"] == counts["failed"] == 0:
+                self._db.execute(
+                    "UPDATE broadcasts SET finished = ? WHERE id = ?",
+                    (time.time(), broadcast_id),
+                )
+            self._active = None
+        stats: Dict[str, float] = {
+            "chats": sum(counts.values()),
+            **counts,
+            "messages": messages,
+            "seconds": round(seconds, 1),
+            "per_second": round(messages / seconds, 1) if seconds > 0 else 0.0,
+        }
+        self._logger.info("Broadcast %s done: %s", broadcast_id, stats)
+        self._outbox.send(
+            chat_id=int(self._cfg.ADMIN_CHAT_ID),
+            text=self._messages["broadcast_finished"].format(
+                year=year, week=week, **stats
+            ),
+        )
+        return stats
+
+
+def _broadcast_id(year: int, week: int) -> str:
+    return f"{year}-W{week:02d}"
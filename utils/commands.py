@@ -13,7 +13,7 @@ class ClientCommands(UserCommands):
 
 
 class AdminCommands(ClientCommands):
-    pass
+    broadcast: str = "📣 Разослать тренировки на неделю"
 
 
 class Commands(BaseModel):
@@ -1,39 +1,211 @@
 import os
-from typing import Literal, Pattern
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Literal, Pattern
 from dotenv import load_dotenv
 import re
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, ConfigDict, model_validator, validator
 
-load_dotenv()
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """Loads .env into os.environ, once per process."""
+    load_dotenv()
+
+
+# Settings read from an environment variable with a different name
+ENV_ALIASES: Dict[str, str] = {"TOKEN": "LIUBA_TELEGRAM_TOKEN"}
+# Settings that are the same for every deployment and never read from the
+# environment
+CONSTANTS: FrozenSet[str] = frozenset(
+    {
+        "VERSION",
+        "MAX_MESSAGE_LENGTH",
+        "MESSAGES_DIR",
+        "MESSAGES_FILE",
+        "LOG_FILE_NAME",
+        "OUTPUT_LOG_FILE_NAME",
+        "MODEL_TYPE",
+    }
+)
 
 
 class Config(BaseModel):
-    TOKEN: str = os.environ["LIUBA_TELEGRAM_TOKEN"]
-    ADMIN_NAME: str = os.environ["ADMIN_NAME"]
-    ADMIN_CHAT_ID: str = os.environ["ADMIN_CHAT_ID"]
-    BACKEND_API: str = os.environ["BACKEND_API"]
+    """
+    Bot settings. Anything not passed explicitly is read from the
+    environment variable of the same name (see ENV_ALIASES) when the
+    instance is built, so importing this module has no side effects. The
+    container builds one instance per process and nothing may change it.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    TOKEN: str
+    TELEGRAM_API_URL: str = "https://api.telegram.org/bot"
+    ADMIN_NAME: str
+    ADMIN_CHAT_ID: str
+    BACKEND_API: str
     VERSION: str = "v1"
-    PERSONAL_TRAINING_ENDPOINT: str = os.environ["PERSONAL_TRAINING_ENDPOINT"]
-    CURRENT_PERSONAL_TRAINING_ENDPOINT: str = os.environ[
-        "CURRENT_PERSONAL_TRAINING_ENDPOINT"
-    ]
-    PERSONAL_TRAINING_REPORT: str = os.environ["PERSONAL_TRAINING_REPORT"]
-    ALLOWED_PERSONAL_TRAINING: str = os.environ["ALLOWED_PERSONAL_TRAINING"]
-    ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA: str = os.environ[
-        "ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA"
-    ]
-    UPDATE_PERSONAL_TRAINING_TG_ID: str = os.environ["UPDATE_PERSONAL_TRAINING_TG_ID"]
+    PERSONAL_TRAINING_ENDPOINT: str
+    CURRENT_PERSONAL_TRAINING_ENDPOINT: str
+    PERSONAL_TRAINING_REPORT: str
+    ALLOWED_PERSONAL_TRAINING: str
+    ALLOWED_PERSONAL_TRAINING_UPDATE_METADATA: str
+    UPDATE_PERSONAL_TRAINING_TG_ID: str
+    # Optional; plans of many chats at once, see BatchPlanClient. Used only
+    # with BACKEND_SERVICE_API_KEY, the bot's own key for that endpoint
+    PERSONAL_TRAINING_BULK_ENDPOINT: str = ""
+    BACKEND_SERVICE_API_KEY: str = ""
     MAX_MESSAGE_LENGTH: int = 4090
     MESSAGES_DIR: Literal["messages"] = "messages"
     MESSAGES_FILE: Literal["messages.json"] = "messages.json"
-    OPENAI_API_KEY: str = os.environ["OPENAI_API_KEY"]
+    # How often messages.json is checked for edits, 0 disables hot reload
+    MESSAGES_RELOAD_INTERVAL: float = 5.0
+    OPENAI_API_KEY: str
 
     LOG_DIR: str = "logs"
     LOG_FILE_NAME: str = "logs.log"
     OUTPUT_LOG_FILE_NAME: str = "logs.txt"
+    LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    # The log file is rotated once it reaches LOG_MAX_BYTES, or on the
+    # TimedRotatingFileHandler schedule LOG_ROTATE_WHEN (e.g. "midnight")
+    # if that is set; LOG_BACKUP_COUNT gzipped files are kept
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_ROTATE_WHEN: str = ""
+    LOG_BACKUP_COUNT: int = 7
+    # Prometheus text metrics on http://METRICS_LISTEN:METRICS_PORT/metrics;
+    # port 0 disables the endpoint
+    METRICS_LISTEN: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+    # Updates are traced as trees of spans; TRACE_SAMPLE_RATE of them, and
+    # all that take TRACE_SLOW_THRESHOLD seconds or more, go to TRACE_PATH
+    # ("" turns the file off, slow updates are still logged)
+    TRACE_PATH: str = "logs/traces.jsonl"
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_SLOW_THRESHOLD: float = 2.0
+
+    # "strict" checks annotations on every call (tests, development),
+    # "production" leaves the decorated functions uninstrumented
+    RUNTIME_PROFILE: Literal["strict", "production"] = "strict"
 
     OPENAI_API_URL: str = "https://api.openai.com/v1/chat/completions"
     MODEL_TYPE: str = "gpt-4"
+    OPENAI_TIMEOUT: float = 60.0
+    REPORT_WORKERS: int = 2
+    REPORT_QUEUE_SIZE: int = 16
+
+    BACKEND_TIMEOUT: float = 10.0
+    BACKEND_CONNECT_TIMEOUT: float = 5.0
+    BACKEND_MAX_CONNECTIONS: int = 20
+    BACKEND_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    BACKEND_KEEPALIVE_EXPIRY: float = 30.0
+    BACKEND_HTTP2: bool = False
+    # GETs are retried BACKEND_RETRIES times with full-jitter exponential
+    # backoff, and hedged after the endpoint's BACKEND_HEDGE_QUANTILE
+    # latency (0 turns hedging off). An endpoint failing
+    # BACKEND_BREAKER_THRESHOLD times in a row fails fast for
+    # BACKEND_BREAKER_RESET seconds
+    BACKEND_RETRIES: int = 2
+    BACKEND_RETRY_BACKOFF: float = 0.1
+    BACKEND_RETRY_BACKOFF_MAX: float = 1.0
+    BACKEND_HEDGE_QUANTILE: float = 0.95
+    BACKEND_HEDGE_MIN_DELAY: float = 0.05
+    BACKEND_BREAKER_THRESHOLD: int = 5
+    BACKEND_BREAKER_RESET: float = 30.0
+
+    ACCESS_CACHE_SIZE: int = 1024
+    ACCESS_CACHE_TTL: float = 60.0
+    PLAN_CACHE_SIZE: int = 512
+    PLAN_CACHE_TTL: float = 3600.0
+    PLAN_PRELOAD_SIZE: int = 10_000
+    # Current-plan metadata last written per chat, so that opening the same
+    # week again writes nothing
+    METADATA_CACHE_SIZE: int = 10_000
+    METADATA_CACHE_TTL: float = 24 * 3600.0
+    # Write it with one PUT upsert (201 = newcomer) instead of DELETE + POST;
+    # only for backends that serve PUT on CURRENT_PERSONAL_TRAINING_ENDPOINT
+    METADATA_UPSERT: bool = False
+    # Plans of many chats (prefetch, broadcast) are fetched PLAN_BULK_SIZE
+    # at a time from PERSONAL_TRAINING_BULK_ENDPOINT if the backend serves
+    # it, or else one per request, PLAN_FETCH_CONCURRENCY at a time. A
+    # backend without it is asked again after PLAN_BULK_REPROBE_INTERVAL
+    PLAN_BULK_SIZE: int = 100
+    PLAN_BULK_REPROBE_INTERVAL: float = 3600.0
+    PLAN_FETCH_CONCURRENCY: int = 4
+    # Next week's plans of every known chat are prefetched into the plan
+    # cache on PREFETCH_DAY (0 is Monday) at PREFETCH_TIME in
+    # PREFETCH_TIMEZONE, by default the server's
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_DAY: int = 6
+    PREFETCH_TIME: str = "21:00"
+    PREFETCH_TIMEZONE: str = ""
+    PREFETCH_CONCURRENCY: int = 4
+    # The week's plan is pushed to every chat with a session on /broadcast
+    # from the admin and, with BROADCAST_ENABLED, on BROADCAST_DAY at
+    # BROADCAST_TIME in BROADCAST_TIMEZONE. At most BROADCAST_RATE messages
+    # per second are queued, which leaves the rest of OUTBOX_GLOBAL_RATE to
+    # interactive traffic. Progress is kept in BROADCAST_DB_PATH so that an
+    # interrupted broadcast resumes on restart; "" keeps it in memory only
+    BROADCAST_ENABLED: bool = False
+    BROADCAST_DAY: int = 0
+    BROADCAST_TIME: str = "08:00"
+    BROADCAST_TIMEZONE: str = ""
+    BROADCAST_BATCH_SIZE: int = 100
+    BROADCAST_WORKERS: int = 4
+    BROADCAST_RATE: float = 20.0
+    BROADCAST_DRAIN_TIMEOUT: float = 600.0
+    BROADCAST_DB_PATH: str = ""
+    BACKGROUND_WORKERS: int = 8
+
+    # API tokens of authorized chats; SESSION_DB_PATH="" keeps them in memory
+    # only, so chats have to authorize again after a restart
+    SESSION_CACHE_SIZE: int = 10_000
+    SESSION_CACHE_TTL: float = 7 * 24 * 3600.0
+    SESSION_DB_PATH: str = ""
+    # Conversation states, user_data and chat_data; "" keeps them in memory
+    # only. Changes are written in batches every PERSISTENCE_FLUSH_INTERVAL
+    PERSISTENCE_DB_PATH: str = ""
+    PERSISTENCE_FLUSH_INTERVAL: float = 5.0
+
+    UPDATES_MODE: Literal["polling", "webhook"] = "polling"
+    DISPATCHER_WORKERS: int = 4
+    POLL_INTERVAL: float = 0.0
+    POLL_TIMEOUT: float = 10.0
+    WEBHOOK_LISTEN: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8443
+    WEBHOOK_PATH: str = "telegram"
+    # Public https URL Telegram pushes updates to; required for webhooks
+    WEBHOOK_URL: str = ""
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+
+    # Outbound messages; Telegram allows about 30 messages per second overall
+    # and about one per second to the same chat
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_GLOBAL_RATE: float = 30.0
+    OUTBOX_GLOBAL_BURST: int = 30
+    OUTBOX_CHAT_RATE: float = 1.0
+    OUTBOX_CHAT_BURST: int = 3
+    OUTBOX_MAX_RETRIES: int = 3
+
+    @model_validator(mode="before")
+    @classmethod
+    def read_environment(cls, data: Any) -> Any:
+        load_env()
+        values: Dict[str, Any] = dict(data)
+        for name in cls.model_fields:
+            if name in values or name in CONSTANTS:
+                continue
+            value = os.environ.get(ENV_ALIASES.get(name, name))
+            if value is not None:
+                values[name] = value
+        return values
+
+    @model_validator(mode="after")
+    def require_webhook_url(self) -> "Config":
+        # Without it PTB would register its own listen address with Telegram,
+        # and no update would ever arrive
+        if self.UPDATES_MODE == "webhook" and not self.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL is required when UPDATES_MODE is webhook")
+        return self
 
     @validator("TOKEN", pre=True, always=True)
     def validate_and_process_token(cls, value):
@@ -0,0 +1,134 @@
+import os
+from logging import Logger
+from string import Formatter
+from threading import Lock
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterator, List, Mapping
+
+from .typecheck import typechecked
+from .utils import load_messages
+
+# Every message the handlers use, with the placeholders they fill in. A
+# template may use fewer of them, but any other placeholder would fail
+# at .format() time in the middle of a conversation.
+PLACEHOLDERS: Dict[str, FrozenSet[str]] = {
+    "start_message": frozenset(),
+    "start_message_admin": frozenset({"admin_name"}),
+    "start_message_client": frozenset(),
+    "no_personal_training": frozenset({"calendar_week"}),
+    "unexpected_data": frozenset(),
+    "request_timeout": frozenset(),
+    "description_title": frozenset(),
+    "description_info": frozenset(),
+    "exception": frozenset({"exception"}),
+    "report_successfully_uploaded": frozenset({"week", "year"}),
+    "newcomer_welcome": frozenset(),
+    "first_train_then_report": frozenset(),
+    "report_already_exists": frozenset({"week", "year"}),
+    "please_write_report": frozenset(),
+    "please_write_token": frozenset(),
+    "i_know_you": frozenset(),
+    "access_expired": frozenset(),
+    "not_allowed": frozenset(),
+    "report_received": frozenset(),
+    "report_queue_full": frozenset(),
+    "weekly_plan": frozenset({"week", "year"}),
+    "broadcast_started": frozenset({"week", "year"}),
+    "broadcast_running": frozenset({"pending", "delivered", "failed", "skipped"}),
+    "broadcast_already_sent": frozenset(
+        {"week", "year", "pending", "delivered", "failed", "skipped"}
+    ),
+    "broadcast_finished": frozenset(
+        {
+            "week",
+            "year",
+            "chats",
+            "pending",
+            "delivered",
+            "failed",
+            "skipped",
+            "messages",
+            "seconds",
+            "per_second",
+        }
+    ),
+}
+
+
+@typechecked
+def check_templates(messages: Mapping[str, Any]) -> List[str]:
+    """Returns a description of every missing or malformed template."""
+    problems: List[str] = []
+    for key, allowed in PLACEHOLDERS.items():
+        template = messages.get(key)
+        if not isinstance(template, str):
+            problems.append(f"{key}: missing")
+            continue
+        try:
+            used = {name for _, name, _, _ in Formatter().parse(template) if name}
+        except ValueError as e:
+            problems.append(f"{key}: {e}")
+            continue
+        unknown = used - allowed
+        if unknown:
+            problems.append(f"{key}: unknown placeholders {sorted(unknown)}")
+    return problems
+
+
+class MessageCatalog(Mapping[str, Any]):
+    """
+    Read-only view of messages.json, loaded once.
+
+    reload_if_changed() re-reads the file when its mtime changes and swaps
+    in the new copy as a whole, so handlers only ever see a complete,
+    checked catalog and never touch the disk themselves. A copy that fails
+    the checks is logged and ignored until the file changes again.
+    """
+
+    @typechecked
+    def __init__(self, path: str, logger: Logger) -> None:
+        self._path: str = path
+        self._logger: Logger = logger
+        self._lock: Lock = Lock()
+        self._mtime: int = os.stat(path).st_mtime_ns
+        messages: Dict[str, Any] = load_messages(path, logger)
+        problems: List[str] = check_templates(messages)
+        if problems:
+            raise ValueError(f"Invalid messages in {path}: {'; '.join(problems)}")
+        self._snapshot: Mapping[str, Any] = MappingProxyType(messages)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._snapshot[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot)
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def reload_if_changed(self) -> bool:
+        """Returns True if a new copy of the catalog was swapped in."""
+        with self._lock:
+            try:
+                mtime: int = os.stat(self._path).st_mtime_ns
+            except OSError as e:
+                self._logger.error("Cannot stat %s: %s", self._path, e)
+                return False
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            try:
+                messages: Dict[str, Any] = load_messages(self._path, self._logger)
+            except FileNotFoundError:  # Replaced between stat and open
+                return False
+            problems: List[str] = check_templates(messages)
+            if problems:
+                self._logger.error(
+                    "Keeping the previous messages, %s is invalid: %s",
+                    self._path,
+                    "; ".join(problems),
+                )
+                return False
+            self._snapshot = MappingProxyType(messages)
+            self._logger.info("Reloaded messages from %s", self._path)
+            return True
@@ -0,0 +1,60 @@
+from threading import Lock
+from typing import Dict
+
+from cachetools import TTLCache
+from .typecheck import typechecked
+from .utils import MetaData
+
+
+class MetadataCache:
+    """
+    Bounded TTL + LRU cache of the current-plan metadata last written to
+    CURRENT_PERSONAL_TRAINING_ENDPOINT, keyed by tg_id.
+
+    Lets the plan handler skip the write when a client opens the same week
+    again. The TTL bounds how long a row changed behind the bot's back is
+    trusted. With `upsert`, also remembers whether the backend really takes
+    PUT upserts on that endpoint, so a backend without them is asked once.
+    """
+
+    @typechecked
+    def __init__(self, maxsize: int, ttl: float, upsert: bool = False) -> None:
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock: Lock = Lock()
+        self._upsert: bool = upsert
+        self._skipped: int = 0
+        self._writes: int = 0
+
+    def unchanged(self, metadata: MetaData) -> bool:
+        """True if `metadata` is what was last written for its tg_id."""
+        with self._lock:
+            unchanged: bool = self._cache.get(metadata.TgId) == metadata
+            if unchanged:
+                self._skipped += 1
+            return unchanged
+
+    def set(self, metadata: MetaData) -> None:
+        with self._lock:
+            self._writes += 1
+            self._cache[metadata.TgId] = metadata
+
+    def invalidate(self, tg_id: int) -> None:
+        with self._lock:
+            self._cache.pop(tg_id, None)
+
+    @property
+    def upsert_supported(self) -> bool:
+        with self._lock:
+            return self._upsert
+
+    def disable_upsert(self) -> None:
+        with self._lock:
+            self._upsert = False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "skipped": self._skipped,
+                "writes": self._writes,
+                "size": len(self._cache),
+            }
@@ -0,0 +1,245 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ConversationHandler, Handler
+
+from .tracing import Tracer
+from .typecheck import typechecked
+
+Labels = Tuple[Tuple[str, str], ...]
+Kind = Literal["counter", "gauge", "histogram"]
+
+# Upper bounds in seconds, from a cached plan (ms) to a slow GPT call (a minute)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts: List[int] = [0] * (buckets + 1)  # The last one is +Inf
+        self.sum: float = 0.0
+
+
+class Outcome:
+    """Result of a tracked call; set `status` to e.g. the HTTP status code."""
+
+    __slots__ = ("status",)
+
+    def __init__(self) -> None:
+        self.status: str = "ok"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """
+    Minimal thread-safe metrics registry rendered in the Prometheus text
+    format: counters, gauges, histograms and gauges read from a callback
+    at scrape time.
+
+    track() is the usual entry point: it keeps `<prefix>_in_flight`,
+    observes `<prefix>_seconds` and counts `<prefix>_total` by status.
+    """
+
+    @typechecked
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._buckets: Tuple[float, ...] = buckets
+        self._lock: threading.Lock = threading.Lock()
+        self._kinds: Dict[str, Kind] = {}
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._callbacks: Dict[str, Callable[[], float]] = {}
+
+    def _declare(self, name: str, kind: Kind) -> None:
+        known = self._kinds.setdefault(name, kind)
+        if known != kind:
+            raise ValueError(f"{name} is a {known}, not a {kind}")
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        with self._lock:
+            self._declare(name, "counter")
+            series = self._values.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def add(self, name: str, labels: Labels = (), delta: float = 1.0) -> None:
+        """Moves a gauge up or down."""
+        with self._lock:
+            self._declare(name, "gauge")
+            series = self._values.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + delta
+
+    def gauge_callback(self, name: str, read: Callable[[], float]) -> None:
+        """Registers a gauge whose value is read when the metrics are rendered."""
+        with self._lock:
+            self._declare(name, "gauge")
+            self._callbacks[name] = read
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            self._declare(name, "histogram")
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = _Histogram(len(self._buckets))
+            index: int = len(self._buckets)
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    index = i
+                    break
+            histogram.counts[index] += 1
+            histogram.sum += value
+
+    @contextmanager
+    def track(self, prefix: str, **labels: str) -> Iterator[Outcome]:
+        key: Labels = tuple(sorted(labels.items()))
+        outcome: Outcome = Outcome()
+        self.add(f"{prefix}_in_flight", key, 1)
+        started: float = time.perf_counter()
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome.status = type(e).__name__
+            raise
+        finally:
+            self.observe(f"{prefix}_seconds", key, time.perf_counter() - started)
+            self.inc(f"{prefix}_total", key + (("status", str(outcome.status)),))
+            self.add(f"{prefix}_in_flight", key, -1)
+
+    def render(self) -> str:
+        with self._lock:
+            kinds: Dict[str, Kind] = dict(self._kinds)
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {
+                name: {labels: (list(h.counts), h.sum) for labels, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+            callbacks = dict(self._callbacks)
+
+        lines: List[str] = []
+        for name in sorted(kinds):
+            lines.append(f"# TYPE {name} {kinds[name]}")
+            if name in callbacks:
+                lines.append(f"{name} {float(callbacks[name]())}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for labels, (counts, total) in sorted(histograms.get(name, {}).items()):
+                cumulative: int = 0
+                bounds: List[str] = [repr(b) for b in self._buckets] + ["+Inf"]
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    bucket_labels: Labels = labels + (("le", bound),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _update_attrs(args: Tuple[Any, ...]) -> Dict[str, Any]:
+    # Callbacks are called as (update, context)
+    update = args[0] if args else None
+    if not isinstance(update, Update):
+        return {}
+    attrs: Dict[str, Any] = {"update_id": update.update_id}
+    if update.effective_chat is not None:
+        attrs["chat_id"] = update.effective_chat.id
+    if update.callback_query is not None:
+        attrs["callback_data"] = update.callback_query.data
+    return attrs
+
+
+@typechecked
+def instrument_handler(
+    handler: Handler, metrics: Metrics, tracer: Optional[Tracer] = None
+) -> Handler:
+    """
+    Wraps the callback of `handler`, or of every handler inside a
+    ConversationHandler, to track `bot_handler_*{handler=<callback name>}`
+    and, with a `tracer`, to trace each update it handles.
+    """
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points + handler.fallbacks:
+            instrument_handler(inner, metrics, tracer)
+        for handlers in handler.states.values():
+            for inner in handlers:
+                instrument_handler(inner, metrics, tracer)
+        return handler
+
+    callback = handler.callback
+    name: str = getattr(callback, "__name__", type(handler).__name__)
+
+    def tracked_callback(*args, **kwargs):
+        with metrics.track("bot_handler", handler=name):
+            if tracer is None:
+                return callback(*args, **kwargs)
+            with tracer.trace(name, **_update_attrs(args)):
+                return callback(*args, **kwargs)
+
+    handler.callback = tracked_callback
+    return handler
+
+
+class MetricsServer:
+    """Serves Metrics.render() on http://listen:port/metrics from a daemon thread."""
+
+    @typechecked
+    def __init__(self, metrics: Metrics, listen: str, port: int) -> None:
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body: bytes = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass  # Scrapes would otherwise be printed to stderr
+
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer(
+            (listen, port), _Handler
+        )
+        self._server.daemon_threads = True
+        self._thread: threading.Thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
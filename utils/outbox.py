@@ -0,0 +1,364 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from logging import Logger
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from telegram import Bot, ReplyMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from .metrics import Metrics
+from .packing import utf16_length
+from .tracing import Span, current_span
+from .typecheck import typechecked
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate: float = rate
+        self._capacity: float = capacity
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self._tokens -= 1
+
+
+@dataclass(slots=True)
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    enqueued: float
+    reply_markup: Optional[ReplyMarkup] = None
+    attempts: int = 0
+    # Queued while handling a traced update: from queueing to delivery
+    span: Optional[Span] = None
+    # Called with None once delivered, with the error once given up on
+    on_done: Optional[Callable[[Optional[Exception]], None]] = None
+
+
+class OutboundQueue:
+    """
+    Rate-limited outbound queue for everything the bot sends.
+
+    Messages are delivered in order per chat by a few sender threads, so
+    handlers never block on Telegram. Every send takes a token from the
+    chat's bucket and from the global bucket. Adjacent plain messages to the
+    same chat are merged into one while they fit into `coalesce_limit`; a
+    message with a keyboard may close such a run. A 429 puts the message
+    back at the head of its chat, which is paused for as long as Telegram
+    asks, while other chats keep going. A failed connection is retried up
+    to `max_retries` times; a timed-out send is not, since Telegram may have
+    delivered it anyway.
+    """
+
+    @typechecked
+    def __init__(
+        self,
+        bot: Bot,
+        logger: Logger,
+        workers: int = 4,
+        global_rate: float = 30.0,
+        global_burst: int = 30,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        coalesce_limit: int = 4090,
+        max_retries: int = 3,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        self._bot: Bot = bot
+        self._logger: Logger = logger
+        self._chat_rate: float = chat_rate
+        self._chat_burst: int = chat_burst
+        self._coalesce_limit: int = coalesce_limit
+        self._max_retries: int = max_retries
+        self._metrics: Optional[Metrics] = metrics
+
+        self._condition: threading.Condition = threading.Condition()
+        self._pending: Dict[int, Deque[OutgoingMessage]] = {}
+        # Chats with pending messages that no sender is working on, oldest first
+        self._ready: Deque[int] = deque()
+        self._paused_until: Dict[int, float] = {}
+        self._global_bucket: TokenBucket = TokenBucket(global_rate, global_burst)
+        # An idle chat's bucket is full again after chat_burst / chat_rate
+        # seconds, so it can be forgotten by then
+        self._chat_buckets: TTLCache = TTLCache(
+            maxsize=100_000, ttl=chat_burst / chat_rate
+        )
+        self._depth: int = 0
+        self._closed: bool = False
+
+        self._sent: int = 0
+        self._coalesced: int = 0
+        self._retries: int = 0
+        self._dropped: int = 0
+        self._latencies: Deque[float] = deque(maxlen=1024)
+
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"outbox_{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---------------------------------------
+    # ------- Producer side -----------------
+    # ---------------------------------------
+
+    def send(
+        self,
+        chat_id: int,
+        text: str,
+        reply_markup: Optional[ReplyMarkup] = None,
+        on_done: Optional[Callable[[Optional[Exception]], None]] = None,
+    ) -> None:
+        """
+        Queues a message; returns immediately. `on_done` is called on a sender
+        thread with None once it was delivered, or with the error it was
+        dropped for.
+        """
+        parent: Optional[Span] = current_span()
+        message: OutgoingMessage = OutgoingMessage(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=reply_markup,
+            enqueued=time.monotonic(),
+            span=None if parent is None else parent.child("send_message"),
+            on_done=on_done,
+        )
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Outbound queue is closed")
+            queue: Optional[Deque[OutgoingMessage]] = self._pending.get(chat_id)
+            if queue is None:
+                queue = self._pending[chat_id] = deque()
+                self._ready.append(chat_id)
+            queue.append(message)
+            self._depth += 1
+            self._condition.notify()
+
+    def depth(self) -> int:
+        with self._condition:
+            return self._depth
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            latencies: List[float] = sorted(self._latencies)
+            stats: Dict[str, float] = {
+                "depth": self._depth,
+                "chats": len(self._pending),
+                "sent": self._sent,
+                "coalesced": self._coalesced,
+                "retries": self._retries,
+                "dropped": self._dropped,
+            }
+        if latencies:
+            stats["latency_p50"] = latencies[len(latencies) // 2]
+            stats["latency_p95"] = latencies[int(len(latencies) * 0.95)]
+            stats["latency_max"] = latencies[-1]
+        return stats
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stops accepting messages and waits up to `timeout` for the rest."""
+        deadline: float = time.monotonic() + timeout
+        with self._condition:
+            self._closed = True
+            while self._pending and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            if self._pending:
+                self._logger.warning(
+                    "Outbound queue closed with %d unsent messages.", self._depth
+                )
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    # ---------------------------------------
+    # ------- Sender side -------------------
+    # ---------------------------------------
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket: Optional[TokenBucket] = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self._chat_rate, self._chat_burst)
+        # Re-inserting keeps the bucket alive while the chat is active
+        self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _take_batch(self, now: float) -> Tuple[List[OutgoingMessage], float]:
+        """
+        Picks the oldest ready chat allowed to send and pops its next run of
+        messages. Returns ([], seconds to wait) when nothing can be sent yet.
+        """
+        wait: float = 1.0
+        for chat_id in self._ready:
+            bucket: TokenBucket = self._chat_bucket(chat_id)
+            chat_delay: float = max(
+                self._paused_until.get(chat_id, 0.0) - now, bucket.delay(now)
+            )
+            if chat_delay > 0:
+                wait = min(wait, chat_delay)
+                continue
+            global_delay: float = self._global_bucket.delay(now)
+            if global_delay > 0:
+                return [], global_delay
+            bucket.take(now)
+            self._global_bucket.take(now)
+            self._ready.remove(chat_id)
+            self._paused_until.pop(chat_id, None)
+            return self._pop_run(self._pending[chat_id]), 0.0
+        return [], wait
+
+    def _pop_run(self, queue: Deque[OutgoingMessage]) -> List[OutgoingMessage]:
+        run: List[OutgoingMessage] = [queue.popleft()]
+        length: int = utf16_length(run[0].text)
+        while queue and run[-1].reply_markup is None:
+            following: int = utf16_length(queue[0].text)
+            if length + 1 + following > self._coalesce_limit:
+                break
+            run.append(queue.popleft())
+            length += 1 + following
+        return run
+
+    def _finish(self, chat_id: int, sent: List[OutgoingMessage]) -> None:
+        """Called with the lock held once a run was sent or given up on."""
+        self._depth -= len(sent)
+        queue: Deque[OutgoingMessage] = self._pending[chat_id]
+        if queue:
+            self._ready.append(chat_id)
+        else:
+            del self._pending[chat_id]
+        self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    run, wait = self._take_batch(time.monotonic())
+                    if run:
+                        break
+                    self._condition.wait(wait if self._ready else None)
+            self._deliver(run)
+
+    def _deliver(self, run: List[OutgoingMessage]) -> None:
+        chat_id: int = run[0].chat_id
+        started: float = time.monotonic()
+        try:
+            self._send(run)
+        except RetryAfter as e:
+            self._logger.warning(
+                "Telegram asked to retry chat %s after %ss.", chat_id, e.retry_after
+            )
+            self._requeue(run, time.monotonic() + float(e.retry_after))
+            return
+        except TimedOut as e:
+            # Telegram may have got the message all the same: sending it
+            # again could deliver it twice
+            self._drop(run, e)
+            return
+        except BadRequest as e:  # A NetworkError subclass, but never worth a retry
+            self._drop(run, e)
+            return
+        except NetworkError as e:  # The connection failed
+            if run[0].attempts < self._max_retries:
+                self._logger.warning("Sending to chat %s failed: %s", chat_id, e)
+                self._requeue(run, time.monotonic() + 2 ** run[0].attempts)
+                return
+            self._drop(run, e)
+            return
+        except Exception as e:  # Unauthorized, ChatMigrated, or leaked past PTB
+            self._drop(run, e)
+            return
+
+        now: float = time.monotonic()
+        for message in run:
+            if message.span is not None:
+                message.span.set(
+                    send_ms=round((now - started) * 1000, 3),
+                    attempts=message.attempts + 1,
+                    coalesced=len(run),
+                )
+            self._settle(message)
+        with self._condition:
+            self._sent += 1
+            self._coalesced += len(run) - 1
+            self._latencies.extend(now - message.enqueued for message in run)
+            self._finish(chat_id, run)
+
+    def _send(self, run: List[OutgoingMessage]) -> None:
+        text: str = "\n".join(message.text for message in run)
+        if self._metrics is None:
+            self._bot.send_message(
+                chat_id=run[0].chat_id, text=text, reply_markup=run[-1].reply_markup
+            )
+            return
+        # Failed sends are counted by error type, e.g. RetryAfter or BadRequest
+        with self._metrics.track("bot_telegram", method="sendMessage"):
+            self._bot.send_message(
+                chat_id=run[0].chat_id, text=text, reply_markup=run[-1].reply_markup
+            )
+
+    def _requeue(self, run: List[OutgoingMessage], not_before: float) -> None:
+        chat_id: int = run[0].chat_id
+        with self._condition:
+            self._retries += 1
+            for message in reversed(run):
+                message.attempts += 1
+                self._pending[chat_id].appendleft(message)
+            self._paused_until[chat_id] = not_before
+            self._ready.append(chat_id)
+            self._condition.notify_all()
+
+    def _drop(self, run: List[OutgoingMessage], error: Exception) -> None:
+        chat_id: int = run[0].chat_id
+        self._logger.error(
+            "Dropping %d message(s) to chat %s: %r", len(run), chat_id, error
+        )
+        for message in run:
+            self._settle(message, error)
+        with self._condition:
+            self._dropped += len(run)
+            self._finish(chat_id, run)
+
+    def _settle(
+        self, message: OutgoingMessage, error: Optional[Exception] = None
+    ) -> None:
+        """
+        Finishes the message's span and calls its on_done. Neither may take
+        the sender thread down, or the chat would never be sent to again.
+        """
+        if message.span is not None:
+            try:
+                message.span.finish(
+                    error=None if error is None else type(error).__name__
+                )
+            except Exception:
+                self._logger.exception(
+                    "Finishing the span of a message to chat %s failed.",
+                    message.chat_id,
+                )
+        if message.on_done is not None:
+            try:
+                message.on_done(error)
+            except Exception:
+                self._logger.exception(
+                    "Callback of a message to chat %s failed.", message.chat_id
+                )
@@ -0,0 +1,62 @@
+from typing import Iterable, Iterator
+
+from .typecheck import typechecked
+
+
+def utf16_length(text: str) -> int:
+    """Length as Telegram counts it: in UTF-16 code units."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fitting_prefix(text: str, limit: int) -> int:
+    """Number of characters at the start of `text` that fit into `limit`."""
+    end: int = min(len(text), limit)
+    units: int = utf16_length(text[:end])
+    while units > limit:
+        end -= units - limit
+        units = utf16_length(text[:end])
+    # Stepping back may have dropped more units than needed when the removed
+    # characters were outside the BMP, so walk forward over the slack
+    while end < len(text):
+        width: int = 2 if ord(text[end]) > 0xFFFF else 1
+        if units + width > limit:
+            break
+        units += width
+        end += 1
+    return end
+
+
+def _cut(text: str, limit: int) -> int:
+    """Where to end the next message: last newline, else last space, else hard."""
+    end: int = _fitting_prefix(text, limit)
+    for boundary in ("\n", " "):
+        position: int = text.rfind(boundary, 0, end + 1)
+        if position > 0:
+            return position
+    return end
+
+
+@typechecked
+def pack_messages(fragments: Iterable[str], limit: int) -> Iterator[str]:
+    """
+    Packs a stream of text fragments into as few messages of at most `limit`
+    UTF-16 units as possible, breaking on line boundaries where it can.
+
+    Fragments are concatenated as is and consumed lazily: a message is
+    yielded as soon as it is full, before later fragments are produced.
+    Blank messages, which Telegram rejects, are skipped.
+    """
+    buffer: str = ""
+    for fragment in fragments:
+        buffer += fragment
+        while utf16_length(buffer) > limit:
+            end: int = _cut(buffer, limit)
+            message: str = buffer[:end]
+            # The newline or space the message was broken on is dropped
+            if buffer[end : end + 1] in ("\n", " "):
+                end += 1
+            buffer = buffer[end:]
+            if message.strip():
+                yield message
+    if buffer.strip():
+        yield buffer
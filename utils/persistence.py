@@ -0,0 +1,206 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import defaultdict
+from logging import Logger
+from typing import Any, DefaultDict, Dict, Hashable, Optional, Tuple
+
+from telegram.ext import BasePersistence
+from telegram.ext.utils.types import ConversationDict
+
+from .typecheck import typechecked
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+# (table, row key); a conversation row is keyed by (handler name, JSON key)
+RowKey = Tuple[str, Hashable]
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Conversation states, user_data and chat_data in a local SQLite database.
+
+    Everything is read once at startup and served from memory. The
+    dispatcher reports user_data and chat_data after every update, but only
+    values that actually changed are queued, and a background thread writes
+    the queue every `flush_interval` seconds in one transaction, keeping
+    only the latest value per key. flush() and close() write whatever is
+    still queued, so only a killed process loses up to `flush_interval`
+    seconds of changes.
+    """
+
+    @typechecked
+    def __init__(self, path: str, logger: Logger, flush_interval: float = 5.0) -> None:
+        super().__init__(
+            store_user_data=True, store_chat_data=True, store_bot_data=False
+        )
+        self._logger: Logger = logger
+        self._flush_interval: float = flush_interval
+        directory: str = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+        self._lock: threading.Lock = threading.Lock()
+        self._db_lock: threading.Lock = threading.Lock()
+        # Last value written or queued per row, to skip unchanged updates
+        self._stored: Dict[RowKey, bytes] = {}
+        self._pending: Dict[RowKey, Optional[bytes]] = {}
+        self._user_data: DefaultDict[int, Dict[Any, Any]] = defaultdict(dict)
+        self._chat_data: DefaultDict[int, Dict[Any, Any]] = defaultdict(dict)
+        self._conversations: Dict[str, ConversationDict] = {}
+        self._load()
+
+        self._closed: threading.Event = threading.Event()
+        self._flusher: threading.Thread = threading.Thread(
+            target=self._run, name="persistence_flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _load(self) -> None:
+        for table, data in (
+            ("user_data", self._user_data),
+            ("chat_data", self._chat_data),
+        ):
+            for row_id, blob in self._db.execute(f"SELECT id, data FROM {table}"):
+                data[row_id] = pickle.loads(blob)
+                self._stored[(table, row_id)] = blob
+        for name, key, blob in self._db.execute(
+            "SELECT name, key, state FROM conversations"
+        ):
+            conversations = self._conversations.setdefault(name, {})
+            conversations[tuple(json.loads(key))] = pickle.loads(blob)
+            self._stored[("conversations", (name, key))] = blob
+
+    # ---------------------------------------
+    # ------- BasePersistence ---------------
+    # ---------------------------------------
+
+    def get_user_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        return self._user_data
+
+    def get_chat_data(self) -> DefaultDict[int, Dict[Any, Any]]:
+        return self._chat_data
+
+    def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        return dict(self._conversations.get(name, {}))
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        self._queue(("conversations", (name, json.dumps(key))), new_state)
+
+    def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._queue(("user_data", user_id), data or None)
+
+    def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._queue(("chat_data", chat_id), data or None)
+
+    def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    def flush(self) -> None:
+        """Writes everything queued so far; called by the Updater on a stop signal."""
+        self._write_pending()
+
+    # ---------------------------------------
+    # ------- Write-behind ------------------
+    # ---------------------------------------
+
+    def _queue(self, row: RowKey, value: Optional[object]) -> None:
+        """Queues a row write, or a delete for None, unless it is unchanged."""
+        try:
+            blob: Optional[bytes] = None if value is None else pickle.dumps(value)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            self._logger.error("Cannot persist %s: %s", row, e)
+            return
+        with self._lock:
+            if self._stored.get(row) == blob:
+                return
+            if blob is None:
+                del self._stored[row]
+            else:
+                self._stored[row] = blob
+            self._pending[row] = blob
+
+    def _run(self) -> None:
+        while not self._closed.wait(self._flush_interval):
+            self._write_pending()
+
+    def _write_pending(self) -> None:
+        with self._db_lock:
+            with self._lock:
+                batch: Dict[RowKey, Optional[bytes]] = self._pending
+                self._pending = {}
+            if not batch:
+                return
+            try:
+                with self._db:  # One transaction per batch
+                    for (table, key), blob in batch.items():
+                        self._write_row(table, key, blob)
+            except sqlite3.Error as e:
+                self._logger.error(
+                    "Writing %d persisted rows failed: %s", len(batch), e
+                )
+                with self._lock:
+                    # Newer values queued in the meantime win
+                    for row, blob in batch.items():
+                        self._pending.setdefault(row, blob)
+                return
+        self._logger.debug("Persisted %s rows.", len(batch))
+
+    def _write_row(self, table: str, key: Hashable, blob: Optional[bytes]) -> None:
+        if table == "conversations":
+            name, conversation_key = key
+            if blob is None:
+                self._db.execute(
+                    "DELETE FROM conversations WHERE name = ? AND key = ?",
+                    (name, conversation_key),
+                )
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO conversations (name, key, state) "
+                    "VALUES (?, ?, ?)",
+                    (name, conversation_key, blob),
+                )
+        elif blob is None:
+            self._db.execute(f"DELETE FROM {table} WHERE id = ?", (key,))
+        else:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)", (key, blob)
+            )
+
+    def close(self) -> None:
+        """Stops the background writer and writes what is left."""
+        self._closed.set()
+        self._flusher.join()
+        self._write_pending()
+        with self._db_lock:
+            self._db.close()
+
+
+@typechecked
+def open_persistence(
+    path: str, logger: Logger, flush_interval: float
+) -> Optional[SQLitePersistence]:
+    """SQLitePersistence at `path`, or None to keep state in memory only."""
+    if not path:
+        return None
+    return SQLitePersistence(path, logger, flush_interval)
@@ -0,0 +1,97 @@
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from pydantic import BaseModel
+from .typecheck import typechecked
+
+PlanKey = Tuple[int, int, int]  # (tg_id, year, week)
+
+
+class RenderedPlan(BaseModel):
+    text: str
+    resources: List[Dict[str, Any]]
+
+
+class PlanCache:
+    """
+    Bounded TTL + LRU cache of rendered weekly plans keyed by (tg_id, year, week).
+
+    A hit skips both the backend request and convert_json_to_human_readable.
+    Entries of past weeks are dropped as soon as the ISO week rolls over.
+
+    Plans prefetched ahead of a week are kept apart, without a TTL, since
+    they are loaded hours before anyone asks for them. Up to
+    `preload_size` of them are kept; the first lookup moves a plan into the
+    TTL cache, so from then on it is refreshed like any other entry.
+    """
+
+    @typechecked
+    def __init__(self, maxsize: int, ttl: float, preload_size: int = 10_000) -> None:
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._preloaded: Dict[PlanKey, RenderedPlan] = {}
+        self._preload_size: int = preload_size
+        self._lock: Lock = Lock()
+        self._current_week: Tuple[int, int] = (0, 0)
+        self._hits: int = 0
+        self._misses: int = 0
+
+    def get(self, key: PlanKey) -> Optional[RenderedPlan]:
+        with self._lock:
+            plan: Optional[RenderedPlan] = self._cache.get(key)
+            if plan is None:
+                plan = self._preloaded.pop(key, None)
+                if plan is not None:
+                    self._cache[key] = plan
+            if plan is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return plan
+
+    def set(self, key: PlanKey, plan: RenderedPlan) -> None:
+        with self._lock:
+            self._cache[key] = plan
+
+    def preload(self, key: PlanKey, plan: RenderedPlan) -> bool:
+        """Keeps a plan prefetched ahead of its week; False if there is no room."""
+        with self._lock:
+            if (
+                key not in self._preloaded
+                and len(self._preloaded) >= self._preload_size
+            ):
+                return False
+            self._preloaded[key] = plan
+            return True
+
+    def invalidate(self, key: PlanKey) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+            self._preloaded.pop(key, None)
+
+    def roll_over(self, year: int, week: int) -> None:
+        """Drops plans of weeks before (year, week) once that week starts."""
+        with self._lock:
+            if (year, week) <= self._current_week:
+                return
+            self._current_week = (year, week)
+            stale: List[PlanKey] = [
+                key for key in list(self._cache.keys()) if key[1:] < (year, week)
+            ]
+            for key in stale:
+                self._cache.pop(key, None)
+            for key in [key for key in self._preloaded if key[1:] < (year, week)]:
+                del self._preloaded[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._preloaded.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._cache),
+            }
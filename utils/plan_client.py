@@ -0,0 +1,208 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import Logger
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from .backend_client import BackendClient
+from .consts import Config
+from .plan_cache import PlanKey
+from .typecheck import typechecked
+
+# Answers of a backend without the bulk endpoint
+UNSUPPORTED: frozenset = frozenset({404, 405, 501})
+
+
+class PlanResult(BaseModel):
+    """
+    One plan of a batch. `status` is the backend's HTTP status for it, or 0
+    if it could not be fetched at all; `resources` is set on 200 only.
+    """
+
+    key: PlanKey
+    status: int
+    resources: Optional[List[Dict[str, Any]]] = None
+    error: Optional[str] = None
+
+
+# Plans fetched by one request, and the keys left to fetch one by one
+Fetched = Tuple[List[PlanResult], List[PlanKey]]
+
+
+class BatchPlanClient:
+    """
+    Fetches the plans of many (tg_id, year, week) keys at once.
+
+    With PERSONAL_TRAINING_BULK_ENDPOINT and BACKEND_SERVICE_API_KEY set,
+    keys are sent in chunks of `bulk_size`, each one POST of {"Resources":
+    [{"TgId", "Year", "Week"}]} authenticated with the service key, not the
+    clients' own keys, and answered with {"Resources": [{"TgId", "Year",
+    "Week", "Status", "Resources"}]}. The first chunk probes the endpoint,
+    and the others are sent once it has answered: a 404, 405 or 501 means
+    the backend does not serve it, and single requests to
+    PERSONAL_TRAINING_ENDPOINT are used until it is probed again after
+    `reprobe_interval` seconds. Keys missing from a bulk answer, and chunks
+    whose bulk request failed, are fetched one by one as well.
+
+    Results are yielded as they arrive, not in the order of the keys.
+    """
+
+    @typechecked
+    def __init__(
+        self,
+        cfg: Config,
+        logger: Logger,
+        backend: BackendClient,
+        concurrency: int = 4,
+        bulk_size: int = 100,
+        reprobe_interval: float = 3600.0,
+    ) -> None:
+        self._cfg: Config = cfg
+        self._logger: Logger = logger
+        self._backend: BackendClient = backend
+        self._concurrency: int = max(1, concurrency)
+        self._bulk_size: int = max(1, bulk_size)
+        self._reprobe_interval: float = reprobe_interval
+        self._lock: threading.Lock = threading.Lock()
+        # monotonic() before which the bulk endpoint is not tried again
+        self._bulk_unsupported_until: float = 0.0
+
+    def bulk_available(self) -> bool:
+        if not (
+            self._cfg.PERSONAL_TRAINING_BULK_ENDPOINT
+            and self._cfg.BACKEND_SERVICE_API_KEY
+        ):
+            return False
+        with self._lock:
+            return time.monotonic() >= self._bulk_unsupported_until
+
+    def fetch(
+        self,
+        keys: Sequence[PlanKey],
+        api_keys: Mapping[int, str],
+        concurrency: Optional[int] = None,
+    ) -> Iterator[PlanResult]:
+        """
+        Yields the plan of every key, with at most `concurrency` requests in
+        flight. Single requests are made with the API key of the key's tg_id;
+        keys whose tg_id has none are yielded with status 401 without asking
+        the backend.
+        """
+        pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max(1, concurrency or self._concurrency),
+            thread_name_prefix="plans",
+        )
+        try:
+            pending: Set[Future] = set()
+            known: List[PlanKey] = []
+            for key in keys:
+                if key[0] in api_keys:
+                    known.append(key)
+                else:
+                    yield PlanResult(key=key, status=401, error="No API key")
+
+            def fetch_one_by_one(keys: List[PlanKey]) -> None:
+                pending.update(
+                    pool.submit(self._fetch_one, key, api_keys[key[0]]) for key in keys
+                )
+
+            chunks: List[List[PlanKey]] = []
+            probe: Optional[Future] = None
+            if self.bulk_available():
+                chunks = [
+                    known[i : i + self._bulk_size]
+                    for i in range(0, len(known), self._bulk_size)
+                ]
+                if chunks:
+                    probe = pool.submit(self._fetch_bulk, chunks.pop(0))
+                    pending.add(probe)
+            else:
+                fetch_one_by_one(known)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results: List[PlanResult]
+                    missing: List[PlanKey]
+                    results, missing = future.result()
+                    yield from results
+                    fetch_one_by_one(missing)
+                    if future is not probe:
+                        continue
+                    # Only now is it known whether the backend serves bulk requests
+                    for chunk in chunks:
+                        if self.bulk_available():
+                            pending.add(pool.submit(self._fetch_bulk, chunk))
+                        else:
+                            fetch_one_by_one(chunk)
+        finally:
+            # A consumer that stops early does not wait for the rest
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_one(self, key: PlanKey, api_key: str) -> Fetched:
+        tg_id, year, week = key
+        try:
+            response: httpx.Response = self._backend.get(
+                self._cfg.PERSONAL_TRAINING_ENDPOINT,
+                params={"tg_id": tg_id, "year": year, "week": week},
+                headers={"accept": "application/json", "X-API-Key": api_key},
+            )
+            if response.status_code != 200:
+                return [PlanResult(key=key, status=response.status_code)], []
+            resources: List[Dict[str, Any]] = response.json()["Resources"]
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            return [PlanResult(key=key, status=0, error=repr(e))], []
+        return [PlanResult(key=key, status=200, resources=resources)], []
+
+    def _fetch_bulk(self, keys: List[PlanKey]) -> Fetched:
+        try:
+            response: httpx.Response = self._backend.post(
+                self._cfg.PERSONAL_TRAINING_BULK_ENDPOINT,
+                json={
+                    "Resources": [
+                        {
+                            "TgId": tg_id,
+                            "Year": year,
+                            "Week": week,
+                        }
+                        for tg_id, year, week in keys
+                    ]
+                },
+                headers={
+                    "accept": "application/json",
+                    "X-API-Key": self._cfg.BACKEND_SERVICE_API_KEY,
+                },
+            )
+            if response.status_code in UNSUPPORTED:
+                with self._lock:
+                    self._bulk_unsupported_until = (
+                        time.monotonic() + self._reprobe_interval
+                    )
+                self._logger.info(
+                    "Backend has no bulk plan endpoint (HTTP %s); fetching plans "
+                    "one by one",
+                    response.status_code,
+                )
+                return [], keys
+            response.raise_for_status()
+            items: List[Dict[str, Any]] = response.json()["Resources"]
+            results: Dict[PlanKey, PlanResult] = {}
+            for item in items:
+                key: PlanKey = (item["TgId"], item["Year"], item["Week"])
+                status: int = item["Status"]
+                results[key] = PlanResult(
+                    key=key,
+                    status=status,
+                    resources=item["Resources"] if status == 200 else None,
+                )
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            self._logger.warning(
+                "Bulk plan request for %d keys failed, fetching them one by one: %r",
+                len(keys),
+                e,
+            )
+            return [], keys
+        found: List[PlanResult] = [results[key] for key in keys if key in results]
+        return found, [key for key in keys if key not in results]
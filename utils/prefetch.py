@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+from logging import Logger
+from typing import Dict, List, Literal, Optional, Tuple
+
+from .plan_cache import PlanCache, PlanKey, RenderedPlan
+from .plan_client import BatchPlanClient, PlanResult
+from .session_store import SessionStore
+from .training import TrainingDay, parse_week
+from .typecheck import typechecked
+from .utils import iter_week_blocks
+
+Outcome = Literal["cached", "empty", "unassigned", "full", "failed"]
+
+
+@typechecked
+def next_week(today: Optional[date] = None) -> Tuple[int, int]:
+    """
+    (year, week) the plan handler will ask for next Monday; built the same
+    way as fetch_current_year() and fetch_calender_week() on that day.
+    """
+    today = today or date.today()
+    monday: date = today + timedelta(days=7 - today.weekday())
+    return monday.year, monday.isocalendar()[1]
+
+
+@typechecked
+def prefetch_plans(
+    logger: Logger,
+    plans: BatchPlanClient,
+    sessions: SessionStore,
+    plan_cache: PlanCache,
+    year: int,
+    week: int,
+    concurrency: int,
+) -> Dict[str, int]:
+    """
+    Fetches and renders the plan of (year, week) for every known chat and
+    preloads it into the plan cache, with at most `concurrency` backend
+    requests at a time. Only reads: a plan still waiting for its tg_id is
+    left for the plan handler, which assigns it.
+    """
+
+    def prefetch(result: PlanResult) -> Outcome:
+        if result.status != 200 or result.resources is None:
+            logger.warning(
+                "Prefetching plan %s failed: HTTP %s %s",
+                result.key,
+                result.status,
+                result.error or "",
+            )
+            return "failed"
+        if not result.resources:
+            return "empty"
+        try:
+            days: List[TrainingDay] = parse_week(result.resources)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Prefetching plan %s failed: %r", result.key, e)
+            return "failed"
+        if any(day.TgId == 0 for day in days):
+            return "unassigned"
+        plan: RenderedPlan = RenderedPlan(
+            text="".join(iter_week_blocks(days)), resources=result.resources
+        )
+        return "cached" if plan_cache.preload(result.key, plan) else "full"
+
+    clients: Dict[int, str] = dict(sessions.items())
+    keys: List[PlanKey] = [(chat_id, year, week) for chat_id in clients]
+    stats: Dict[str, int] = {"clients": len(clients)}
+    for result in plans.fetch(keys, clients, concurrency):
+        outcome: Outcome = prefetch(result)
+        stats[outcome] = stats.get(outcome, 0) + 1
+    logger.info("Prefetched plans for %s-W%s: %s", year, week, stats)
+    return stats
@@ -0,0 +1,59 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import Logger
+from threading import Lock
+from typing import Callable
+
+from .tracing import submit_traced
+from .typecheck import typechecked
+
+
+class ReportPipeline:
+    """
+    Bounded worker pool for client reports.
+
+    At most max_workers reports are processed at once and at most
+    max_pending more may wait for a worker. Beyond that submit() refuses
+    the report, so slow OpenAI completions can't pile up in memory or
+    hold dispatcher threads.
+    """
+
+    @typechecked
+    def __init__(self, max_workers: int, max_pending: int, logger: Logger) -> None:
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="report"
+        )
+        self._capacity: int = max_workers + max_pending
+        self._in_flight: int = 0
+        self._lock: Lock = Lock()
+        self._logger: Logger = logger
+
+    def submit(self, job: Callable[[], None]) -> bool:
+        with self._lock:
+            if self._in_flight >= self._capacity:
+                self._logger.warning("Report pipeline is full, rejecting report.")
+                return False
+            self._in_flight += 1
+        try:
+            future: Future = submit_traced(self._executor, "report_pipeline", job)
+        except RuntimeError:  # Pipeline is shutting down
+            self._release()
+            return False
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _on_done(self, future: Future) -> None:
+        self._release()
+        error = future.exception()
+        if error is not None:
+            self._logger.error("Report processing failed with error: %r", error)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
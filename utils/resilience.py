@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Literal, Optional
+
+import httpx
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+
+class BackendUnavailable(httpx.RequestError):
+    """Raised without calling the backend while an endpoint's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one backend endpoint.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self._failure_threshold: int = failure_threshold
+        self._reset_timeout: float = reset_timeout
+        self._lock: threading.Lock = threading.Lock()
+        self._failures: int = 0
+        self._opened_at: float = 0.0
+        self._state: BreakerState = "closed"
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self._reset_timeout:
+                    return False
+                self._state = "half_open"
+                return True  # The trial call
+            return False  # A trial call is already in flight
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self._failure_threshold:
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Recent latencies of one endpoint, to derive the hedging delay from."""
+
+    def __init__(self, size: int = 256, min_samples: int = 20) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._min_samples: int = min_samples
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """None until there are enough samples to tell."""
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (0-based)."""
+    return random.uniform(0.0, min(cap, base * 2**attempt))
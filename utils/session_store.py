@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from .typecheck import typechecked
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    api_key TEXT NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class SessionStore:
+    """
+    API tokens of authorized chats, keyed by chat id.
+
+    The memory tier is a bounded TTL + LRU cache; a lookup restarts the
+    chat's TTL, so only chats idle for `ttl` seconds are evicted. With a
+    `path`, every session is also written through to a local SQLite
+    database in WAL mode, so sessions survive restarts and an evicted chat
+    is loaded back on its next update. Without one, an evicted chat has to
+    authorize again.
+    """
+
+    @typechecked
+    def __init__(self, maxsize: int, ttl: float, path: str = "") -> None:
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock: Lock = Lock()
+        self._db_lock: Lock = Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory: str = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; every statement below is a single-row transaction
+            self._db = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(_SCHEMA)
+        self._hits: int = 0
+        self._misses: int = 0
+        self._loads: int = 0
+
+    def get_api_key(self, chat_id: int) -> Optional[str]:
+        with self._lock:
+            api_key: Optional[str] = self._cache.get(chat_id)
+            if api_key is not None:
+                self._hits += 1
+                self._cache[chat_id] = api_key
+                return api_key
+            self._misses += 1
+
+        # Checked under the lock: close() may run concurrently
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT api_key FROM sessions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._loads += 1
+            self._cache[chat_id] = row[0]
+        return row[0]
+
+    def set_api_key(self, chat_id: int, api_key: str) -> None:
+        with self._lock:
+            self._cache[chat_id] = api_key
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT INTO sessions (chat_id, api_key, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE "
+                "SET api_key = excluded.api_key, updated = excluded.updated",
+                (chat_id, api_key, time.time()),
+            )
+
+    def items(self) -> List[Tuple[int, str]]:
+        """(chat_id, api_key) of every known chat: all stored ones with a database."""
+        with self._lock:
+            sessions: Dict[int, str] = dict(self._cache.items())
+        with self._db_lock:
+            if self._db is not None:
+                rows = self._db.execute("SELECT chat_id, api_key FROM sessions")
+                for chat_id, api_key in rows:
+                    sessions.setdefault(chat_id, api_key)
+        return list(sessions.items())
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "loads": self._loads,
+                "size": len(self._cache),
+            }
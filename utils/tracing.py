@@ -0,0 +1,283 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import Logger
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .typecheck import typechecked
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    Shared state of the spans of one update. It is exported once the root
+    span and every span started under it have finished, so work handed to
+    other threads (background requests, queued sends) is part of the tree.
+    """
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "sampled",
+        "started",
+        "wall",
+        "lock",
+        "open",
+        "root",
+    )
+
+    def __init__(self, tracer: "Tracer", sampled: bool) -> None:
+        self.tracer: Tracer = tracer
+        self.trace_id: str = os.urandom(8).hex()
+        self.sampled: bool = sampled
+        self.started: float = time.perf_counter()
+        self.wall: float = time.time()
+        self.lock: threading.Lock = threading.Lock()
+        self.open: int = 0
+        self.root: Optional[Span] = None
+
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "children", "start", "end", "error")
+
+    def __init__(self, trace: Trace, name: str, attrs: Dict[str, Any]) -> None:
+        self.trace: Trace = trace
+        self.name: str = name
+        self.attrs: Dict[str, Any] = attrs
+        self.children: List[Span] = []
+        self.start: float = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        with trace.lock:
+            trace.open += 1
+
+    def child(self, name: str, **attrs: Any) -> "Span":
+        """Starts a span under this one; it has to be finished by the caller."""
+        span: Span = Span(self.trace, name, attrs)
+        with self.trace.lock:
+            self.children.append(span)
+        return span
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self, error: Optional[str] = None) -> None:
+        with self.trace.lock:
+            # Once only, even if two threads finish the span at the same time
+            if self.end is not None:
+                return
+            self.end = time.perf_counter()
+            if error is not None:
+                self.error = error
+            self.trace.open -= 1
+            done: bool = self.trace.open == 0
+        if done:
+            self.trace.tracer.export(self.trace)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if self.attrs:
+            span["attrs"] = self.attrs
+        if self.error is not None:
+            span["error"] = self.error
+        if self.children:
+            span["children"] = [child.to_dict(origin) for child in self.children]
+        return span
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """
+    Times the block as a child of the current span. Outside of a traced
+    update this does nothing and yields None.
+    """
+    parent: Optional[Span] = _current.get()
+    if parent is None:
+        yield None
+        return
+    child: Span = parent.child(name, **attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def traced(name: str, job: Callable[..., Any], **attrs: Any) -> Callable[..., Any]:
+    """
+    Wraps `job` to run under a new span of the current trace, for handing
+    work to another thread. The span starts now, so the time spent queued
+    is included; the returned callable has to be called exactly once.
+    """
+    return _traced(name, job, attrs)[0]
+
+
+def submit_traced(
+    executor: Executor, name: str, job: Callable[..., Any], *args: Any
+) -> Future:
+    """
+    executor.submit(traced(name, job), *args), except that the span is
+    finished right away if the executor refuses the job.
+    """
+    run, child = _traced(name, job, {})
+    try:
+        return executor.submit(run, *args)
+    except BaseException as e:
+        if child is not None:
+            child.finish(error=type(e).__name__)
+        raise
+
+
+def _traced(
+    name: str, job: Callable[..., Any], attrs: Dict[str, Any]
+) -> Tuple[Callable[..., Any], Optional[Span]]:
+    parent: Optional[Span] = _current.get()
+    if parent is None:
+        return job, None
+    child: Span = parent.child(name, **attrs)
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        token = _current.set(child)
+        try:
+            return job(*args, **kwargs)
+        except BaseException as e:
+            child.error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            child.finish()
+
+    return run, child
+
+
+class Tracer:
+    """
+    Traces updates as trees of timed spans.
+
+    A fraction `sample_rate` of traces, and every trace whose root span took
+    at least `slow_threshold` seconds, is written as one JSON line to
+    `path`, which is rotated like the log file. Only the root span counts:
+    work it left to other threads, such as rate-limited queued sends, is
+    recorded in its child spans but does not make an update slow. Slow
+    traces are also logged as a warning with the time of each top-level
+    step.
+    """
+
+    @typechecked
+    def __init__(
+        self,
+        logger: Logger,
+        path: str = "",
+        sample_rate: float = 0.0,
+        slow_threshold: float = 2.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 7,
+    ) -> None:
+        self._logger: Logger = logger
+        self._sample_rate: float = sample_rate
+        self._slow_threshold: float = slow_threshold
+        self._writer: Optional[Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        if path:
+            self._writer, self._listener = self._open_writer(
+                path, max_bytes, backup_count
+            )
+
+    @staticmethod
+    def _open_writer(path: str, max_bytes: int, backup_count: int):
+        # Same arrangement as the log file: a listener thread does the writing
+        directory: str = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        trace_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(trace_queue, handler)
+        writer: Logger = logging.getLogger(f"traces.{path}")
+        writer.propagate = False
+        writer.setLevel(logging.INFO)
+        writer.handlers = [logging.handlers.QueueHandler(trace_queue)]
+        listener.start()
+        atexit.register(listener.stop)
+        return writer, listener
+
+    @contextmanager
+    def trace(self, name: str, **attrs: Any) -> Iterator[Span]:
+        """Starts a new trace, with the block as its root span."""
+        trace: Trace = Trace(self, random.random() < self._sample_rate)
+        root: Span = Span(trace, name, attrs)
+        trace.root = root
+        token = _current.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            root.finish()
+
+    def export(self, trace: Trace) -> None:
+        """Called once every span of `trace` has finished."""
+        root: Optional[Span] = trace.root
+        if root is None:
+            return
+        duration: float = root.duration
+        slow: bool = duration >= self._slow_threshold
+        if slow:
+            steps: str = ", ".join(
+                f"{child.name} {child.duration * 1000:.0f} ms"
+                for child in root.children
+            )
+            self._logger.warning(
+                "Slow update %s (trace %s) took %.0f ms: %s",
+                root.name,
+                trace.trace_id,
+                duration * 1000,
+                steps or "no steps",
+            )
+        if self._writer is not None and (trace.sampled or slow):
+            record: Dict[str, Any] = {
+                "trace_id": trace.trace_id,
+                "time": trace.wall,
+                "duration_ms": round(duration * 1000, 3),
+                # Until the last span finished, e.g. the last queued send
+                "total_ms": round((time.perf_counter() - trace.started) * 1000, 3),
+                "slow": slow,
+                "root": root.to_dict(trace.started),
+            }
+            self._writer.info(json.dumps(record, default=str, ensure_ascii=False))
+
+    def close(self) -> None:
+        if self._listener is not None:
+            atexit.unregister(self._listener.stop)
+            self._listener.stop()
+            self._listener = None
@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+from pydantic import Field, TypeAdapter
+from typing_extensions import Annotated
+
+
+@dataclass(frozen=True, slots=True)
+class SwimmingEquipment:
+    Paddles: bool = False
+    KickBoard: bool = False
+    PullBuoy: bool = False
+    Snorkel: bool = False
+    Other: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class FitnessExercise:
+    Name: str
+    nSets: int
+    nReps: int
+    Time: Optional[float]
+    TimeUnits: str
+    Comments: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class SwimmingExercise:
+    Volume: Optional[float]
+    VolumeUnits: str
+    Time: Optional[float]
+    TimeUnits: str
+    Stroke: str
+    Speed: Union[int, float]  # Whole speeds render without ".0"
+    Legs: bool
+    Arms: bool
+    Equipment: SwimmingEquipment = field(default_factory=SwimmingEquipment)
+    Comments: str = ""
+
+
+# The flag of the other training type is pinned to False, which replaces the
+# per-day inGym / inSwimmingPool validators with a check in the week schema.
+@dataclass(frozen=True, slots=True)
+class FitnessDay:
+    trainingType: Literal["fitness"]
+    inGym: bool
+    inSwimmingPool: Literal[False]
+    TgId: int
+    Year: int
+    Week: int
+    Day: int
+    Exercises: Tuple[FitnessExercise, ...]
+    TotalNumberExercises: int
+    TotalTime: float
+    TotalVolume: float
+    TotalVolumeUnits: str
+
+
+@dataclass(frozen=True, slots=True)
+class SwimmingDay:
+    trainingType: Literal["swimming"]
+    inGym: Literal[False]
+    inSwimmingPool: bool
+    TgId: int
+    Year: int
+    Week: int
+    Day: int
+    Exercises: Tuple[SwimmingExercise, ...]
+    TotalNumberExercises: int
+    TotalTime: float
+    TotalVolume: float
+    TotalVolumeUnits: str
+
+
+TrainingDay = Annotated[
+    Union[FitnessDay, SwimmingDay], Field(discriminator="trainingType")
+]
+
+
+@lru_cache(maxsize=None)
+def _week_adapter() -> TypeAdapter:
+    # Building the validator takes a few milliseconds, so it is left to the
+    # first plan instead of every process start
+    return TypeAdapter(List[TrainingDay])
+
+
+def parse_week(resources: List[Dict[str, Any]]) -> List[TrainingDay]:
+    """
+    Validates the Resources of a plan response in one pass. Unknown keys are
+    dropped; raises pydantic.ValidationError on malformed days.
+    """
+    return _week_adapter().validate_python(resources)
@@ -0,0 +1,39 @@
+import os
+from functools import lru_cache
+from typing import Tuple, TypeVar, get_args
+
+from .consts import Config, load_env
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=None)
+def runtime_profile() -> str:
+    """
+    RUNTIME_PROFILE from the environment or .env, read once on first use.
+    Raises ValueError for a value Config would not accept, rather than
+    silently running another profile.
+    """
+    load_env()
+    field = Config.model_fields["RUNTIME_PROFILE"]
+    profiles: Tuple[str, ...] = get_args(field.annotation)
+    profile: str = os.environ.get("RUNTIME_PROFILE", field.default)
+    if profile not in profiles:
+        raise ValueError(
+            f"Unknown RUNTIME_PROFILE {profile!r}, expected one of {profiles}"
+        )
+    return profile
+
+
+def typechecked(target: T) -> T:
+    """
+    Drop-in replacement for typeguard.typechecked. The profile is read once,
+    when the first function is decorated, so in production the decorated
+    functions are left untouched and cost nothing per call, and typeguard
+    itself is never imported.
+    """
+    if runtime_profile() == "production":
+        return target
+    from typeguard import typechecked as _typechecked
+
+    return _typechecked(target)
@@ -1,13 +1,23 @@
 import json
 import os
 
-import requests
-from requests import Response
-from pydantic import BaseModel, validator
-from typing import Dict, Any, Optional, List, Literal, Union, Final
-from typeguard import typechecked
+import httpx
+from pydantic import BaseModel
+from typing import Dict, Any, Iterator, Optional, List, Literal, Sequence, Union, Final
+from .typecheck import typechecked
 from logging import Logger
 from .consts import Config
+from .backend_client import BackendClient
+from .access_cache import AccessCache
+from .metrics import Metrics
+from .tracing import span
+from .training import (
+    FitnessExercise,
+    SwimmingExercise,
+    SwimmingEquipment,
+    TrainingDay,
+    parse_week,
+)
 from datetime import date
 from .prompts import Prompts
 
@@ -16,29 +26,6 @@ CoordinationType = Union[
 ]
 
 
-class CommonTrainingInfo(BaseModel):
-    trainingType: Union[Literal["fitness"], Literal["swimming"]]
-    inGym: bool
-    inSwimmingPool: bool
-    Year: int
-    Week: int
-    Day: int
-
-    @validator("inGym")
-    def validate_in_gym(cls, in_gym, values):
-        if in_gym and values.get("trainingType") != "fitness":
-            raise ValueError("inGym can only be True if trainingType is 'fitness'")
-        return in_gym
-
-    @validator("inSwimmingPool")
-    def validate_in_swimming_pool(cls, in_swimming_pool, values):
-        if in_swimming_pool and values.get("trainingType") != "swimming":
-            raise ValueError(
-                "inSwimmingPool can only be True if trainingType is 'swimming'"
-            )
-        return in_swimming_pool
-
-
 class Report(BaseModel):
     isInjured: bool = False
     allDaysDone: bool = True
@@ -82,41 +69,53 @@ def load_messages(message_path: str, logger: Logger) -> Dict[str, Any]:
     try:
         with open(message_path, "r", encoding="utf-8") as file:
             messages: Dict[str, Any] = json.load(file)
-            logger.info(f"Successfully loaded messages from {message_path}")
+            logger.info("Successfully loaded messages from %s", message_path)
         return messages
     except Exception as e:
-        logger.error(f"Failed to load messages from {message_path} due to error: {e}")
+        logger.error(
+            "Failed to load messages from %s due to error: %s", message_path, e
+        )
         return {}
 
 
 @typechecked
 def convert_json_to_human_readable(resources: List[Dict[str, Any]]) -> str:
-    week_output: List[str] = []
     if not resources:
         raise ValueError("Нет тренировок для форматирования")
-    for data in resources:
-        common_info: CommonTrainingInfo = CommonTrainingInfo(**data)
+    return render_week(parse_week(resources))
+
+
+@typechecked
+def render_week(days: Sequence[TrainingDay]) -> str:
+    return "".join(iter_week_blocks(days))
+
+
+@typechecked
+def iter_week_blocks(days: Sequence[TrainingDay]) -> Iterator[str]:
+    """
+    Renders the week lazily, one day at a time, followed by the week summary.
+    The blocks concatenate into the full plan text.
+    """
+    if not days:
+        raise ValueError("Нет тренировок для форматирования")
+    for day in days:
         day_output: List[str] = []
         # Форматируем заголовок
-        title: str = format_title(common_info)
+        title: str = format_title(day)
         day_output.append(title)
         day_output.append("Твои упражнения на сегодня:\n")
 
         converted: str
-        if common_info.trainingType == "fitness":
-            converted = convert_fitness_exercises(data["Exercises"])
-        elif common_info.trainingType == "swimming":
-            converted = convert_swimming_exercises(data["Exercises"])
+        if day.trainingType == "fitness":
+            converted = convert_fitness_exercises(day.Exercises)
         else:
-            raise ValueError(
-                "This training type is not supported! Supported: ['fitness', 'swimming']"
-            )
+            converted = convert_swimming_exercises(day.Exercises)
 
         day_output.append(converted)
 
         # Извлекаем итоговые статистики
-        total_exercises = int(data["TotalNumberExercises"])
-        total_day_time = int(data["TotalTime"] / 60)  # Конвертируем секунды в минуты
+        total_exercises = day.TotalNumberExercises
+        total_day_time = int(day.TotalTime / 60)  # Конвертируем секунды в минуты
         day_output.append(
             f"\n🔥 Всего упражнений сегодня: {total_exercises} - ты молодец!"
         )
@@ -124,78 +123,63 @@ def convert_json_to_human_readable(resources: List[Dict[str, Any]]) -> str:
             day_output.append(
                 f"⏱ Общее время тренировки: примерно {total_day_time} мин - замечательно! \n"
             )
-        total_day_volume: int = int(data["TotalVolume"])
+        total_day_volume: int = int(day.TotalVolume)
         if total_day_volume != 0:
             day_output.append(
-                f"⏱Объем тренировки: {total_day_volume} {data['TotalVolumeUnits']} - круто! \n"
+                f"⏱Объем тренировки: {total_day_volume} {day.TotalVolumeUnits} - круто! \n"
             )
-        week_output.append("\n".join(day_output))
-        week_output.append("\n" + separator())
+        yield "\n".join(day_output) + "\n\n" + separator() + "\n"
 
-    total_trainings_week: str = (
-        f" 🔥 На неделе {common_info.Week} всего {len(resources)} трен."
-    )
-    week_output.append(total_trainings_week)
-    return "\n".join(week_output)
+    yield f" 🔥 На неделе {day.Week} всего {len(days)} трен."
 
 
 @typechecked
-def convert_fitness_exercises(exercises: List[Dict[str, Any]]) -> str:
+def convert_fitness_exercises(exercises: Sequence[FitnessExercise]) -> str:
     converted: List[str] = []
     for index, exercise in enumerate(exercises, 1):
-        name = exercise["Name"]
-        n_sets = int(exercise["nSets"])
-        n_reps = int(exercise["nReps"])
-        time = exercise["Time"]
-        time_units = "мин" if exercise["TimeUnits"] == "мин" else "сек"
-        comments = exercise["Comments"]
-
-        if time and time != 0.0:
-            time = int(time)
+        time_units = "мин" if exercise.TimeUnits == "мин" else "сек"
+
+        if exercise.Time:
             exercise_info = (
-                f"{index}. {name} - {n_sets} серии по {time} {time_units}. 🌟"
+                f"{index}. {exercise.Name} - {exercise.nSets} серии по "
+                f"{int(exercise.Time)} {time_units}. 🌟"
             )
         else:
             exercise_info = (
-                f"{index}. {name} - {n_sets} серии по {n_reps} повторений. ✨"
+                f"{index}. {exercise.Name} - {exercise.nSets} серии по "
+                f"{exercise.nReps} повторений. ✨"
             )
 
-        if comments:
-            exercise_info += f"\n💬 Комментарии: {comments}\n"
+        if exercise.Comments:
+            exercise_info += f"\n💬 Комментарии: {exercise.Comments}\n"
 
         converted.append(exercise_info)
     return "\n".join(converted)
 
 
 @typechecked
-def convert_swimming_exercises(exercises: List[Dict[str, Any]]) -> str:
+def convert_swimming_exercises(exercises: Sequence[SwimmingExercise]) -> str:
     max_speed: int = 6
     converted: List[str] = []
 
     # iterate over each exercise
     for i, exercise in enumerate(exercises, start=1):
-        volume = exercise["Volume"]
-        time = exercise["Time"]
-        volume_units = exercise["VolumeUnits"]
-        time_units = exercise["TimeUnits"]
-        stroke = exercise["Stroke"]
-        speed = exercise["Speed"]
-        comments = exercise["Comments"].capitalize()
+        comments = exercise.Comments.capitalize()
 
         # use Volume if it's not None, otherwise use Time
         volume_or_time = (
-            f"{volume:.0f}{adjust_units(volume_units)}"
-            if is_volume_provided(volume)
-            else f"{time:.0f}{adjust_units(time_units)}"
+            f"{exercise.Volume:.0f}{adjust_units(exercise.VolumeUnits)}"
+            if is_volume_provided(exercise.Volume)
+            else f"{exercise.Time:.0f}{adjust_units(exercise.TimeUnits)}"
         )
 
         coordination: CoordinationType = handle_coordination(exercise)
-        equipment: str = handle_equipment(exercise)
+        equipment: str = handle_equipment(exercise.Equipment)
 
         exercise_info = (
-            f"{i}. {volume_or_time} {stroke} "
+            f"{i}. {volume_or_time} {exercise.Stroke} "
             f"{coordination}, {equipment}"
-            f" скорость {speed}/{max_speed}"
+            f" скорость {exercise.Speed}/{max_speed}"
         )
         if comments:
             exercise_info += f"\n💬 Комментарии: {comments}\n"
@@ -206,33 +190,33 @@ def convert_swimming_exercises(exercises: List[Dict[str, Any]]) -> str:
 
 
 @typechecked
-def handle_coordination(exercise: Dict[str, Any]) -> CoordinationType:
-    if exercise["Arms"] and exercise["Legs"]:
+def handle_coordination(exercise: SwimmingExercise) -> CoordinationType:
+    if exercise.Arms and exercise.Legs:
         return "в/к"
-    elif not exercise["Arms"] and not exercise["Legs"]:
+    elif not exercise.Arms and not exercise.Legs:
         return "упр."
-    elif exercise["Arms"] and not exercise["Legs"]:
+    elif exercise.Arms and not exercise.Legs:
         return "н/р"
     else:
         return "н/н"
 
 
 @typechecked
-def handle_equipment(exercise: Dict[str, Any]) -> str:
-    equipment: str = ""
+def handle_equipment(equipment: SwimmingEquipment) -> str:
+    described: str = ""
     ###MAIN EQUIPMENT####
-    if exercise["Equipment"]["KickBoard"]:
-        equipment: str = equipment + "с доской"
-    elif exercise["Equipment"]["PullBuoy"]:
-        equipment: str = equipment + "с колобашкой"
+    if equipment.KickBoard:
+        described += "с доской"
+    elif equipment.PullBuoy:
+        described += "с колобашкой"
 
     ###ADDITIONAL EQUIPMENT####
-    if exercise["Equipment"]["Paddles"]:
-        equipment: str = equipment + "с лопатками"
-    if exercise["Equipment"]["Snorkel"]:
-        equipment: str = equipment + "с трубкой"
+    if equipment.Paddles:
+        described += "с лопатками"
+    if equipment.Snorkel:
+        described += "с трубкой"
 
-    return equipment
+    return described
 
 
 @typechecked
@@ -247,7 +231,7 @@ def handle_total_duration(total_week_time: int) -> str:
 
 
 @typechecked
-def is_volume_provided(volume: float) -> bool:
+def is_volume_provided(volume: Optional[float]) -> bool:
     return (volume is not None) and (volume != 0)
 
 
@@ -258,19 +242,17 @@ def adjust_units(unit: str) -> str:
 
 
 @typechecked
-def format_title(common_info: CommonTrainingInfo, separator: str = "") -> str:
+def format_title(day: TrainingDay, separator: str = "") -> str:
     title: str
-    if common_info.trainingType == "swimming" and common_info.inSwimmingPool:
-        title = (
-            f"🏊‍ День {common_info.Day}, Неделя {common_info.Week} (в бассейне) 🏊‍️\n"
-        )
-    elif common_info.trainingType == "swimming" and not common_info.inSwimmingPool:
-        title = f"🌊 День {common_info.Day}, Неделя {common_info.Week} (на открытой воде) 🌊\n"
-    elif common_info.trainingType == "fitness" and common_info.inGym:
-        title = f"🏋️ День {common_info.Day}, Неделя {common_info.Week} (в тренажерном зале) 🏋️\n"
+    if day.trainingType == "swimming" and day.inSwimmingPool:
+        title = f"🏊‍ День {day.Day}, Неделя {day.Week} (в бассейне) 🏊‍️\n"
+    elif day.trainingType == "swimming" and not day.inSwimmingPool:
+        title = f"🌊 День {day.Day}, Неделя {day.Week} (на открытой воде) 🌊\n"
+    elif day.trainingType == "fitness" and day.inGym:
+        title = f"🏋️ День {day.Day}, Неделя {day.Week} (в тренажерном зале) 🏋️\n"
 
-    elif common_info.trainingType == "fitness" and not common_info.inGym:
-        title = f"🏡 День {common_info.Day}, Неделя {common_info.Week} (дома или на улице) 🏡\n"
+    elif day.trainingType == "fitness" and not day.inGym:
+        title = f"🏡 День {day.Day}, Неделя {day.Week} (дома или на улице) 🏡\n"
 
     else:
         raise NotImplementedError
@@ -309,7 +291,11 @@ def fetch_current_year() -> int:
 
 @typechecked
 def format_report_with_gpt(
-    cfg: Config, prompts: Prompts, metadata: MetaData, client_report: str
+    cfg: Config,
+    prompts: Prompts,
+    metadata: MetaData,
+    client_report: str,
+    metrics: Optional[Metrics] = None,
 ) -> ReportWithMetadata:
     messages: List[Dict[str, str]] = [
         {"role": "system", "content": prompts.System},
@@ -322,7 +308,24 @@ def format_report_with_gpt(
     }
     data: Dict[str, Any] = {"model": cfg.MODEL_TYPE, "messages": messages}
 
-    response: Response = requests.post(cfg.OPENAI_API_URL, json=data, headers=headers)
+    response: httpx.Response
+    with span("openai", model=cfg.MODEL_TYPE):
+        if metrics is None:
+            response = httpx.post(
+                cfg.OPENAI_API_URL,
+                json=data,
+                headers=headers,
+                timeout=cfg.OPENAI_TIMEOUT,
+            )
+        else:
+            with metrics.track("bot_openai", model=cfg.MODEL_TYPE) as outcome:
+                response = httpx.post(
+                    cfg.OPENAI_API_URL,
+                    json=data,
+                    headers=headers,
+                    timeout=cfg.OPENAI_TIMEOUT,
+                )
+                outcome.status = str(response.status_code)
     response.raise_for_status()
     json_response: Dict[str, Any] = response.json()
 
@@ -340,16 +343,30 @@ def format_report_with_gpt(
 
 
 @typechecked
-def has_access(cfg: Config, api_token: str) -> bool:
+def has_access(
+    cfg: Config,
+    backend: BackendClient,
+    api_token: str,
+    access_cache: Optional[AccessCache] = None,
+) -> bool:
+    if access_cache is not None:
+        cached: Optional[bool] = access_cache.get(api_token)
+        if cached is not None:
+            return cached
+
     params: Dict[str, str] = {"api_key": api_token}
-    get_request: Response = requests.get(
-        f"{cfg.BACKEND_API}/{cfg.VERSION}/{cfg.ALLOWED_PERSONAL_TRAINING}",
+    get_request: httpx.Response = backend.get(
+        cfg.ALLOWED_PERSONAL_TRAINING,
         params=params,
     )
     if get_request.status_code != 403:
         get_request.raise_for_status()
     else:
+        if access_cache is not None:
+            access_cache.invalidate(api_token)
         return False
     result: Dict[str, Any] = get_request.json()
     is_allowed: bool = result["Resources"][0]["Allowed"]
+    if access_cache is not None:
+        access_cache.set(api_token, is_allowed)
     return is_allowed